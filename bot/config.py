@@ -5,14 +5,126 @@ class Settings(BaseSettings):
     ADMIN_IDS: list[int]
     MIN_TEXT_LENGTH: int
     
+    # .keras/.h5 - TensorFlow, .tflite - квантованная модель (python -m predictor.quantize),
+    # .npz - веса для NumPy без TensorFlow (python -m predictor.numpy_runtime)
     ML_MODEL_PATH: str = "models/complete_model.keras"
-    TOKENIZER_PATH: str = "tokenizers/tokenizer.pkl"
+    TOKENIZER_PATH: str = "tokenizers/vocab.npz"
+
+    # Реестр моделей: дополнительные модели рядом с основной, имя -> путь,
+    # например {"v2": "models/v2.keras"}; словарь - TOKENIZER_PATH или свой
+    MODEL_VARIANTS: dict[str, str] = {}
+    MODEL_VARIANT_TOKENIZERS: dict[str, str] = {}
+    # Доли пользователей A/B по моделям (остаток - основная), например {"v2": 0.1}
+    MODEL_TRAFFIC: dict[str, float] = {}
+    # Модели, которые в фоне считают те же пакеты для сравнения (ответ не меняют)
+    SHADOW_MODELS: list[str] = []
+    # Горячая замена основной модели (/reload или изменение файлов):
+    # лимит RSS бота вместе с воркерами, пока в памяти обе модели (0 - без лимита),
+    # ожидание запросов на прежней модели, с, и интервал опроса файлов, с (0 - не следить)
+    MODEL_RELOAD_MAX_RSS_MB: float = 0.0
+    MODEL_RELOAD_DRAIN_TIMEOUT: float = 30.0
+    MODEL_WATCH_INTERVAL: float = 0.0
     
     VIRAL_THRESHOLD: float = 0.5
     MIN_TEXT_LENGTH: int = 10
     MAX_TEXT_LENGTH: int = 5000
     
     ENABLE_EMOJIS: bool = True
+    # Результат анализа и "Что дальше?" одним сообщением с клавиатурой меню
+    # вместо inline-кнопок после анализа (вдвое меньше запросов к API)
+    MERGE_FOLLOWUP_MESSAGE: bool = True
+
+    # Микро-батчинг запросов к модели
+    BATCHING_ENABLED: bool = True
+    BATCH_MAX_SIZE: int = 32
+    BATCH_MAX_WAIT_MS: float = 10.0
+    BATCH_QUEUE_SIZE: int = 1000
+
+    # Исполнитель инференса: "thread" (в процессе бота) или "process" (пул процессов)
+    INFERENCE_EXECUTOR: str = "thread"
+    INFERENCE_WORKERS: int = 0  # 0 - по числу ядер
+    TF_INTRA_OP_THREADS: int = 0  # 0 - по умолчанию TensorFlow
+    TF_INTER_OP_THREADS: int = 0
+
+    # Сколько секунд запрос ждет фоновой загрузки модели перед ответом "прогревается"
+    MODEL_WARMUP_WAIT: float = 15.0
+
+    # Кэш предсказаний по нормализованному тексту
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_TTL_SECONDS: float = 3600.0
+    # Кэш по входу модели (массиву id после паддинга), 0 - отключен
+    SEQUENCE_CACHE_MAX_ENTRIES: int = 50000
+    # Корзины паддинга по длине текста в токенах, пустой список - всегда 200;
+    # включаются, только если модель дает на них те же оценки
+    PADDING_BUCKETS: list[int] = [32, 64, 128, 200]
+
+    # Режим /explain: вклад слов в оценку (окклюзия, все варианты текста одним пакетом)
+    EXPLAIN_MAX_PERTURBATIONS: int = 200
+    # Ограничение времени модели на разбор; при превышении слова объединяются во фрагменты
+    EXPLAIN_BUDGET_MS: float = 300.0
+    EXPLAIN_CACHE_MAX_ENTRIES: int = 1000
+    # Сколько слов показывать в каждую сторону (повышают / понижают)
+    EXPLAIN_TOP_WORDS: int = 3
+
+    # Режим /optimize: поиск правок текста (лучевой поиск, варианты считаются пакетами)
+    OPTIMIZE_TOP_K: int = 3
+    # Ограничение времени поиска вместе с разбором вклада слов
+    OPTIMIZE_BUDGET_MS: float = 1000.0
+    OPTIMIZE_BEAM_WIDTH: int = 4
+    OPTIMIZE_CACHE_MAX_ENTRIES: int = 1000
+
+    # Хранилище оценок на диске (SQLite, WAL), переживает перезапуски
+    SCORE_STORE_ENABLED: bool = True
+    SCORE_STORE_PATH: str = "data/scores.sqlite3"
+    SCORE_STORE_FLUSH_INTERVAL: float = 1.0
+    SCORE_STORE_BATCH_SIZE: int = 256
+    SCORE_STORE_MAX_AGE_DAYS: float = 30.0
+    SCORE_STORE_COMPACT_INTERVAL_HOURS: float = 6.0
+    # Оценок в очереди на запись, пока диск недоступен; сверх этого они теряются
+    SCORE_STORE_MAX_PENDING: int = 10000
+
+    # Хранилище состояний FSM: "sqlite" - переживает перезапуски, "memory" - MemoryStorage aiogram
+    FSM_STORAGE: str = "sqlite"
+    FSM_SQLITE_PATH: str = "data/fsm.sqlite3"
+    # Брошенный сценарий (например, /predict без текста) сбрасывается через столько часов
+    FSM_STATE_TTL_HOURS: float = 24.0
+    FSM_FLUSH_INTERVAL: float = 1.0
+
+    # Ограничение частоты: токен-бакет (токенов в секунду и размер пачки)
+    THROTTLE_RATE: float = 1.0
+    THROTTLE_BURST: int = 3
+    THROTTLE_INFERENCE_RATE: float = 0.2
+    THROTTLE_INFERENCE_BURST: int = 2
+    THROTTLE_MAX_USERS: int = 100000
+    # "memory" - в процессе, "sqlite" - общий файл для нескольких процессов
+    THROTTLE_BACKEND: str = "memory"
+    THROTTLE_SQLITE_PATH: str = "data/throttle.sqlite3"
+
+    # Контроль допуска к инференсу и сброс нагрузки
+    ADMISSION_MAX_CONCURRENT: int = 64
+    ADMISSION_MAX_QUEUE: int = 256
+    # Сколько секунд с момента отправки сообщения пользователь готов ждать ответа
+    ADMISSION_MAX_WAIT: float = 30.0
+
+    # Эндпоинт метрик Prometheus (/metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+
+    # Режим получения апдейтов: "polling" или "webhook"
+    RUN_MODE: str = "polling"
+    # Публичный адрес вебхука; пусто - не регистрировать (ставится при деплое)
+    WEBHOOK_URL: str = ""
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str = ""
+    # Сколько апдейтов обрабатывается одновременно, остальные ждут у Telegram
+    WEBHOOK_MAX_CONCURRENT: int = 256
+    # Сколько секунд при остановке ждать начатые обработчики
+    WEBHOOK_DRAIN_TIMEOUT: float = 30.0
+
     class Config:
         env_file=".env"
 
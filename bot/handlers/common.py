@@ -61,6 +61,8 @@ async def cmd_help(message: types.Message):
 🔧 <b>Команды:</b>
 /start - Главное меню
 /predict - Анализ текста
+/explain - Какие слова влияют на оценку
+/optimize - Как поднять оценку текста
 /stats - Статус модели
 /about - О боте
 
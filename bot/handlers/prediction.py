@@ -1,13 +1,21 @@
 # bot/handlers/prediction.py
 from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from html import escape
 import logging
+import math
+import time
 
-from bot.services.predictor import PredictorService
+from bot.services.predictor import PredictorService, LOAD_PHASES, REQUESTS
+from bot.services.cache import PredictionCache
+from bot.services.score_store import ScoreStore
+from bot.services.admission import AdmissionController
 from bot.config import settings
+from bot.middlewares.throttling import THROTTLED
+from predictor.metrics import STAGE_SECONDS
 
 from bot.keyboards.inline import get_analysis_keyboard
 from bot.keyboards.main_menu import main_keyboard
@@ -19,11 +27,63 @@ logger = logging.getLogger(__name__)
 
 predictor = PredictorService(
     model_path=settings.ML_MODEL_PATH,
-    tokenizer_path=settings.TOKENIZER_PATH
+    tokenizer_path=settings.TOKENIZER_PATH,
+    batching=settings.BATCHING_ENABLED,
+    batch_max_size=settings.BATCH_MAX_SIZE,
+    batch_max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+    batch_queue_size=settings.BATCH_QUEUE_SIZE,
+    executor=settings.INFERENCE_EXECUTOR,
+    workers=settings.INFERENCE_WORKERS,
+    intra_op_threads=settings.TF_INTRA_OP_THREADS,
+    inter_op_threads=settings.TF_INTER_OP_THREADS,
+    warmup_wait=settings.MODEL_WARMUP_WAIT,
+    cache=PredictionCache(
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        ttl=settings.CACHE_TTL_SECONDS
+    ) if settings.CACHE_ENABLED else None,
+    sequence_cache_size=settings.SEQUENCE_CACHE_MAX_ENTRIES,
+    padding_buckets=settings.PADDING_BUCKETS,
+    store=ScoreStore(
+        settings.SCORE_STORE_PATH,
+        flush_interval=settings.SCORE_STORE_FLUSH_INTERVAL,
+        batch_size=settings.SCORE_STORE_BATCH_SIZE,
+        max_age=settings.SCORE_STORE_MAX_AGE_DAYS * 86400,
+        compact_interval=settings.SCORE_STORE_COMPACT_INTERVAL_HOURS * 3600,
+        max_pending=settings.SCORE_STORE_MAX_PENDING
+    ) if settings.SCORE_STORE_ENABLED else None,
+    admission=AdmissionController(
+        max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+        max_queue=settings.ADMISSION_MAX_QUEUE
+    ),
+    explain_cache=PredictionCache(
+        max_entries=settings.EXPLAIN_CACHE_MAX_ENTRIES,
+        ttl=settings.CACHE_TTL_SECONDS
+    ) if settings.CACHE_ENABLED else None,
+    explain_max_perturbations=settings.EXPLAIN_MAX_PERTURBATIONS,
+    explain_budget_ms=settings.EXPLAIN_BUDGET_MS,
+    optimize_cache=PredictionCache(
+        max_entries=settings.OPTIMIZE_CACHE_MAX_ENTRIES,
+        ttl=settings.CACHE_TTL_SECONDS
+    ) if settings.CACHE_ENABLED else None,
+    optimize_top_k=settings.OPTIMIZE_TOP_K,
+    optimize_budget_ms=settings.OPTIMIZE_BUDGET_MS,
+    optimize_beam_width=settings.OPTIMIZE_BEAM_WIDTH,
+    optimize_min_length=settings.MIN_TEXT_LENGTH,
+    model_variants={
+        name: (path, settings.MODEL_VARIANT_TOKENIZERS.get(name, settings.TOKENIZER_PATH))
+        for name, path in settings.MODEL_VARIANTS.items()
+    },
+    model_traffic=settings.MODEL_TRAFFIC,
+    shadow_models=settings.SHADOW_MODELS,
+    reload_max_rss_mb=settings.MODEL_RELOAD_MAX_RSS_MB,
+    reload_drain_timeout=settings.MODEL_RELOAD_DRAIN_TIMEOUT,
+    watch_interval=settings.MODEL_WATCH_INTERVAL
 )
 
 class PredictionState(StatesGroup):
     waiting_for_text = State()
+    waiting_for_explanation = State()
+    waiting_for_optimization = State()
 
 @router.message(Command("predict"))
 async def cmd_predict(message: Message, state: FSMContext):
@@ -36,10 +96,40 @@ async def cmd_predict(message: Message, state: FSMContext):
         "• Длину текста\n"
         "• Даем рекомендации",
         parse_mode="HTML",
-        recply_markup=predict_keyboard()
+        reply_markup=predict_keyboard()
     )
     await state.set_state(PredictionState.waiting_for_text)
 
+@router.message(Command("explain"))
+async def cmd_explain(message: Message, state: FSMContext):
+    """Обработчик команды /explain: анализ с разбором вклада слов"""
+    await message.answer(
+        "🔍 <b>Отправьте текст, и я покажу, какие слова влияют на оценку</b>\n\n"
+        f"📏 <i>Оптимальная длина: {settings.MIN_TEXT_LENGTH}-{settings.MAX_TEXT_LENGTH} символов</i>\n\n"
+        "💡 <i>Что покажем:</i>\n"
+        "• Вероятность стать виральным\n"
+        "• Слова, которые повышают и понижают оценку\n"
+        "• Рекомендации по их замене",
+        parse_mode="HTML",
+        reply_markup=predict_keyboard()
+    )
+    await state.set_state(PredictionState.waiting_for_explanation)
+
+@router.message(Command("optimize"))
+async def cmd_optimize(message: Message, state: FSMContext):
+    """Обработчик команды /optimize: поиск правок, повышающих оценку"""
+    await message.answer(
+        "🛠 <b>Отправьте текст, и я подберу правки, которые повышают оценку</b>\n\n"
+        f"📏 <i>Оптимальная длина: {settings.MIN_TEXT_LENGTH}-{settings.MAX_TEXT_LENGTH} символов</i>\n\n"
+        "💡 <i>Что попробуем:</i>\n"
+        "• Убрать или заменить слова, понижающие оценку\n"
+        "• Сократить текст или переставить предложения\n"
+        f"• Покажем до {settings.OPTIMIZE_TOP_K} лучших вариантов",
+        parse_mode="HTML",
+        reply_markup=predict_keyboard()
+    )
+    await state.set_state(PredictionState.waiting_for_optimization)
+
 @router.message(F.text == "🔙 Назад в меню")
 async def handle_back_to_menu(message: Message, state: FSMContext):
     """Обработка кнопки 'Назад в меню'"""
@@ -47,12 +137,20 @@ async def handle_back_to_menu(message: Message, state: FSMContext):
     from bot.handlers.common import cmd_start
     await cmd_start(message)
 
-@router.message(PredictionState.waiting_for_text)
+@router.message(
+    StateFilter(
+        PredictionState.waiting_for_text,
+        PredictionState.waiting_for_explanation,
+        PredictionState.waiting_for_optimization
+    ),
+    flags={"rate_limit": "inference"}
+)
 async def process_text(message: Message, state: FSMContext):
-    """Обработка текста для предсказания"""
+    """Обработка текста для предсказания (с разбором после /explain и правками после /optimize)"""
     await message.bot.send_chat_action(message.chat.id, "typing")
     
     text = message.text or ""
+    mode = ANALYSIS_MODES.get(await state.get_state())
     text_length = len(text)
 
     if text == "🔙 Назад в меню":
@@ -74,26 +172,72 @@ async def process_text(message: Message, state: FSMContext):
         return
     
     try:
-        result = await predictor.predict(text, settings.VIRAL_THRESHOLD)
+        deadline = message.date.timestamp() + settings.ADMISSION_MAX_WAIT
+        if mode:
+            result = await getattr(predictor, mode)(text, settings.VIRAL_THRESHOLD, deadline=deadline)
+        else:
+            result = await predictor.predict(
+                text, settings.VIRAL_THRESHOLD, deadline=deadline, user_id=message.from_user.id
+            )
         
-        response = format_prediction_response(result, text)
+        if result.get("overloaded"):
+            await message.answer(
+                "🚦 <b>Сейчас слишком много запросов</b>\n\n"
+                f"Отправьте текст еще раз через {result['retry_after']:.0f} с.",
+                parse_mode="HTML",
+                reply_markup=predict_keyboard()
+            )
+            return
         
-        await message.answer(
-            response, 
-            parse_mode="HTML",
-            reply_markup=get_analysis_keyboard()  # Inline-кнопки под сообщением
-        )
+        if result.get("expired"):
+            await message.answer(
+                "⌛ <b>Не успели обработать текст вовремя</b>\n\n"
+                "Бот был перегружен. Отправьте текст еще раз.",
+                parse_mode="HTML",
+                reply_markup=predict_keyboard()
+            )
+            return
         
-        # Дополнительное сообщение с кнопками menu
-        await message.answer(
-            "🎯 <b>Что дальше?</b>\n\n"
-            "Вы можете:\n"
-            "• Отправить новый текст для анализа\n"
-            "• Вернуться в главное меню\n"
-            "• Посмотреть другие примеры",
-            parse_mode="HTML",
-            reply_markup=main_keyboard()  #Reply-клавиатура
-        )
+        if result.get("warming_up"):
+            # Состояние не сбрасываем: текст можно просто отправить еще раз
+            await message.answer(
+                "⏳ <b>Модель еще загружается</b>\n\n"
+                "Бот только что перезапустился. Отправьте текст еще раз через несколько секунд.",
+                parse_mode="HTML",
+                reply_markup=predict_keyboard()
+            )
+            return
+        
+        response = format_prediction_response(result, text)
+        if mode == "explain":
+            response += format_explanation(result)
+        elif mode == "optimize":
+            response += format_optimization(result)
+        
+        with STAGE_SECONDS.time(stage="telegram_send"):
+            if settings.MERGE_FOLLOWUP_MESSAGE:
+                # Один запрос к API вместо двух. В это состояние попадают только
+                # через ответы с predict_keyboard, а состояние ниже сбрасывается,
+                # поэтому сообщение возвращает клавиатуру меню; ее кнопки
+                # заменяют inline-кнопки после анализа (у сообщения одна разметка)
+                await message.answer(
+                    f"{response}\n{FOLLOWUP_TEXT}",
+                    parse_mode="HTML",
+                    reply_markup=main_keyboard()
+                )
+            else:
+                await message.answer(
+                    response, 
+                    parse_mode="HTML",
+                    reply_markup=get_analysis_keyboard()  # Inline-кнопки под сообщением
+                )
+                
+                # Дополнительное сообщение с кнопками menu
+                await message.answer(
+                    FOLLOWUP_TEXT,
+                    parse_mode="HTML",
+                    reply_markup=main_keyboard()  #Reply-клавиатура
+                )
 
         # Логируем успешное предсказание
         logger.info(f"Предсказание для пользователя {message.from_user.id}: "
@@ -111,82 +255,334 @@ async def process_text(message: Message, state: FSMContext):
     
     await state.clear()
 
+def create_progress_bar(percentage: float, length: int = 10) -> str:
+    """Создание текстового прогресс-бара"""
+    filled = int(percentage * length)
+    empty = length - filled
+    bar = "█" * filled + "░" * empty
+    return f"<code>{bar}</code>"
+
+def _level(score: float) -> str:
+    if score < 20:
+        return "📉 Очень низкий виральный потенциал"
+    if score < 40:
+        return "📉 Низкий виральный потенциал"
+    if score < 60:
+        return "📊 Средний виральный потенциал"
+    if score < 80:
+        return "📈 Высокий виральный потенциал"
+    return "🚀 Очень высокий виральный потенциал"
+
+def _confidence_text(confidence: float) -> str:
+    if confidence > 80:
+        return "🔬 Высокая точность прогноза"
+    if confidence > 50:
+        return "📊 Средняя точность прогноза"
+    return "⚠️ Низкая точность, результат приблизительный"
+
+# Уровень с прогресс-баром по целому проценту вероятности (0-100):
+# пороги уровней и деления бара целые, так что int(score) дает тот же результат
+SCORE_HEADERS = tuple(
+    f"{_level(percent)[0]} <b>{_level(percent)}</b>\n{create_progress_bar(percent / 100)}"
+    for percent in range(101)
+)
+# Текст уверенности по проценту, округленному вверх (пороги строгие: > 80, > 50)
+CONFIDENCE_TEXTS = tuple(_confidence_text(percent) for percent in range(101))
+
+FOLLOWUP_TEXT = (
+    "🎯 <b>Что дальше?</b>\n\n"
+    "Вы можете:\n"
+    "• Отправить новый текст для анализа\n"
+    "• Вернуться в главное меню\n"
+    "• Посмотреть другие примеры"
+)
+
 def format_prediction_response(result: dict, original_text: str) -> str:
-    score = result.get("score", 0.5) * 100
-    confidence = result.get("confidence", 0) * 100
+    score = min(max(result.get("score", 0.5) * 100, 0.0), 100.0)
+    confidence = min(max(result.get("confidence", 0) * 100, 0.0), 100.0)
     text_length = result.get("text_length", 0)
+    sample = original_text[:120] + ("..." if len(original_text) > 120 else "")
     
-    # Определяем уровень потенциала
-    if score < 20:
-        level = "📉 Очень низкий виральный потенциал"
-        level_emoji = "📉"
-    elif score < 40:
-        level = "📉 Низкий виральный потенциал"
-        level_emoji = "📉"
-    elif score < 60:
-        level = "📊 Средний виральный потенциал"
-        level_emoji = "📊"
-    elif score < 80:
-        level = "📈 Высокий виральный потенциал"
-        level_emoji = "📈"
-    else:
-        level = "🚀 Очень высокий виральный потенциал"
-        level_emoji = "🚀"
-    
-    # Прогресс-бар
-    progress_bar = create_progress_bar(score / 100)
+    return (
+        "\n📊 <b>Анализ завершен!</b>\n\n"
+        f"{SCORE_HEADERS[int(score)]}\n\n"
+        f"✅ <b>Вероятность виральности:</b> {score:.1f}%\n"
+        f"🎯 <b>Уверенность прогноза:</b> {confidence:.1f}% ({CONFIDENCE_TEXTS[math.ceil(confidence)]})\n"
+        f"📏 <b>Длина текста:</b> {text_length} символов\n\n\n\n"
+        f"<code>{sample}</code>\n"
+    )
+
+# Вклад слова меньше этого (в процентных пунктах) считается шумом
+EXPLAIN_MIN_IMPACT = 0.1
+# Длинные фрагменты (при разборе по отрезкам) обрезаются в ответе
+EXPLAIN_PHRASE_CHARS = 40
+
+def word_impacts(attributions) -> list:
+    """
+    Суммарный вклад каждого слова (фрагмента) по всем его вхождениям
+    в процентных пунктах, от повышающих оценку к понижающим
+    """
+    impacts = {}
+    for phrase, delta in attributions:
+        impacts[phrase] = impacts.get(phrase, 0.0) + delta * 100
+    return sorted(
+        ((phrase, impact) for phrase, impact in impacts.items() if abs(impact) >= EXPLAIN_MIN_IMPACT),
+        key=lambda item: item[1],
+        reverse=True
+    )
+
+def _quote(phrase: str) -> str:
+    if len(phrase) > EXPLAIN_PHRASE_CHARS:
+        phrase = phrase[:EXPLAIN_PHRASE_CHARS] + "…"
+    return f"«{escape(phrase)}»"
+
+def format_explanation(result: dict) -> str:
+    """Блок /explain: слова, повышающие и понижающие оценку, и рекомендации"""
+    if "attributions" not in result:
+        return ""
     
-    # Рекомендации
-    recommendations = get_recommendations(score, text_length, confidence)
+    top = settings.EXPLAIN_TOP_WORDS
+    impacts = word_impacts(result["attributions"])
+    raising = [item for item in impacts if item[1] > 0][:top]
+    lowering = [item for item in reversed(impacts) if item[1] < 0][:top]
     
-    # Интерпретация уверенности
-    if confidence > 80:
-        confidence_text = "🔬 Высокая точность прогноза"
-    elif confidence > 50:
-        confidence_text = "📊 Средняя точность прогноза"
-    else:
-        confidence_text = "⚠️ Низкая точность, результат приблизительный"
+    lines = []
+    if raising or lowering:
+        lines.append("🔍 <b>Что влияет на оценку:</b>")
+    if raising:
+        lines.append("⬆️ <b>Повышают:</b> " + ", ".join(
+            f"{_quote(phrase)} {impact:+.1f}" for phrase, impact in raising
+        ))
+    if lowering:
+        lines.append("⬇️ <b>Понижают:</b> " + ", ".join(
+            f"{_quote(phrase)} {impact:+.1f}" for phrase, impact in lowering
+        ))
+    if raising or lowering:
+        lines.append("<i>Изменение вероятности в п.п., если убрать слово из текста</i>")
+    if result.get("window", 1) > 1:
+        lines.append(f"<i>Текст длинный: вклад оценен по фрагментам из {result['window']} слов</i>")
     
-    return f"""
-📊 <b>Анализ завершен!</b>
+    recommendations = get_recommendations(
+        result.get("is_viral", False), raising, lowering, result.get("truncated", False)
+    )
+    lines.append(f"\n💡 <b>Рекомендации:</b>\n{recommendations}")
+    return "\n".join(lines) + "\n"
 
-{level_emoji} <b>{level}</b>
-{progress_bar}
+def get_recommendations(is_viral: bool, raising: list, lowering: list, truncated: bool = False) -> str:
+    """
+    Рекомендации по вкладу слов: raising и lowering - пары
+    (фрагмент, вклад в п.п.) от самых сильных
+    """
+    tips = []
+    if lowering:
+        gain = -sum(impact for _, impact in lowering)
+        tips.append(
+            f"Уберите или замените {', '.join(_quote(phrase) for phrase, _ in lowering)}: "
+            f"без них оценка может вырасти примерно на {gain:.1f} п.п."
+        )
+    if raising:
+        words = ", ".join(_quote(phrase) for phrase, _ in raising)
+        if is_viral:
+            tips.append(f"Сохраните {words} - они сильнее всего поднимают оценку")
+        else:
+            tips.append(f"Больше похожих на {words}: они единственные заметно поднимают оценку")
+    if not tips:
+        tips.append("Отдельные слова почти не влияют на оценку - попробуйте изменить тему или подачу поста")
+    if truncated:
+        tips.append("Модель читает только начало длинного текста - вынесите главное в первые абзацы")
+    return "\n".join(f"• {tip}" for tip in tips)
 
-✅ <b>Вероятность виральности:</b> {score:.1f}%
-🎯 <b>Уверенность прогноза:</b> {confidence:.1f}% ({confidence_text})
-📏 <b>Длина текста:</b> {text_length} символов
+# Длинные варианты текста в ответе /optimize обрезаются (лимит сообщения - 4096 символов)
+OPTIMIZE_PREVIEW_CHARS = 300
 
+def format_optimization(result: dict) -> str:
+    """Блок /optimize: лучшие варианты текста с приростом вероятности и правками"""
+    if "candidates" not in result:
+        return ""
+    
+    candidates = result["candidates"]
+    if not candidates:
+        return (
+            "🛠 <b>Правок, повышающих оценку, не нашлось</b>\n"
+            f"<i>Проверено вариантов: {result.get('evaluated', 0)}</i>\n"
+        )
+    
+    lines = ["🛠 <b>Варианты с более высокой оценкой:</b>"]
+    for number, candidate in enumerate(candidates, 1):
+        preview = candidate["text"]
+        if len(preview) > OPTIMIZE_PREVIEW_CHARS:
+            preview = preview[:OPTIMIZE_PREVIEW_CHARS] + "…"
+        lines.append(
+            f"\n<b>{number}.</b> {candidate['probability'] * 100:.1f}% "
+            f"({candidate['delta'] * 100:+.1f} п.п.)"
+        )
+        lines.extend(f"   • {escape(edit)}" for edit in candidate["edits"])
+        lines.append(f"<code>{escape(preview)}</code>")
+    lines.append(f"\n<i>Проверено вариантов: {result.get('evaluated', 0)}</i>")
+    return "\n".join(lines) + "\n"
 
+# Состояние FSM -> метод PredictorService для анализа одного текста
+ANALYSIS_MODES = {
+    PredictionState.waiting_for_explanation.state: "explain",
+    PredictionState.waiting_for_optimization.state: "optimize",
+}
 
-<code>{original_text[:120]}{'...' if len(original_text) > 120 else ''}</code>
-"""
+# Порядок этапов в сводке для админов
+METRIC_STAGES = ("normalize", "tokenize", "pad", "model", "predict", "explain", "optimize", "telegram_send")
 
-def create_progress_bar(percentage: float, length: int = 10) -> str:
-    """Создание текстового прогресс-бара"""
-    filled = int(percentage * length)
-    empty = length - filled
-    bar = "█" * filled + "░" * empty
-    return f"<code>{bar}</code>"
+def format_admin_metrics() -> str:
+    """Сводка метрик задержки и нагрузки для /stats (только админам)"""
+    lines = ["📈 <b>Метрики (p50 / p95, мс):</b>"]
+    for stage in METRIC_STAGES:
+        p50 = STAGE_SECONDS.quantile(0.5, stage=stage)
+        if p50 is None:
+            continue
+        p95 = STAGE_SECONDS.quantile(0.95, stage=stage)
+        lines.append(f"   • {stage}: {p50 * 1000:.1f} / {p95 * 1000:.1f}")
+    if predictor.pool is not None:
+        lines.append("   • этапы модели считаются в процессах-воркерах")
+    
+    requests = ", ".join(f"{result} {count}" for (result,), count in sorted(REQUESTS.values().items()))
+    throttled = sum(THROTTLED.values().values())
+    queues = ", ".join(f"{name} {depth}" for name, depth in predictor.queue_depths().items())
+    lines.append(f"📨 <b>Запросы:</b> {requests or 'нет'}")
+    lines.append(f"🚫 <b>Отклонено лимитом частоты:</b> {throttled}")
+    lines.append(f"📥 <b>Очереди:</b> {queues}")
+    return "\n".join(lines) + "\n" + format_model_comparison()
 
-def get_recommendations(score: float, length: int, is_viral: bool) -> str:
-    return
+def format_model_comparison() -> str:
+    """Сравнение моделей реестра (A/B и теневых) для /stats"""
+    if not predictor.model_variants:
+        return ""
+    
+    lines = ["🧪 <b>Модели (p50 вызова, средняя оценка, строк):</b>"]
+    if predictor.pool is not None:
+        lines.append("   • метрики моделей считаются в процессах-воркерах")
+        return "\n".join(lines) + "\n"
+    
+    from predictor.viral_predictor import MODEL_SCORES, MODEL_SECONDS, SHADOW_ERRORS, SHADOW_ROWS
+    for (model, role), (counts, total) in sorted(MODEL_SCORES.series().items()):
+        rows = sum(counts)
+        p50 = MODEL_SECONDS.quantile(0.5, model=model) or 0.0
+        line = f"   • {model} ({role}): {p50 * 1000:.1f} мс, {total / rows * 100:.1f}%, {rows}"
+        if role == "shadow":
+            disagreed = SHADOW_ROWS.value(model=model, outcome="disagreed")
+            dropped = SHADOW_ROWS.value(model=model, outcome="dropped")
+            line += f", другое решение {disagreed / rows:.1%}, пропущено {dropped}"
+        lines.append(line)
+    # Теневая модель, которая всегда падает, не попадает в MODEL_SCORES
+    for (model,), errors in sorted(SHADOW_ERRORS.values().items()):
+        lines.append(f"   • {model} (shadow): ошибок {errors}")
+    return "\n".join(lines) + "\n"
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Статистика модели"""
     if predictor.is_loaded:
         status = "✅ <b>Модель загружена и готова к работе</b>"
+    elif predictor.is_loading:
+        status = f"⏳ <b>Модель загружается:</b> {LOAD_PHASES[predictor.phase]}"
     else:
         status = "❌ <b>Модель не загружена</b>"
     
+    timings = "".join(
+        f"   • {LOAD_PHASES[stage]}: {seconds:.2f} с\n"
+        for stage, seconds in predictor.stage_timings.items()
+    )
+    if timings:
+        timings = f"⏱ <b>Этапы загрузки:</b>\n{timings}"
+    
+    reload_line = ""
+    if predictor.reload_phase is not None:
+        reload_line = f"🔄 <b>Замена модели:</b> {LOAD_PHASES[predictor.reload_phase]}\n"
+    elif predictor.last_reload is not None:
+        finished = time.localtime(predictor.last_reload["finished_at"])
+        reload_line = (
+            f"🔄 <b>Модель заменена:</b> {time.strftime('%d.%m %H:%M', finished)}, "
+            f"версия {predictor.last_reload['version']}\n"
+        )
+    
+    cache_line = ""
+    if predictor.cache is not None:
+        cache_stats = predictor.cache.stats()
+        cache_line = (
+            f"🗂 <b>Кэш:</b> {cache_stats['entries']} записей, "
+            f"попаданий {cache_stats['hit_rate'] * 100:.0f}%\n"
+        )
+    
+    if predictor.store is not None:
+        store_stats = predictor.store.stats()
+        cache_line += (
+            f"💾 <b>Хранилище оценок:</b> записано {store_stats['written']}, "
+            f"в очереди {store_stats['pending']}, потеряно {store_stats['dropped']}\n"
+        )
+    
+    sequence_stats = predictor.sequence_cache_stats()
+    if sequence_stats is not None:
+        cache_line += (
+            f"🧮 <b>Кэш входов модели:</b> {sequence_stats['hits']} из "
+            f"{sequence_stats['hits'] + sequence_stats['misses']} запросов без вызова модели\n"
+        )
+    
+    admin_block = ""
+    if message.from_user and message.from_user.id in settings.ADMIN_IDS:
+        admin_block = format_admin_metrics()
+    
     await message.answer(
         f"🤖 <b>Статистика бота</b>\n\n"
         f"{status}\n"
-        f"📁 <b>Модель:</b> {settings.ML_MODEL_PATH}\n"
-        f"📁 <b>Токенизатор:</b> {settings.TOKENIZER_PATH}\n"
+        f"{timings}"
+        f"{reload_line}"
+        f"{cache_line}"
+        f"{admin_block}"
+        f"📁 <b>Модель:</b> {escape(predictor.model_path)}\n"
+        f"📁 <b>Токенизатор:</b> {escape(predictor.tokenizer_path)}\n"
         f"⚡ <b>Порог виральности:</b> {settings.VIRAL_THRESHOLD}\n"
         f"📏 <b>Длина текста:</b> {settings.MIN_TEXT_LENGTH}-{settings.MAX_TEXT_LENGTH} символов",
         parse_mode="HTML",
         reply_markup=main_keyboard()
-    )
\ No newline at end of file
+    )
+
+def format_reload_report(report: dict) -> str:
+    """Отчет о горячей замене модели для /reload"""
+    if report["outcome"] == "unchanged":
+        return f"ℹ️ Файлы модели не изменились (версия {report['version']}), замена не нужна"
+    
+    memory = ""
+    if report["peak_rss_mb"] is not None and report["rss_after_mb"] is not None:
+        memory = (
+            f"💾 <b>Память:</b> пик {report['peak_rss_mb']:.0f} МБ, "
+            f"после замены {report['rss_after_mb']:.0f} МБ\n"
+        )
+    drained = (
+        "прежняя модель освобождена" if report["drained"]
+        else "прежняя модель освободится после завершения начатых на ней запросов"
+    )
+    return (
+        f"✅ <b>Модель заменена за {report['seconds']:.1f} с</b>\n"
+        f"📁 {escape(report['model_path'])}\n"
+        f"🏷 <b>Версия:</b> {report['version']}\n"
+        f"{memory}"
+        f"🧹 {drained}"
+    )
+
+@router.message(Command("reload"))
+async def cmd_reload(message: Message, command: CommandObject):
+    """Горячая замена модели (только для админов): /reload [путь к модели]"""
+    if not message.from_user or message.from_user.id not in settings.ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам")
+        return
+    
+    model_path = command.args.strip() if command.args else None
+    await message.answer("🔄 Загружаю модель, бот продолжает отвечать на прежней...")
+    try:
+        report = await predictor.reload(model_path)
+    except Exception as e:
+        logger.error(f"❌ Ошибка горячей замены модели: {e}")
+        await message.answer(
+            f"❌ <b>Модель не заменена:</b> {escape(str(e))}",
+            parse_mode="HTML"
+        )
+        return
+    
+    await message.answer(format_reload_report(report), parse_mode="HTML")
@@ -2,7 +2,7 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-def get_inline_keyboard() -> InlineKeyboardMarkup:
+def _build_inline_keyboard() -> InlineKeyboardMarkup:
     """Inline-клавиатура для главного меню"""
     builder = InlineKeyboardBuilder()
     
@@ -28,7 +28,7 @@ def get_inline_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(2)  # 2 кнопки в ряду
     return builder.as_markup()
 
-def get_analysis_keyboard() -> InlineKeyboardMarkup:
+def _build_analysis_keyboard() -> InlineKeyboardMarkup:
     """Inline-клавиатура после анализа"""
     builder = InlineKeyboardBuilder()
     
@@ -44,4 +44,15 @@ def get_analysis_keyboard() -> InlineKeyboardMarkup:
     )
     
     builder.adjust(2)
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+# Клавиатуры не меняются, поэтому собираются один раз при импорте,
+# а не на каждый ответ
+INLINE_KEYBOARD = _build_inline_keyboard()
+ANALYSIS_KEYBOARD = _build_analysis_keyboard()
+
+def get_inline_keyboard() -> InlineKeyboardMarkup:
+    return INLINE_KEYBOARD
+
+def get_analysis_keyboard() -> InlineKeyboardMarkup:
+    return ANALYSIS_KEYBOARD
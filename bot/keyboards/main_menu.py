@@ -1,7 +1,7 @@
 # bot/keyboards/main_menu.py - REPLY КЛАВИАТУРА (под полем ввода)
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
-def main_keyboard() -> ReplyKeyboardMarkup:
+def _build_main_keyboard() -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="📊 Проанализировать текст")],
         [KeyboardButton(text="ℹ️ Помощь"), KeyboardButton(text="🤖 О боте")],
@@ -14,7 +14,7 @@ def main_keyboard() -> ReplyKeyboardMarkup:
         input_field_placeholder="Выберите действие или отправьте текст..."
     )
 
-def predict_keyboard() -> ReplyKeyboardMarkup:
+def _build_predict_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для анализа текста"""
     buttons = [
         [KeyboardButton(text="🔙 Назад в меню")]
@@ -24,4 +24,14 @@ def predict_keyboard() -> ReplyKeyboardMarkup:
         resize_keyboard=True,
         one_time_keyboard=False,
         input_field_placeholder="Отправьте текст для анализа..."
-    )
\ No newline at end of file
+    )
+
+# Собираются один раз: экземпляры общие для всех ответов и не изменяются
+MAIN_KEYBOARD = _build_main_keyboard()
+PREDICT_KEYBOARD = _build_predict_keyboard()
+
+def main_keyboard() -> ReplyKeyboardMarkup:
+    return MAIN_KEYBOARD
+
+def predict_keyboard() -> ReplyKeyboardMarkup:
+    return PREDICT_KEYBOARD
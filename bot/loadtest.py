@@ -0,0 +1,340 @@
+# bot/loadtest.py
+"""
+Нагрузочный тест бота без Telegram
+
+Синтетические апдейты подаются прямо в диспетчер из create_dispatcher()
+(те же роутеры, ThrottlingMiddleware и хуки модели), а исходящие вызовы
+Bot API обслуживает локальная заглушка. Каждый виртуальный пользователь
+проходит сценарий /predict -> текст (через PredictionState.waiting_for_text)
+и сразу начинает следующий.
+
+Запуск из корня проекта (токен не нужен):
+    python -m bot.loadtest --concurrency 1 4 16 64 --duration 20
+
+С --webhook апдейты отправляются HTTP-запросами во встроенный сервер
+вебхука (bot/webhook.py), а время шага считается до прихода ответа
+бота в заглушку.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# До импорта настроек: токен-заглушка, отдельные хранилища оценок и
+# состояний FSM на прогон (фейковые сессии не попадают в рабочую базу);
+# каталог удаляется после прогона
+_DATA_DIR = tempfile.TemporaryDirectory(prefix="loadtest-")
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+os.environ.setdefault("ADMIN_IDS", "[]")
+os.environ.setdefault("MIN_TEXT_LENGTH", "10")
+os.environ.setdefault("SCORE_STORE_PATH", os.path.join(_DATA_DIR.name, "scores.sqlite3"))
+os.environ.setdefault("FSM_SQLITE_PATH", os.path.join(_DATA_DIR.name, "fsm.sqlite3"))
+
+import numpy as np
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import ClientSession, web
+
+from bot.config import settings
+from bot.handlers import prediction
+from bot.main import create_dispatcher
+from bot.webhook import WebhookServer
+
+WORDS = (
+    "today my cat found a secret door behind the fridge and nobody believes me "
+    "this simple trick saved our small business thousands of dollars last year "
+    "why does everyone ignore the obvious problem with public transport in big cities "
+    "breaking news scientists discover water on a distant planet near bright star "
+    "what is the best advice you ever got from a stranger on the internet"
+).split()
+
+class FakeTelegramAPI:
+    """
+    Заглушка Bot API на aiohttp: sendMessage возвращает сообщение,
+    остальные методы - True. Последний ответ каждому чату запоминается,
+    чтобы классифицировать исход сценария.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.last_text: Dict[int, str] = {}
+        self._waiters: Dict[int, List[tuple]] = {}
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result: Any = True
+        if method.lower() == "sendmessage":
+            chat_id = int(data["chat_id"])
+            self.last_text[chat_id] = data.get("text", "")
+            self._notify(chat_id, data.get("text", ""))
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    def expect(self, chat_id: int, predicate: Callable[[str], bool]) -> asyncio.Future:
+        """Future с первым ответом чату, удовлетворяющим predicate"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, future))
+        return future
+
+    def _notify(self, chat_id: int, text: str):
+        waiters = self._waiters.get(chat_id, [])
+        for waiter in list(waiters):
+            predicate, future = waiter
+            if not future.done() and predicate(text):
+                future.set_result(text)
+                waiters.remove(waiter)
+        if not waiters:
+            self._waiters.pop(chat_id, None)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def classify(reply: str) -> str:
+    """Исход сценария по последнему ответу бота"""
+    if "Что дальше?" in reply:
+        return "ok"
+    if "Анализ завершен" in reply:
+        # Первое из двух сообщений успешного ответа
+        return "partial"
+    if reply.startswith("🚦"):
+        return "overloaded"
+    if reply.startswith("⌛"):
+        return "expired"
+    if reply.startswith("⏳"):
+        # И "модель загружается", и ограничение частоты
+        return "throttled_or_warming"
+    return "error"
+
+class LoadGenerator:
+    """
+    Виртуальные пользователи; апдейты подаются прямо в диспетчер или,
+    если задан webhook_url, POST-запросами в сервер вебхука
+    """
+
+    def __init__(
+        self,
+        dp,
+        bot: Bot,
+        api: FakeTelegramAPI,
+        texts: List[str],
+        webhook_url: Optional[str] = None,
+        secret_token: Optional[str] = None,
+        timeout: float = 60.0
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.api = api
+        self.texts = texts
+        self.webhook_url = webhook_url
+        self.headers = {WebhookServer.SECRET_HEADER: secret_token} if secret_token else {}
+        self.timeout = timeout
+        self.http = ClientSession() if webhook_url else None
+        self._update_ids = itertools.count(1)
+        # Новый пользователь на каждый сценарий: иначе измеряется лимит частоты, а не бот
+        self._user_ids = itertools.count(10_000_000)
+
+    def _update(self, user_id: int, text: str) -> Dict[str, Any]:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                "text": text,
+            },
+        }
+
+    async def session(self, rng: random.Random) -> Dict[str, Any]:
+        """Один сценарий: /predict, затем текст; время каждого шага"""
+        user_id = next(self._user_ids)
+
+        started = time.perf_counter()
+        await self._send(user_id, "/predict", lambda reply: True)
+        command_done = time.perf_counter()
+        await self._send(user_id, rng.choice(self.texts), lambda reply: classify(reply) != "partial")
+        text_done = time.perf_counter()
+
+        return {
+            "command": command_done - started,
+            "text": text_done - command_done,
+            "outcome": classify(self.api.last_text.get(user_id, "")),
+        }
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.close()
+
+    async def _send(self, user_id: int, text: str, final: Callable[[str], bool]):
+        """Отправка апдейта; при вебхуке - ожидание ответа бота, завершающего шаг"""
+        update = self._update(user_id, text)
+        if self.webhook_url is None:
+            await self.dp.feed_raw_update(self.bot, update)
+            return
+
+        reply = self.api.expect(user_id, final)
+        async with self.http.post(self.webhook_url, json=update, headers=self.headers) as response:
+            response.raise_for_status()
+        try:
+            await asyncio.wait_for(reply, self.timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run_level(self, concurrency: int, duration: float) -> Dict[str, Any]:
+        """Замкнутый цикл: concurrency пользователей, каждый сразу начинает новый сценарий"""
+        samples: List[Dict[str, Any]] = []
+        stop_at = time.perf_counter() + duration
+        calls_before = sum(self.api.calls.values())
+
+        async def user(seed: int):
+            rng = random.Random(seed)
+            while time.perf_counter() < stop_at:
+                samples.append(await self.session(rng))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(seed) for seed in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        api_calls = sum(self.api.calls.values()) - calls_before
+
+        text_latency = np.array([sample["text"] for sample in samples]) * 1000
+        command_latency = np.array([sample["command"] for sample in samples]) * 1000
+        outcomes = Counter(sample["outcome"] for sample in samples)
+        return {
+            "concurrency": concurrency,
+            "sessions": len(samples),
+            "throughput": outcomes["ok"] / elapsed,
+            "text_p50": float(np.percentile(text_latency, 50)),
+            "text_p95": float(np.percentile(text_latency, 95)),
+            "text_p99": float(np.percentile(text_latency, 99)),
+            "command_p50": float(np.percentile(command_latency, 50)),
+            "api_calls_per_session": api_calls / max(len(samples), 1),
+            "outcomes": dict(outcomes),
+        }
+
+def synthetic_texts(count: int, seed: int = 0) -> List[str]:
+    """Различные тексты 20-120 слов (промахи кэша, как у новых постов)"""
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))
+        for _ in range(count)
+    ]
+
+def print_report(levels: List[Dict[str, Any]]):
+    print(f"\n {'польз.':>7}{'сценариев':>11}{'ok/с':>9}{'p50, мс':>10}"
+          f"{'p95, мс':>10}{'p99, мс':>10}{'/predict p50':>14}{'API/сцен.':>11}  исходы")
+    for level in levels:
+        outcomes = ", ".join(f"{name} {count}" for name, count in sorted(level["outcomes"].items()))
+        print(f" {level['concurrency']:>7}{level['sessions']:>11}{level['throughput']:>9.1f}"
+              f"{level['text_p50']:>10.1f}{level['text_p95']:>10.1f}{level['text_p99']:>10.1f}"
+              f"{level['command_p50']:>14.1f}{level['api_calls_per_session']:>11.1f}  {outcomes}")
+
+    # Насыщение: первый уровень, после которого рост пропускной способности < 10%
+    best = levels[0]
+    for level in levels[1:]:
+        if level["throughput"] < best["throughput"] * 1.1:
+            break
+        best = level
+    print(f"\n Насыщение: ~{best['throughput']:.1f} анализов/с при {best['concurrency']} "
+          f"одновременных пользователях (p99 {best['text_p99']:.0f} мс)")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с заглушкой Telegram API")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--duration", type=float, default=20.0, help="секунд на уровень")
+    parser.add_argument("--texts", type=int, default=5000, help="размер пула разных текстов")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0,
+                        help="задержка ответа заглушки (имитация сети до Telegram)")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--webhook", action="store_true",
+                        help="подавать апдейты через сервер вебхука")
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(port=args.port, latency=args.api_latency_ms / 1000)
+    await api.start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.base_url))
+    bot = Bot(token=settings.BOT_TOKEN, session=session)
+    dp = create_dispatcher()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        started = time.perf_counter()
+        if not await prediction.predictor.wait_ready():
+            raise SystemExit(f"Модель не загрузилась: {prediction.predictor.load_error}")
+        print(f" Модель готова за {time.perf_counter() - started:.1f} с")
+
+        server = None
+        if args.webhook:
+            server = WebhookServer(
+                dp,
+                bot,
+                host="127.0.0.1",
+                port=args.webhook_port,
+                path=settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET,
+                max_concurrent=settings.WEBHOOK_MAX_CONCURRENT,
+                drain_timeout=settings.WEBHOOK_DRAIN_TIMEOUT
+            )
+            await server.start()
+        generator = LoadGenerator(
+            dp,
+            bot,
+            api,
+            synthetic_texts(args.texts),
+            webhook_url=f"http://127.0.0.1:{args.webhook_port}{settings.WEBHOOK_PATH}" if server else None,
+            secret_token=settings.WEBHOOK_SECRET
+        )
+
+        levels = []
+        try:
+            for concurrency in args.concurrency:
+                levels.append(await generator.run_level(concurrency, args.duration))
+                print(f"   {concurrency} польз.: {levels[-1]['throughput']:.1f} анализов/с")
+        finally:
+            await generator.close()
+            if server is not None:
+                await server.stop()
+        print_report(levels)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await session.close()
+        await api.stop()
+        # После shutdown: базы в каталоге уже закрыты
+        _DATA_DIR.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
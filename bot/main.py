@@ -8,38 +8,54 @@ from aiogram.types import Message
 
 from bot.config import settings
 from bot.handlers import common, prediction
-from bot.middlewares.throttling import ThrottlingMiddleware
+from bot.middlewares.throttling import (
+    MemoryBucketStore,
+    RateLimit,
+    SQLiteBucketStore,
+    ThrottlingMiddleware
+)
+from bot.services.fsm_storage import SQLiteStorage
+from bot.services.metrics_server import MetricsServer
+from bot.webhook import WebhookServer, run_webhook
 
-async def main():
-    # Настройка логирования
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    
-    # Проверка токена
-    if not settings.BOT_TOKEN or settings.BOT_TOKEN == "your_bot_token_here":
-        logger.error("❌ BOT_TOKEN не установлен! Создайте файл .env")
-        return
-    
-    # Проверка модели
-    import os
-    if not os.path.exists(settings.ML_MODEL_PATH):
-        logger.warning(f"⚠️ Модель не найдена по пути: {settings.ML_MODEL_PATH}")
-    if not os.path.exists(settings.TOKENIZER_PATH):
-        logger.warning(f"⚠️ Токенизатор не найден по пути: {settings.TOKENIZER_PATH}")
+def create_dispatcher() -> Dispatcher:
+    """
+    Диспетчер со всеми роутерами, ограничением частоты и хуками модели
     
-    # Инициализация бота
-    bot = Bot(token=settings.BOT_TOKEN)
-    storage = MemoryStorage()
+    Используется и ботом, и нагрузочным тестом (bot/loadtest.py).
+    """
+    if settings.FSM_STORAGE == "sqlite":
+        storage = SQLiteStorage(
+            settings.FSM_SQLITE_PATH,
+            ttl=settings.FSM_STATE_TTL_HOURS * 3600,
+            flush_interval=settings.FSM_FLUSH_INTERVAL
+        )
+    else:
+        storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    if isinstance(storage, SQLiteStorage):
+        dp.startup.register(storage.open)
+        dp.shutdown.register(storage.close)
     
-    dp.message.middleware(ThrottlingMiddleware())
+    limits = {
+        "default": RateLimit(rate=settings.THROTTLE_RATE, burst=settings.THROTTLE_BURST),
+        "inference": RateLimit(
+            rate=settings.THROTTLE_INFERENCE_RATE,
+            burst=settings.THROTTLE_INFERENCE_BURST
+        ),
+    }
+    if settings.THROTTLE_BACKEND == "sqlite":
+        throttle_store = SQLiteBucketStore(settings.THROTTLE_SQLITE_PATH)
+        dp.shutdown.register(throttle_store.close)
+    else:
+        throttle_store = MemoryBucketStore(max_keys=settings.THROTTLE_MAX_USERS)
+    dp.message.middleware(ThrottlingMiddleware(limits, throttle_store))
     
     dp.include_router(common.router)
     dp.include_router(prediction.router)
     
-    logger.info("🤖 Бот запускается...")
-    logger.info(f"📁 Модель: {settings.ML_MODEL_PATH}")
-    logger.info(f"👤 Админы: {settings.ADMIN_IDS}")
+    dp.startup.register(prediction.predictor.start)
+    dp.shutdown.register(prediction.predictor.close)
     
     # /start 
     @dp.message(Command("start"))
@@ -49,6 +65,8 @@ async def main():
             "📊 Я анализирую тексты и предсказываю их виральный потенциал.\n\n"
             "📝 <b>Команды:</b>\n"
             "/predict - анализ текста\n"
+            "/explain - какие слова влияют на оценку\n"
+            "/optimize - как поднять оценку текста\n"
             "/stats - статус модели\n"
             "/help - помощь\n"
             "/about - о боте\n\n"
@@ -74,10 +92,55 @@ async def main():
             parse_mode="HTML"
         )
     
+    return dp
+
+async def main():
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+    
+    # Проверка токена
+    if not settings.BOT_TOKEN or settings.BOT_TOKEN == "your_bot_token_here":
+        logger.error("❌ BOT_TOKEN не установлен! Создайте файл .env")
+        return
+    
+    # Проверка модели
+    import os
+    if not os.path.exists(settings.ML_MODEL_PATH):
+        logger.warning(f"⚠️ Модель не найдена по пути: {settings.ML_MODEL_PATH}")
+    if not os.path.exists(settings.TOKENIZER_PATH):
+        logger.warning(f"⚠️ Токенизатор не найден по пути: {settings.TOKENIZER_PATH}")
+    
+    # Инициализация бота
+    bot = Bot(token=settings.BOT_TOKEN)
+    dp = create_dispatcher()
+    
+    if settings.METRICS_ENABLED:
+        metrics_server = MetricsServer(settings.METRICS_HOST, settings.METRICS_PORT)
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+    
+    logger.info("🤖 Бот запускается...")
+    logger.info(f"📁 Модель: {settings.ML_MODEL_PATH}")
+    logger.info(f"👤 Админы: {settings.ADMIN_IDS}")
+    
     logger.info("✅ Бот успешно запущен!")
     
     try:
-        await dp.start_polling(bot)
+        if settings.RUN_MODE == "webhook":
+            server = WebhookServer(
+                dp,
+                bot,
+                host=settings.WEBHOOK_HOST,
+                port=settings.WEBHOOK_PORT,
+                path=settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET,
+                max_concurrent=settings.WEBHOOK_MAX_CONCURRENT,
+                drain_timeout=settings.WEBHOOK_DRAIN_TIMEOUT
+            )
+            await run_webhook(dp, bot, server, settings.WEBHOOK_URL)
+        else:
+            await dp.start_polling(bot)
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен")
     except Exception as e:
@@ -1,13 +1,188 @@
 # bot/middlewares/throttling.py
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import sqlite3
 import time
 
+from predictor.metrics import REGISTRY
+
+THROTTLED = REGISTRY.counter(
+    "viral_throttled_total", "Сообщения, отклоненные ограничением частоты", labelnames=("limit",)
+)
+
+class RateLimit(NamedTuple):
+    """Токен-бакет: rate токенов в секунду, не больше burst подряд"""
+    rate: float
+    burst: int
+
+    @property
+    def refill_time(self) -> float:
+        """За сколько секунд пустой бакет наполняется полностью"""
+        return self.burst / self.rate
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float
+    # Предупреждаем только о первом отказе подряд, чтобы не спамить ответами
+    warn: bool
+
+def _take(tokens: float, updated_at: float, limit: RateLimit, now: float) -> Tuple[float, bool]:
+    tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, True
+    return tokens, False
+
+class MemoryBucketStore:
+    """
+    Бакеты в памяти процесса с ограниченным размером
+
+    Записи упорядочены по последнему обращению. Бакет, простоявший дольше
+    refill_time, полон и ничего не помнит - такие записи снимаются с
+    начала очереди при каждом обращении (амортизированно O(1)). Сверх
+    max_keys вытесняются самые давние записи (LRU).
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # Порог простоя - по самому медленному из встреченных лимитов,
+        # чтобы не сбросить бакет другого класса раньше времени
+        self.idle_ttl = 0.0
+        self._buckets: "OrderedDict[Tuple[int, str], list]" = OrderedDict()  # key: [tokens, updated_at, warned]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def acquire(self, user_id: int, name: str, limit: RateLimit) -> Decision:
+        now = time.monotonic()
+        self.idle_ttl = max(self.idle_ttl, limit.refill_time)
+        self._expire(now)
+
+        key = (user_id, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(limit.burst), now, False]
+            self._buckets[key] = bucket
+        else:
+            self._buckets.move_to_end(key)
+
+        tokens, allowed = _take(bucket[0], bucket[1], limit, now)
+        warn = not allowed and not bucket[2]
+        bucket[:] = [tokens, now, not allowed]
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return Decision(allowed, 0.0 if allowed else (1 - tokens) / limit.rate, warn)
+
+    def _expire(self, now: float):
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            self._buckets.popitem(last=False)
+
+class SQLiteBucketStore:
+    """
+    Бакеты в общем файле SQLite - общие лимиты для нескольких процессов бота
+    на одной машине (локальная замена внешнего хранилища вроде Redis)
+
+    Обновление бакета - одна транзакция BEGIN IMMEDIATE в отдельном потоке.
+    """
+
+    def __init__(self, path: str, max_idle: float = 3600.0):
+        self.path = path
+        self.max_idle = max_idle
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="throttle")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_cleanup = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=5.0, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " user_id INTEGER NOT NULL,"
+                " name TEXT NOT NULL,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " warned INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, name)"
+                ") WITHOUT ROWID"
+            )
+        return self._conn
+
+    async def acquire(self, user_id: int, name: str, limit: RateLimit) -> Decision:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._acquire, user_id, name, limit)
+
+    def _acquire(self, user_id: int, name: str, limit: RateLimit) -> Decision:
+        conn = self._connect()
+        # Время стены, а не monotonic: значения сравниваются между процессами
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at, warned FROM buckets WHERE user_id = ? AND name = ?",
+                (user_id, name)
+            ).fetchone()
+            tokens, updated_at, warned = row if row else (float(limit.burst), now, 0)
+
+            tokens, allowed = _take(tokens, updated_at, limit, now)
+            warn = not allowed and not warned
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (user_id, name, tokens, updated_at, warned)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (user_id, name, tokens, now, int(not allowed))
+            )
+
+            if now - self._last_cleanup > self.max_idle:
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.max_idle,))
+                self._last_cleanup = now
+
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return Decision(allowed, 0.0 if allowed else (1 - tokens) / limit.rate, warn)
+
+    async def close(self) -> None:
+        """Закрытие соединения и потока (вызывается хуком shutdown диспетчера)"""
+        if self._conn is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
 class ThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, rate_limit: float = 1.0):
-        self.rate_limit = rate_limit
-        self.users = {}  # user_id: last_message_time
+    """
+    Ограничение частоты сообщений от пользователя
+
+    Класс лимита выбирается флагом обработчика rate_limit (например,
+    flags={"rate_limit": "inference"} у обработчика с запуском модели),
+    по умолчанию - "default".
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, RateLimit]] = None,
+        store: Optional[Any] = None
+    ):
+        self.limits = limits or {"default": RateLimit(rate=1.0, burst=1)}
+        self.store = store or MemoryBucketStore()
 
     async def __call__(
         self,
@@ -15,19 +190,25 @@ class ThrottlingMiddleware(BaseMiddleware):
         event: Message,
         data: Dict[str, Any]
     ) -> Any:
-        user_id = event.from_user.id
-        current_time = time.time()
-
-        # Проверяем, был ли недавно запрос от пользователя
-        if user_id in self.users:
-            time_passed = current_time - self.users[user_id]
-            if time_passed < self.rate_limit:
-                # Слишком частый запрос
-                await event.answer(
-                    "⏳ Слишком много запросов. Пожалуйста, подождите немного."
-                )
-                return
-
-        self.users[user_id] = current_time
-
-        return await handler(event, data)
\ No newline at end of file
+        if event.from_user is None:
+            return await handler(event, data)
+
+        name = get_flag(data, "rate_limit", default="default")
+        limit = self.limits.get(name) or self.limits["default"]
+
+        decision = await self.store.acquire(event.from_user.id, name, limit)
+        if not decision.allowed:
+            THROTTLED.inc(limit=name)
+            if decision.warn:
+                if name == "inference":
+                    await event.answer(
+                        f"⏳ Анализ можно запускать не так часто. "
+                        f"Попробуйте через {max(1, round(decision.retry_after))} с."
+                    )
+                else:
+                    await event.answer(
+                        "⏳ Слишком много запросов. Пожалуйста, подождите немного."
+                    )
+            return
+
+        return await handler(event, data)
@@ -0,0 +1,117 @@
+# bot/services/admission.py
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+class Overloaded(Exception):
+    """Очередь на инференс заполнена - запрос отклонен сразу"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Сервис перегружен, повторите через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+class RequestExpired(Exception):
+    """Пользователь уже ждет дольше допустимого - результат никому не нужен"""
+
+class AdmissionController:
+    """
+    Контроль допуска к инференсу
+
+    Одновременно выполняется не больше max_concurrent запросов, ждать
+    своей очереди могут не больше max_queue. Дедлайн задается в секундах
+    Unix-времени (от даты сообщения пользователя), поэтому учитывает и
+    время, которое апдейт провел в очередях Telegram и диспетчера.
+
+    Пакетный запрос занимает слот с весом по числу текстов (не больше
+    max_concurrent), чтобы не обходить ограничение одним вызовом.
+    """
+
+    # Вес нового замера в скользящем среднем времени обработки
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, max_concurrent: int = 64, max_queue: int = 256):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.service_time = 0.0
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        # Взвешенные запросы набирают слоты по одному и по очереди,
+        # иначе два частично набравших запроса могут ждать друг друга
+        self._weighted = asyncio.Lock()
+
+    def retry_after(self) -> float:
+        """Оценка времени до освобождения места в очереди, секунды"""
+        backlog = self.waiting + self.active
+        estimate = backlog * (self.service_time or 1.0) / self.max_concurrent
+        return float(max(1, math.ceil(estimate)))
+
+    async def _acquire(self, weight: int):
+        if weight == 1:
+            await self._semaphore.acquire()
+            return
+        async with self._weighted:
+            acquired = 0
+            try:
+                while acquired < weight:
+                    await self._semaphore.acquire()
+                    acquired += 1
+            except BaseException:
+                for _ in range(acquired):
+                    self._semaphore.release()
+                raise
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None, weight: int = 1):
+        weight = min(max(1, weight), self.max_concurrent)
+        if deadline is not None and time.time() >= deadline:
+            self.expired += 1
+            raise RequestExpired()
+
+        if weight == 1 and not self._semaphore.locked():
+            # Свободный слот занимается синхронно, без создания задачи в wait_for,
+            # иначе при всплеске все запросы увидят семафор свободным
+            await self._semaphore.acquire()
+        else:
+            if self._semaphore.locked() and self.waiting + weight > self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+
+            self.waiting += weight
+            try:
+                timeout = None if deadline is None else deadline - time.time()
+                await asyncio.wait_for(self._acquire(weight), timeout)
+            except asyncio.TimeoutError:
+                self.expired += 1
+                raise RequestExpired()
+            finally:
+                self.waiting -= weight
+
+        self.active += weight
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.service_time += self.EWMA_ALPHA * (elapsed - self.service_time)
+            self.active -= weight
+            for _ in range(weight):
+                self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "service_time": self.service_time,
+        }
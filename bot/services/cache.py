@@ -0,0 +1,137 @@
+# bot/services/cache.py
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Type
+
+def normalize_text(text: str) -> str:
+    """Та же нормализация, что в predict_viral перед токенизацией"""
+    return ' '.join(text.lower().split())
+
+def text_hash(text: str) -> str:
+    """Хеш нормализованного текста (без версии модели)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def text_key(text: str, model_version: str) -> str:
+    """Хеш нормализованного текста вместе с версией модели"""
+    payload = f"{model_version}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class PredictionCache:
+    """
+    LRU-кэш результатов предсказания с TTL
+
+    Одинаковые запросы, пришедшие одновременно, не запускают модель
+    повторно: второй и последующие ждут результат первого (coalesced).
+    Ожидающим передается результат или ошибка вычисления, но не отмена
+    первого запроса и не его собственные ошибки (retry_on) - тогда
+    вычисление запускается заново уже для них.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key: (expires_at, value)
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+        retry_on: Tuple[Type[BaseException], ...] = ()
+    ) -> Any:
+        """
+        Значение из кэша, из уже идущего вычисления или новое вычисление
+
+        retry_on - исключения, которые относятся к запросу, запустившему
+        вычисление (его дедлайн, отказ в допуске), а не к ключу: ожидающие
+        его не получают и вычисляют значение сами
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        while True:
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Отменен сам ожидающий, а не первый запрос
+                if not future.cancelled():
+                    raise
+            except retry_on:
+                pass
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,279 @@
+# bot/services/fsm_storage.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from predictor.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class _Record:
+    """Состояние пользователя: data=None вместо пустого словаря экономит память"""
+
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: Optional[Dict[str, Any]], updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+def _encode_key(key: StorageKey) -> str:
+    return json.dumps(
+        [key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny],
+        separators=(",", ":")
+    )
+
+def _encode_data(data: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+
+def _decode_key(raw: str) -> StorageKey:
+    bot_id, chat_id, user_id, thread_id, business_connection_id, destiny = json.loads(raw)
+    return StorageKey(bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище с записью на диск (SQLite, WAL) и истечением состояний
+
+    В памяти держатся только непустые записи (состояние или данные), так
+    что пользователь без активного сценария не занимает ничего, а
+    get_state/get_data - поиск в словаре без обращения к диску. Записи,
+    не менявшиеся дольше ttl секунд (брошенный /predict), истекают:
+    устаревшие снимаются с начала очереди при каждой записи
+    (амортизированно O(1)) и удаляются из базы при компактации.
+
+    Изменения копятся и сбрасываются на диск пакетами по flush_interval
+    секунд или по batch_size записей в отдельном потоке; при старте
+    живые записи загружаются из базы. Рассчитано на один процесс бота.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 86400.0,
+        flush_interval: float = 1.0,
+        batch_size: int = 256,
+        compact_interval: float = 3600.0
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+
+        self.expired = 0
+        self.written = 0
+        self.write_errors = 0
+
+        # Упорядочены по времени последней записи
+        self._records: "OrderedDict[StorageKey, _Record]" = OrderedDict()
+        # Ключ -> запись для сохранения или None для удаления
+        self._pending: Dict[StorageKey, Optional[_Record]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+        REGISTRY.gauge(
+            "viral_fsm_records", "Пользователи с активным состоянием FSM",
+            lambda: len(self._records)
+        )
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def open(self):
+        """Открытие базы и загрузка неистекших состояний (вызывать при старте бота)"""
+        if self._flusher is not None:
+            return
+        rows = await self._call(self._open, time.time() - self.ttl)
+        for raw_key, state, data, updated_at in rows:
+            self._records[_decode_key(raw_key)] = _Record(
+                state, json.loads(data) if data else None, updated_at
+            )
+        logger.info(f"💾 FSM: загружено {len(rows)} активных состояний из {self.path}")
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _open(self, min_updated_at: float) -> List[Tuple[str, Optional[str], Optional[str], float]]:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " state TEXT,"
+            " data TEXT,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._compact(min_updated_at)
+        return self._conn.execute(
+            "SELECT key, state, data, updated_at FROM fsm ORDER BY updated_at"
+        ).fetchall()
+
+    def _get(self, key: StorageKey) -> Optional[_Record]:
+        record = self._records.get(key)
+        if record is not None and time.time() - record.updated_at >= self.ttl:
+            self._drop(key)
+            return None
+        return record
+
+    def _drop(self, key: StorageKey):
+        del self._records[key]
+        self._pending[key] = None
+        self.expired += 1
+
+    def _write(self, key: StorageKey, state: Optional[str], data: Optional[Dict[str, Any]]):
+        now = time.time()
+        self._expire(now)
+
+        if state is None and not data:
+            # Пустая запись ничем не отличается от отсутствующей
+            if self._records.pop(key, None) is not None:
+                self._pending[key] = None
+        else:
+            record = _Record(state, data or None, now)
+            self._records[key] = record
+            self._records.move_to_end(key)
+            self._pending[key] = record
+
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _expire(self, now: float):
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if now - record.updated_at < self.ttl:
+                break
+            self._drop(key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get(key)
+        state = state.state if isinstance(state, State) else state
+        self._write(key, state, record.data if record is not None else None)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record is not None else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        # Несериализуемые данные отклоняются сразу, а не при записи пакета
+        try:
+            _encode_data(data)
+        except (TypeError, ValueError) as e:
+            raise TypeError(f"Данные состояния FSM должны сериализоваться в JSON: {e}") from e
+        record = self._get(key)
+        self._write(key, record.state if record is not None else None, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        if record is None or record.data is None:
+            return {}
+        return record.data.copy()
+
+    async def flush(self):
+        if not self._pending or self._conn is None:
+            return
+        batch, self._pending = self._pending, {}
+        upserts, deletes = [], []
+        for key, record in batch.items():
+            raw_key = _encode_key(key)
+            if record is None:
+                deletes.append((raw_key,))
+                continue
+            try:
+                data = _encode_data(record.data)
+            except (TypeError, ValueError) as e:
+                # Данные изменили уже после set_data: теряется только эта запись
+                self.write_errors += 1
+                logger.error(f"❌ Состояние FSM {raw_key} не сериализуется: {e}")
+                continue
+            upserts.append((raw_key, record.state, data, record.updated_at))
+        try:
+            await self._call(self._apply, upserts, deletes)
+            self.written += len(upserts) + len(deletes)
+        except sqlite3.Error as e:
+            # Пакет возвращается в очередь на следующий сброс; более новые
+            # изменения тех же ключей, пришедшие за это время, важнее
+            self.write_errors += 1
+            for key, record in batch.items():
+                self._pending.setdefault(key, record)
+            logger.error(f"❌ Ошибка записи состояний FSM, повтор при следующем сбросе: {e}")
+
+    def _apply(self, upserts, deletes):
+        with self._conn:
+            if deletes:
+                self._conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+
+    def _compact(self, min_updated_at: float) -> int:
+        with self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM fsm WHERE updated_at < ?", (min_updated_at,)
+            ).rowcount
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    async def _flush_loop(self):
+        last_compact = time.monotonic()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._expire(time.time())
+            await self.flush()
+
+            if time.monotonic() - last_compact > self.compact_interval:
+                deleted = await self._call(self._compact, time.time() - self.ttl)
+                if deleted:
+                    logger.info(f"🧹 FSM: удалено {deleted} истекших состояний")
+                last_compact = time.monotonic()
+
+    async def close(self) -> None:
+        # Вызывается и хуком shutdown, и самим aiogram после polling.
+        # Цикл останавливается флагом, а не cancel(): wait_for может
+        # проглотить отмену, если событие сработало одновременно с ней
+        if self._flusher is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+        if self._conn is not None:
+            await self._call(self._conn.close)
+            self._conn = None
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": len(self._records),
+            "pending": len(self._pending),
+            "written": self.written,
+            "expired": self.expired,
+            "write_errors": self.write_errors,
+        }
@@ -0,0 +1,49 @@
+# bot/services/metrics_server.py
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from predictor.metrics import REGISTRY, Registry
+
+logger = logging.getLogger(__name__)
+
+class MetricsServer:
+    """
+    HTTP-эндпоинт /metrics в текстовом формате Prometheus
+
+    По умолчанию слушает только localhost: метрики снимает локальный
+    агент или Prometheus на той же машине.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # Занятый порт не должен мешать работе бота
+            logger.error(f"❌ Не удалось запустить сервер метрик на {self.host}:{self.port}: {e}")
+            await self.stop()
+            return
+        logger.info(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -2,107 +2,1010 @@
 import sys
 import os
 import logging
-from typing import Dict, Any, Optional
+import hashlib
+import functools
+import time
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Sequence, Set, Tuple
 import asyncio
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../'))
 
+from bot.services.admission import AdmissionController, Overloaded, RequestExpired
+from bot.services.cache import PredictionCache, text_hash, text_key
+from bot.services.score_store import ScoreStore
+from bot.services.worker_pool import InferencePool, process_rss_mb, run_analysis
+from predictor.metrics import REGISTRY, STAGE_SECONDS
+
 logger = logging.getLogger(__name__)
 
+REQUESTS = REGISTRY.counter(
+    "viral_requests_total", "Запросы на предсказание по исходу", labelnames=("result",)
+)
+RELOADS = REGISTRY.counter(
+    "viral_model_reloads_total", "Горячие замены основной модели по исходу", labelnames=("outcome",)
+)
+
+# Поля результата predict_viral; остальное в результате run_analysis добавляет сам анализ
+ANALYSIS_BASE_FIELDS = ("viral", "probability", "text_sample", "message", "threshold", "model")
+
+# Ошибки отдельного запроса (его дедлайн, отказ в допуске): запросы с тем же
+# текстом, ждавшие его результата в кэше, вычисляют результат сами
+REQUEST_ERRORS = (Overloaded, RequestExpired)
+
+class BatcherClosed(Exception):
+    """Очередь микро-батчинга закрыта - запрос не будет обработан"""
+    
+    def __init__(self):
+        super().__init__("Очередь инференса закрыта")
+
+# Основная модель в реестре (viral_predictor.PRIMARY_MODEL; модуль импортируется лениво)
+PRIMARY_MODEL = "primary"
+
+class MicroBatcher:
+    """
+    Планировщик микро-батчей: копит одиночные запросы и прогоняет их
+    через модель одним пакетом
+    
+    Пакет отправляется, как только набралось max_batch_size запросов
+    или с момента первого запроса прошло max_wait_ms миллисекунд.
+    Одновременно выполняется не больше max_concurrent_batches пакетов.
+    """
+    
+    def __init__(
+        self,
+        predict_batch: Callable[[List[str], float, List[str]], Awaitable[List[Dict[str, Any]]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 1000,
+        max_concurrent_batches: int = 1
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        # Запросы, ждущие места в очереди
+        self._putting = 0
+    
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    def _ensure_started(self):
+        """Запуск фоновой задачи в текущем event loop (ленивый)"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.create_task(self._run())
+    
+    async def submit(self, text: str, threshold: float, model: str = PRIMARY_MODEL) -> Dict[str, Any]:
+        """Поставить текст в очередь и дождаться результата его пакета"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        # При переполненной очереди ждем свободного места (backpressure);
+        # close() дожидается таких запросов и завершает их ошибкой
+        self._putting += 1
+        try:
+            await self._queue.put((text, threshold, model, future))
+        finally:
+            self._putting -= 1
+        return await future
+    
+    async def close(self):
+        """Остановка: все ожидающие запросы завершаются ошибкой BatcherClosed"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        
+        tasks = list(self._in_flight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._in_flight.clear()
+        
+        queue, self._queue = self._queue, None
+        if queue is not None:
+            # Каждое освободившееся место будит одного ждущего put()
+            while not queue.empty() or self._putting:
+                while not queue.empty():
+                    *_, future = queue.get_nowait()
+                    self._fail(future)
+                await asyncio.sleep(0)
+    
+    @staticmethod
+    def _fail(future: asyncio.Future):
+        if not future.done():
+            future.set_exception(BatcherClosed())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[str, float, str, asyncio.Future]] = []
+        
+        try:
+            while True:
+                # Пока все слоты заняты, запросы продолжают копиться в очереди
+                await self._slots.acquire()
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                
+                task = asyncio.create_task(self._process(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(self._on_batch_done)
+                batch = []
+        except asyncio.CancelledError:
+            # Собранный, но еще не отправленный пакет
+            for *_, future in batch:
+                self._fail(future)
+            raise
+    
+    def _on_batch_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._slots.release()
+    
+    async def _process(self, batch: List[Tuple[str, float, str, asyncio.Future]]):
+        """Прогон пакета через модель и раздача результатов"""
+        # Пороги не влияют на вывод модели, но результат считается под порог,
+        # поэтому группируем запросы по порогу (обычно он один). Модели A/B
+        # делят один пакет: текст токенизируется один раз (predict_viral_batch)
+        groups: Dict[float, List[Tuple[str, str, asyncio.Future]]] = {}
+        for text, threshold, model, future in batch:
+            if not future.cancelled():
+                groups.setdefault(threshold, []).append((text, model, future))
+        
+        for threshold, items in groups.items():
+            texts = [text for text, _, _ in items]
+            models = [model for _, model, _ in items]
+            try:
+                results = await self.predict_batch(texts, threshold, models)
+            except asyncio.CancelledError:
+                # Пакет отменен при close(): текущая и оставшиеся группы
+                for *_, future in batch:
+                    self._fail(future)
+                raise
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+# Этапы загрузки модели (для /stats)
+LOAD_PHASES = {
+    "pending": "ожидает запуска",
+    "hashing": "хеширование файлов модели",
+    "importing": "импорт предиктора",
+    "workers": "запуск процессов-воркеров",
+    "model": "загрузка модели",
+    "warmup": "прогрев модели",
+    "tokenizer": "загрузка токенизатора",
+    "buckets": "проверка корзин паддинга",
+    "variants": "загрузка моделей A/B и теневых",
+    "store": "открытие хранилища оценок",
+    "draining": "освобождение прежней модели",
+    "ready": "готова",
+    "failed": "ошибка загрузки",
+}
+
 class PredictorService:
-    """Сервис для работы с ML моделью виральности"""
+    """
+    Сервис для работы с ML моделью виральности
+    
+    Модель загружается в фоне после start(), чтобы бот начинал отвечать
+    сразу. Запросы, пришедшие во время загрузки, ждут ее не дольше
+    warmup_wait секунд, после чего получают ответ "модель прогревается".
     
-    def __init__(self, model_path: str = None, tokenizer_path: str = None):
+    Основную модель можно заменить на ходу (reload): по команде или,
+    при watch_interval > 0, при изменении ее файлов.
+    """
+    
+    def __init__(
+        self,
+        model_path: str = None,
+        tokenizer_path: str = None,
+        batching: bool = True,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 10.0,
+        batch_queue_size: int = 1000,
+        executor: str = "thread",
+        workers: int = 0,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        warmup_wait: float = 15.0,
+        cache: Optional[PredictionCache] = None,
+        sequence_cache_size: int = 50000,
+        padding_buckets: Tuple[int, ...] = (32, 64, 128, 200),
+        store: Optional[ScoreStore] = None,
+        admission: Optional[AdmissionController] = None,
+        explain_cache: Optional[PredictionCache] = None,
+        explain_max_perturbations: int = 200,
+        explain_budget_ms: Optional[float] = 300.0,
+        optimize_cache: Optional[PredictionCache] = None,
+        optimize_top_k: int = 3,
+        optimize_budget_ms: float = 1000.0,
+        optimize_beam_width: int = 4,
+        optimize_min_length: int = 10,
+        model_variants: Optional[Dict[str, Tuple[str, str]]] = None,
+        model_traffic: Optional[Dict[str, float]] = None,
+        shadow_models: Sequence[str] = (),
+        reload_max_rss_mb: float = 0.0,
+        reload_drain_timeout: float = 30.0,
+        watch_interval: float = 0.0
+    ):
         self.model = None
         self.tokenizer = None
-        self.is_loaded = False
+        
+        self.phase = "pending"
+        self.stage_timings: Dict[str, float] = {}
+        self.load_error: Optional[str] = None
+        self.warmup_wait = warmup_wait
+        self._stage_started = 0.0
+        self._loading_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        
+        # Версия = хеш файлов модели и токенизатора, входит в ключ кэша
+        self.model_version: Optional[str] = None
+        
+        # Реестр моделей: дополнительные модели (имя -> пути модели и словаря),
+        # доли трафика A/B по пользователям и теневые модели
+        self.model_variants = dict(model_variants or {})
+        self.model_traffic = dict(model_traffic or {})
+        self.shadow_models = tuple(shadow_models)
+        self.model_versions: Dict[str, str] = {}
+        self._check_registry()
+        
+        # Горячая замена: этап текущей замены (см. LOAD_PHASES) и отчет о последней
+        self.reload_max_rss_mb = reload_max_rss_mb
+        self.reload_drain_timeout = reload_drain_timeout
+        self.watch_interval = watch_interval
+        self.reload_phase: Optional[str] = None
+        self.last_reload: Optional[Dict[str, Any]] = None
+        self._reload_lock = asyncio.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+        # Размеры и время изменения файлов активной модели на момент ее загрузки
+        self._files_seen: Optional[Tuple[Tuple[int, int], ...]] = None
+        self.cache = cache
+        self.store = store
+        self.admission = admission
+        
+        # Анализ одного текста (explain, optimize): кэши по тексту и параметры run_analysis
+        self.analysis_caches = {"explain": explain_cache, "optimize": optimize_cache}
+        self.analysis_options = {
+            "explain": {
+                "max_perturbations": explain_max_perturbations,
+                "budget_ms": explain_budget_ms,
+            },
+            "optimize": {
+                "top_k": optimize_top_k,
+                "budget_ms": optimize_budget_ms,
+                "beam_width": optimize_beam_width,
+                "min_length": optimize_min_length,
+            },
+        }
         
         self.model_path = model_path or "models/complete_model.keras"
-        self.tokenizer_path = tokenizer_path or "tokenizers/tokenizer.pkl"
+        self.tokenizer_path = tokenizer_path or "tokenizers/vocab.npz"
+        
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.sequence_cache_size = sequence_cache_size
+        self.padding_buckets = tuple(padding_buckets)
+        
+        # Вызовы инференса, отправленные в пул потоков или процессов и еще не завершенные
+        self.executor_pending = 0
+        
+        self.pool: Optional[InferencePool] = None
+        if executor == "process":
+            self.pool = InferencePool(
+                self.model_path,
+                self.tokenizer_path,
+                workers=workers,
+                intra_op_threads=intra_op_threads,
+                inter_op_threads=inter_op_threads,
+                sequence_cache_size=sequence_cache_size,
+                padding_buckets=self.padding_buckets,
+                variants=self.model_variants,
+                shadows=self.shadow_models
+            )
+        
+        self.batcher: Optional[MicroBatcher] = None
+        if batching:
+            self.batcher = MicroBatcher(
+                self._predict_batch,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms,
+                max_queue_size=batch_queue_size,
+                max_concurrent_batches=self.pool.workers if self.pool else 1
+            )
+        
+        self._register_metrics()
+    
+    def _check_registry(self):
+        unknown = [
+            name for name in (*self.model_traffic, *self.shadow_models)
+            if name not in self.model_variants
+        ]
+        if unknown:
+            raise ValueError(f"Модели не описаны в реестре: {', '.join(unknown)}")
+        if PRIMARY_MODEL in self.model_variants:
+            raise ValueError(f"Имя {PRIMARY_MODEL} занято основной моделью")
+        if any(share < 0 for share in self.model_traffic.values()) or sum(self.model_traffic.values()) > 1:
+            raise ValueError("Доли трафика A/B должны быть неотрицательными и в сумме не больше 1")
+    
+    def route(self, user_id: Optional[int]) -> str:
+        """
+        Модель для пользователя по долям model_traffic (остаток - основной)
         
-        self._load_model()
+        Пользователь попадает в одну и ту же группу при каждом запросе и
+        после перезапуска: точка в [0, 1) - хеш его id.
+        """
+        if user_id is None or not self.model_traffic:
+            return PRIMARY_MODEL
+        digest = hashlib.sha256(f"ab:{user_id}".encode()).digest()
+        point = int.from_bytes(digest[:8], "big") / 2 ** 64
+        for name, share in self.model_traffic.items():
+            point -= share
+            if point < 0:
+                return name
+        return PRIMARY_MODEL
+    
+    def _register_metrics(self):
+        """Экспорт счетчиков компонентов сервиса (снимаются в момент запроса /metrics)"""
+        REGISTRY.gauge(
+            "viral_model_ready", "1, если модель загружена", lambda: int(self.is_loaded)
+        )
+        REGISTRY.gauge(
+            "viral_queue_depth", "Глубина очередей перед моделью", self.queue_depths,
+            labelname="queue"
+        )
+        REGISTRY.gauge(
+            "viral_cache_events_total", "События кэша предсказаний",
+            lambda: self._pick(self.cache, "hits", "misses", "coalesced", "evictions"),
+            labelname="event", kind="counter"
+        )
+        for kind, cache in self.analysis_caches.items():
+            REGISTRY.gauge(
+                f"viral_{kind}_cache_events_total", f"События кэша результатов /{kind}",
+                lambda cache=cache: self._pick(cache, "hits", "misses", "coalesced", "evictions"),
+                labelname="event", kind="counter"
+            )
+        REGISTRY.gauge(
+            "viral_score_store_events_total", "События хранилища оценок",
+            lambda: self._pick(self.store, "hits", "misses", "written", "dropped"),
+            labelname="event", kind="counter"
+        )
+        REGISTRY.gauge(
+            "viral_sequence_cache_events_total", "События кэша по входу модели",
+            lambda: self._pick_stats(self.sequence_cache_stats(), "hits", "misses"),
+            labelname="event", kind="counter"
+        )
+        REGISTRY.gauge(
+            "viral_admission_total", "Решения контроля допуска",
+            lambda: self._pick(self.admission, "admitted", "rejected", "expired"),
+            labelname="outcome", kind="counter"
+        )
+    
+    @classmethod
+    def _pick(cls, component: Any, *fields: str) -> Optional[Dict[str, Any]]:
+        return cls._pick_stats(component.stats() if component is not None else None, *fields)
+    
+    @staticmethod
+    def _pick_stats(stats: Optional[Dict[str, Any]], *fields: str) -> Optional[Dict[str, Any]]:
+        return {field: stats[field] for field in fields} if stats is not None else None
+    
+    def queue_depths(self) -> Dict[str, int]:
+        """Запросы, ожидающие микро-батча, слота допуска и исполнителя"""
+        return {
+            "batcher": self.batcher.queue_depth if self.batcher is not None else 0,
+            "admission": self.admission.waiting if self.admission is not None else 0,
+            "executor": self.executor_pending,
+        }
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self.phase == "ready"
+    
+    @property
+    def is_loading(self) -> bool:
+        return self.phase not in ("pending", "ready", "failed")
+    
+    def _set_stage(self, stage: str):
+        """Переход к следующему этапу загрузки с фиксацией длительности предыдущего"""
+        now = time.perf_counter()
+        if self.phase != "pending":
+            self.stage_timings[self.phase] = now - self._stage_started
+        self._stage_started = now
+        self.phase = stage
     
     def _load_model(self):
-        """Загрузка модели и токенизатора"""
+        """Загрузка модели и токенизатора (выполняется в пуле потоков)"""
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Файл модели не найден: {self.model_path}")
+        
+        if not os.path.exists(self.tokenizer_path):
+            raise FileNotFoundError(f"Файл токенизатора не найден: {self.tokenizer_path}")
+        
+        for name, paths in self.model_variants.items():
+            for path in paths:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Файл модели {name} не найден: {path}")
+        
+        # Хеш читает файлы целиком: на холодном старте это заметная доля времени
+        self._set_stage("hashing")
+        self.model_version = self._files_digest(self.model_path, self.tokenizer_path)
+        self.model_versions = {
+            PRIMARY_MODEL: self.model_version,
+            **{name: self._files_digest(*paths) for name, paths in self.model_variants.items()},
+        }
+        
+        if self.pool is not None:
+            # Модель живет только в процессах-воркерах
+            self._set_stage("workers")
+            self.pool.start()
+            return
+        
+        self._set_stage("importing")
+        from predictor.viral_predictor import (
+            configure_buckets,
+            configure_sequence_cache,
+            configure_shadows,
+            load_model_and_tokenizer,
+            load_variant,
+            set_thread_limits
+        )
+        
+        set_thread_limits(self.intra_op_threads, self.inter_op_threads)
+        configure_sequence_cache(self.sequence_cache_size)
+        configure_buckets(self.padding_buckets)
+        load_model_and_tokenizer(self.model_path, self.tokenizer_path, on_stage=self._set_stage)
+        if self.model_variants:
+            self._set_stage("variants")
+            for name, (model_path, tokenizer_path) in self.model_variants.items():
+                load_variant(name, model_path, tokenizer_path)
+        configure_shadows(self.shadow_models)
+    
+    @staticmethod
+    def _files_digest(*paths: str) -> str:
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()[:16]
+    
+    async def _load_in_background(self):
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
         try:
-            from predictor.viral_predictor import load_model_and_tokenizer
-            
-            if not os.path.exists(self.model_path):
-                logger.error(f"❌ Файл модели не найден: {self.model_path}")
-                return
-            
-            if not os.path.exists(self.tokenizer_path):
-                logger.error(f"❌ Файл токенизатора не найден: {self.tokenizer_path}")
-                return
-            
-            load_model_and_tokenizer(self.model_path, self.tokenizer_path)
-            self.is_loaded = True
-            logger.info(f"✅ Модель загружена: {self.model_path}")
-            
+            await loop.run_in_executor(None, self._load_model)
+            if self.store is not None:
+                self._set_stage("store")
+                await self._open_store()
+            self._set_stage("ready")
+            logger.info(
+                f"✅ Модель загружена за {time.perf_counter() - started:.1f} с: {self.model_path}"
+            )
+            if self.watch_interval > 0:
+                self._watcher = asyncio.create_task(self._watch_files())
         except ImportError as e:
+            self.load_error = str(e)
+            self._set_stage("failed")
             logger.error(f"❌ Не могу импортировать viral_predictor: {e}")
         except Exception as e:
+            self.load_error = str(e)
+            self._set_stage("failed")
             logger.error(f"❌ Ошибка загрузки модели: {e}")
+        finally:
+            self._ready.set()
     
-    async def predict(self, text: str, threshold: float = 0.5) -> Dict[str, Any]:
+    async def _open_store(self):
+        try:
+            await self.store.open()
+        except Exception as e:
+            # Без хранилища бот работает, просто без персистентных оценок
+            logger.error(f"❌ Не удалось открыть хранилище оценок: {e}")
+            self.store = None
+    
+    async def reload(
+        self,
+        model_path: Optional[str] = None,
+        tokenizer_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Горячая замена основной модели без остановки обслуживания
+        
+        Новая модель загружается и прогревается в фоне, пока запросы
+        считает прежняя. Затем новые запросы атомарно переходят на нее
+        вместе с версией в ключах кэшей и хранилища, а прежняя
+        освобождается, когда досчитаются начатые на ней вызовы (не
+        дольше reload_drain_timeout секунд). Пока в памяти обе модели,
+        RSS ограничен reload_max_rss_mb: при его превышении замена
+        отменяется (MemoryError), а запросы продолжает считать прежняя.
+        В режиме пула процессов так же перекатывается весь пул.
+        
+        Returns:
+            отчет: "outcome" ("reloaded" или "unchanged", если файлы те же),
+            "version", "seconds", "peak_rss_mb", "rss_after_mb" и "drained" -
+            освобождена ли прежняя модель
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Модель еще не загружена")
+        if self._reload_lock.locked():
+            raise RuntimeError("Замена модели уже выполняется")
+        
+        async with self._reload_lock:
+            try:
+                report = await self._reload(
+                    model_path or self.model_path, tokenizer_path or self.tokenizer_path
+                )
+            except Exception:
+                RELOADS.inc(outcome="failed")
+                raise
+            finally:
+                self.reload_phase = None
+            # И после /reload с другими путями: слежение сравнивает с файлами активной модели
+            self._files_seen = self._files_stamp()
+        RELOADS.inc(outcome=report["outcome"])
+        if report["outcome"] == "reloaded":
+            self.last_reload = report
+        return report
+    
+    async def _reload(self, model_path: str, tokenizer_path: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        for path in (model_path, tokenizer_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Файл не найден: {path}")
+        
+        self.reload_phase = "hashing"
+        version = await loop.run_in_executor(None, self._files_digest, model_path, tokenizer_path)
+        report = {"outcome": "unchanged", "version": version, "model_path": model_path}
+        if version == self.model_version and (model_path, tokenizer_path) == (self.model_path, self.tokenizer_path):
+            return report
+        
+        logger.info(f"🔄 Горячая замена модели: {model_path}")
+        started = time.perf_counter()
+        max_rss_mb = self.reload_max_rss_mb or None
+        
+        if self.pool is not None:
+            self.reload_phase = "workers"
+            executor, worker_rss_mb, peak_rss_mb = await loop.run_in_executor(
+                None, self.pool.prepare, model_path, tokenizer_path, max_rss_mb
+            )
+            previous = self.pool.activate(executor, worker_rss_mb, model_path, tokenizer_path)
+            retire = functools.partial(self.pool.retire, previous)
+        else:
+            from predictor.viral_predictor import activate_model, prepare_model, retire_model
+            
+            loaded = await loop.run_in_executor(None, functools.partial(
+                prepare_model, model_path, tokenizer_path,
+                on_stage=self._set_reload_phase, max_rss_mb=max_rss_mb
+            ))
+            peak_rss_mb = loaded.peak_rss_mb
+            previous = activate_model(loaded)
+            retire = functools.partial(retire_model, previous, self.reload_drain_timeout)
+        
+        # Сразу после переключения, без await: новые запросы не попадут
+        # в кэш под прежней версией
+        self.model_path, self.tokenizer_path = model_path, tokenizer_path
+        self.model_version = self.model_versions[PRIMARY_MODEL] = version
+        seconds = time.perf_counter() - started
+        
+        self.reload_phase = "draining"
+        drained = await loop.run_in_executor(None, retire)
+        
+        report.update(
+            outcome="reloaded",
+            seconds=seconds,
+            peak_rss_mb=peak_rss_mb,
+            rss_after_mb=self._total_rss_mb(),
+            drained=drained is not False,
+            finished_at=time.time(),
+        )
+        logger.info(
+            f"✅ Модель заменена за {seconds:.1f} с: {model_path}"
+            + ("" if report["drained"] else " (прежняя модель еще занята запросами)")
+        )
+        return report
+    
+    def _set_reload_phase(self, stage: str):
+        self.reload_phase = stage
+    
+    def _total_rss_mb(self) -> Optional[float]:
+        """RSS бота вместе с процессами-воркерами, МБ"""
+        rss = process_rss_mb()
+        if rss is not None and self.pool is not None and self.pool.worker_rss_mb is not None:
+            rss += self.pool.worker_rss_mb
+        return rss
+    
+    def _files_stamp(self) -> Optional[Tuple[Tuple[int, int], ...]]:
+        try:
+            return tuple(
+                (stat.st_mtime_ns, stat.st_size)
+                for stat in map(os.stat, (self.model_path, self.tokenizer_path))
+            )
+        except OSError:
+            return None
+    
+    async def _watch_files(self):
+        """Замена модели при изменении ее файлов (опрос раз в watch_interval секунд)"""
+        self._files_seen = self._files_stamp()
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            current = self._files_stamp()
+            if current is None or current == self._files_seen:
+                continue
+            # Файл может еще копироваться: ждем, пока он перестанет меняться
+            await asyncio.sleep(self.watch_interval)
+            if self._files_stamp() != current:
+                continue
+            # Неудачная замена не повторяется, пока файлы не изменятся снова
+            self._files_seen = current
+            try:
+                # Отмена слежения (close) не прерывает начатую замену
+                await asyncio.shield(self.reload())
+            except Exception as e:
+                logger.error(f"❌ Не удалось заменить модель: {e}")
+    
+    def _ensure_loading(self):
+        if self._loading_task is None:
+            self._ready = asyncio.Event()
+            self._loading_task = asyncio.create_task(self._load_in_background())
+    
+    def sequence_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Счетчики кэша по входу модели
+        
+        При включенном текстовом кэше каждый запрос сюда - это промах
+        текстового кэша, так что hits показывает, сколько таких промахов
+        все же обошлись без модели. В режиме пула процессов кэши живут
+        в воркерах и здесь недоступны.
+        """
+        if self.pool is not None or not self.is_loaded:
+            return None
+        from predictor.viral_predictor import sequence_cache_stats
+        return sequence_cache_stats()
+    
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание окончания загрузки; True, если модель готова"""
+        self._ensure_loading()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready.wait()), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.is_loaded
+    
+    async def predict(
+        self,
+        text: str,
+        threshold: float = 0.5,
+        deadline: Optional[float] = None,
+        user_id: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         Предсказание виральности текста
         
         Args:
             text: Текст для анализа
             threshold: Порог виральности (0-1)
+            deadline: Unix-время, после которого ответ уже не нужен
+            user_id: id пользователя для выбора модели A/B (см. route)
             
         Returns:
             Словарь с результатами предсказания
         """
-        if not self.is_loaded:
-            return {
-                "error": "Модель не загружена",
-                "score": 0.5,
-                "is_viral": False,
-                "confidence": 0.0,
-                "text_length": len(text)
-            }
+        started = time.perf_counter()
+        result = await self._predict(text, threshold, deadline, self.route(user_id))
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="predict")
+        REQUESTS.inc(result=self._outcome(result))
+        return result
+    
+    @staticmethod
+    def _outcome(result: Dict[str, Any]) -> str:
+        for flag in ("overloaded", "expired", "warming_up"):
+            if result.get(flag):
+                return flag
+        return "error" if "error" in result else "ok"
+    
+    async def _predict(
+        self,
+        text: str,
+        threshold: float,
+        deadline: Optional[float],
+        model: str = PRIMARY_MODEL
+    ) -> Dict[str, Any]:
+        if not self.is_loaded and not await self.wait_ready(self.warmup_wait):
+            return self._not_ready_result(text)
         
-        if not text or len(text.strip()) < 10:
-            return {
-                "error": "Текст слишком короткий",
-                "score": 0.5,
-                "is_viral": False,
-                "confidence": 0.0,
-                "text_length": len(text)
-            }
+        error = self._validate(text)
+        if error:
+            return self._error_result(error, text)
         
         try:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                self._sync_predict,
-                text,
-                threshold
-            )
+            if self.cache is not None:
+                # Порог влияет на is_viral и message, поэтому он часть ключа
+                key = (text_key(text, self.model_versions[model]), threshold)
+                result = await self.cache.get_or_compute(
+                    key,
+                    lambda: self._lookup_or_infer(text, threshold, deadline, model),
+                    retry_on=REQUEST_ERRORS
+                )
+            else:
+                result = await self._lookup_or_infer(text, threshold, deadline, model)
             
-            result["text_length"] = len(text)
-            result["text_sample"] = text[:150] + "..." if len(text) > 150 else text
+            # Копия: результат из кэша разделяется между запросами
+            return self._with_text_info(dict(result), text)
             
+        except Exception as e:
+            return self._exception_result(e, text)
+    
+    def _exception_result(self, error: Exception, text: str) -> Dict[str, Any]:
+        """Ответ на сбой запроса: перегрузка, устаревший запрос или ошибка модели"""
+        if isinstance(error, Overloaded):
+            result = self._error_result(str(error), text)
+            result["overloaded"] = True
+            result["retry_after"] = error.retry_after
             return result
-            
+        if isinstance(error, RequestExpired):
+            result = self._error_result("Запрос устарел", text)
+            result["expired"] = True
+            return result
+        logger.error(f"Ошибка предсказания: {error}")
+        return self._error_result(str(error), text)
+    
+    async def explain(
+        self,
+        text: str,
+        threshold: float = 0.5,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Предсказание с вкладом слов в оценку (explain_viral)
+        
+        Returns:
+            Словарь как у predict, дополнительно attributions, window и truncated
+        """
+        return await self._analyze("explain", text, threshold, deadline)
+    
+    async def optimize(
+        self,
+        text: str,
+        threshold: float = 0.5,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Предсказание и поиск лучших правок текста (optimize_post)
+        
+        Returns:
+            Словарь как у predict, дополнительно candidates и evaluated
+        """
+        return await self._analyze("optimize", text, threshold, deadline)
+    
+    async def _analyze(
+        self,
+        kind: str,
+        text: str,
+        threshold: float,
+        deadline: Optional[float]
+    ) -> Dict[str, Any]:
+        """
+        Анализ одного текста (run_analysis): все варианты текста считаются
+        пакетами под одним слотом допуска, а результат кэшируется по
+        тексту и версии модели
+        """
+        started = time.perf_counter()
+        result = await self._analysis_result(kind, text, threshold, deadline)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=kind)
+        REQUESTS.inc(result=self._outcome(result))
+        return result
+    
+    async def _analysis_result(
+        self,
+        kind: str,
+        text: str,
+        threshold: float,
+        deadline: Optional[float]
+    ) -> Dict[str, Any]:
+        if not self.is_loaded and not await self.wait_ready(self.warmup_wait):
+            return self._not_ready_result(text)
+        
+        error = self._validate(text)
+        if error:
+            return self._error_result(error, text)
+        
+        try:
+            cache = self.analysis_caches.get(kind)
+            if cache is not None:
+                key = (text_key(text, self.model_version), threshold)
+                result = await cache.get_or_compute(
+                    key,
+                    lambda: self._admitted_analysis(kind, text, threshold, deadline),
+                    retry_on=REQUEST_ERRORS
+                )
+            else:
+                result = await self._admitted_analysis(kind, text, threshold, deadline)
+            return self._with_text_info(dict(result), text)
         except Exception as e:
-            logger.error(f"Ошибка предсказания: {e}")
-            return {
-                "error": str(e),
-                "score": 0.5,
-                "is_viral": False,
-                "confidence": 0.0,
-                "text_length": len(text)
-            }
-    
-    def _sync_predict(self, text: str, threshold: float) -> Dict[str, Any]:
+            return self._exception_result(e, text)
+    
+    async def _admitted_analysis(
+        self,
+        kind: str,
+        text: str,
+        threshold: float,
+        deadline: Optional[float]
+    ) -> Dict[str, Any]:
+        if self.admission is None:
+            return await self._analysis_one(kind, text, threshold)
+        async with self.admission.slot(deadline):
+            return await self._analysis_one(kind, text, threshold)
+    
+    async def _analysis_one(self, kind: str, text: str, threshold: float) -> Dict[str, Any]:
+        options = self.analysis_options[kind]
+        if self.pool is not None:
+            self.executor_pending += 1
+            try:
+                result = await self.pool.analyze(kind, text, threshold, options)
+            finally:
+                self.executor_pending -= 1
+        else:
+            result = await self._run_in_executor(run_analysis, kind, text, threshold, options)
+        return self._format_analysis(result, threshold)
+    
+    @classmethod
+    def _format_analysis(cls, result: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+        """Результат как у predict и поля, которые добавляет сам анализ"""
+        formatted = cls._format_result(result, threshold)
+        for field, value in result.items():
+            if field not in ANALYSIS_BASE_FIELDS:
+                formatted[field] = value
+        return formatted
+    
+    async def _lookup_or_infer(
+        self,
+        text: str,
+        threshold: float,
+        deadline: Optional[float] = None,
+        model: str = PRIMARY_MODEL
+    ) -> Dict[str, Any]:
+        """Оценка из хранилища на диске, а при ее отсутствии - из модели"""
+        if self.store is None:
+            return await self._admitted_infer(text, threshold, deadline, model)
+        
+        key = (text_hash(text), self.model_versions[model], threshold)
+        result = await self.store.get(key)
+        if result is None:
+            result = await self._admitted_infer(text, threshold, deadline, model)
+            self.store.put(key, result)
+        return result
+    
+    async def _admitted_infer(
+        self,
+        text: str,
+        threshold: float,
+        deadline: Optional[float],
+        model: str = PRIMARY_MODEL
+    ) -> Dict[str, Any]:
+        """Инференс под контролем допуска: попадания в кэши его не проходят"""
+        if self.admission is None:
+            return await self._infer_one(text, threshold, model)
+        async with self.admission.slot(deadline):
+            return await self._infer_one(text, threshold, model)
+    
+    async def _infer_one(self, text: str, threshold: float, model: str = PRIMARY_MODEL) -> Dict[str, Any]:
+        if self.batcher is not None:
+            return await self.batcher.submit(text, threshold, model)
+        if self.pool is not None:
+            return (await self._predict_batch([text], threshold, [model]))[0]
+        
+        return await self._run_in_executor(self._sync_predict, text, threshold, model)
+    
+    async def _run_in_executor(self, fn: Callable, *args) -> Any:
+        """Запуск в пуле потоков с учетом ожидающих вызовов (метрика очереди)"""
+        loop = asyncio.get_event_loop()
+        self.executor_pending += 1
+        try:
+            return await loop.run_in_executor(None, fn, *args)
+        finally:
+            self.executor_pending -= 1
+    
+    def _validate(self, text: str) -> Optional[str]:
+        """Возвращает текст ошибки, если запрос нельзя отправить в модель"""
+        if not self.is_loaded:
+            return "Модель не загружена"
+        if not text or len(text.strip()) < 10:
+            return "Текст слишком короткий"
+        return None
+    
+    @staticmethod
+    def _error_result(error: str, text: str) -> Dict[str, Any]:
+        return {
+            "error": error,
+            "score": 0.5,
+            "is_viral": False,
+            "confidence": 0.0,
+            "text_length": len(text or "")
+        }
+    
+    def _not_ready_result(self, text: str) -> Dict[str, Any]:
+        if self.phase == "failed":
+            return self._error_result("Модель не загружена", text)
+        result = self._error_result("Модель прогревается", text)
+        result["warming_up"] = True
+        return result
+    
+    @staticmethod
+    def _with_text_info(result: Dict[str, Any], text: str) -> Dict[str, Any]:
+        result["text_length"] = len(text)
+        result["text_sample"] = text[:150] + "..." if len(text) > 150 else text
+        return result
+    
+    def _sync_predict(self, text: str, threshold: float, model: str = PRIMARY_MODEL) -> Dict[str, Any]:
         """Синхронное предсказание (вызывается в отдельном потоке)"""
         from predictor.viral_predictor import predict_viral
         
-        result = predict_viral(text, threshold)
+        result = predict_viral(text, threshold, model)
+        
+        return self._format_result(result, threshold)
+    
+    async def _predict_batch(
+        self,
+        texts: List[str],
+        threshold: float,
+        models: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Пакет уходит в пул процессов, если он включен, иначе в пул потоков;
+        models - модель для каждого текста (None - основная)
+        """
+        if self.pool is not None:
+            self.executor_pending += 1
+            try:
+                results = await self.pool.predict_batch(texts, threshold, models)
+            finally:
+                self.executor_pending -= 1
+            return [self._format_result(result, threshold) for result in results]
+        
+        return await self._run_in_executor(self._sync_predict_batch, texts, threshold, models)
+    
+    def _sync_predict_batch(
+        self,
+        texts: List[str],
+        threshold: float,
+        models: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Синхронное пакетное предсказание одним вызовом модели"""
+        from predictor.viral_predictor import predict_viral_batch
+        
+        results = predict_viral_batch(texts, threshold, models=models)
         
+        return [self._format_result(result, threshold) for result in results]
+    
+    @staticmethod
+    def _format_result(result: Dict[str, Any], threshold: float) -> Dict[str, Any]:
         confidence = abs(result['probability'] - 0.5) * 2 
         
         return {
@@ -112,10 +1015,119 @@ class PredictorService:
             "confidence": float(confidence),
             "message": str(result['message']),
             "threshold": float(threshold),
+            "model": result.get("model", PRIMARY_MODEL),
             "original_result": result
         }
     
-    async def batch_predict(self, texts: list, threshold: float = 0.5) -> list:
-        """Пакетное предсказание"""
-        tasks = [self.predict(text, threshold) for text in texts]
-        return await asyncio.gather(*tasks)
\ No newline at end of file
+    async def batch_predict(
+        self,
+        texts: list,
+        threshold: float = 0.5,
+        deadline: Optional[float] = None,
+        user_id: Optional[int] = None
+    ) -> list:
+        """
+        Пакетное предсказание
+        
+        Модель выбирается так же, как в predict (route), готовые оценки
+        берутся из кэша и хранилища на диске, а остальные тексты уходят в
+        модель одним вызовом predict_viral_batch (с разбиением на блоки
+        внутри), минуя очередь микро-батчинга, но под слотом допуска с
+        весом по числу текстов.
+        """
+        if not self.is_loaded and not await self.wait_ready(self.warmup_wait):
+            return [self._not_ready_result(text) for text in texts]
+        
+        model = self.route(user_id)
+        version = self.model_versions[model]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        indices = []
+        
+        for i, text in enumerate(texts):
+            error = self._validate(text)
+            if error:
+                results[i] = self._error_result(error, texts[i])
+                continue
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get((text_key(text, version), threshold))
+            if cached is not None:
+                results[i] = self._with_text_info(dict(cached), text)
+            else:
+                indices.append(i)
+        
+        keys = []
+        if indices and self.store is not None:
+            # Уже оцененные тексты берем с диска, в модель идут только остальные
+            keys = [(text_hash(texts[i]), version, threshold) for i in indices]
+            stored = await self.store.get_many(keys)
+            for i, result in zip(indices, stored):
+                if result is not None:
+                    self._remember(texts[i], version, threshold, result)
+                    results[i] = self._with_text_info(dict(result), texts[i])
+            keys = [key for key, result in zip(keys, stored) if result is None]
+            indices = [i for i in indices if results[i] is None]
+        
+        if indices:
+            valid_texts = [texts[i] for i in indices]
+            try:
+                batch_results = await self._admitted_batch(valid_texts, threshold, deadline, model)
+                if self.store is not None:
+                    self.store.put_many(zip(keys, batch_results))
+                for i, result in zip(indices, batch_results):
+                    self._remember(texts[i], version, threshold, result)
+                    results[i] = self._with_text_info(dict(result), texts[i])
+            except REQUEST_ERRORS as e:
+                for i in indices:
+                    results[i] = self._exception_result(e, texts[i])
+            except Exception as e:
+                logger.error(f"Ошибка пакетного предсказания: {e}")
+                for i in indices:
+                    results[i] = self._error_result(str(e), texts[i])
+        
+        return results
+    
+    async def _admitted_batch(
+        self,
+        texts: List[str],
+        threshold: float,
+        deadline: Optional[float],
+        model: str
+    ) -> List[Dict[str, Any]]:
+        if self.admission is None:
+            return await self._predict_batch(texts, threshold, [model] * len(texts))
+        async with self.admission.slot(deadline, weight=len(texts)):
+            return await self._predict_batch(texts, threshold, [model] * len(texts))
+    
+    def _remember(self, text: str, version: str, threshold: float, result: Dict[str, Any]):
+        """Результат пакета в кэш текстов: повторный predict его не пересчитывает"""
+        if self.cache is not None:
+            self.cache.set((text_key(text, version), threshold), result)
+    
+    async def start(self):
+        """
+        Запуск фоновой загрузки модели
+        
+        Вызывается из startup-хука диспетчера и сразу возвращает управление,
+        поэтому поллинг начинается, не дожидаясь TensorFlow. Загрузка не
+        выполняется при импорте еще и потому, что при методе запуска spawn
+        процессы-воркеры заново импортируют главный модуль.
+        """
+        self._ensure_loading()
+    
+    async def close(self):
+        """Остановка слежения за файлами модели, очереди батчинга, пула процессов и хранилища оценок"""
+        if self._loading_task is not None and not self._loading_task.done():
+            await asyncio.wait([self._loading_task])
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        # Начатая замена доводится до конца: иначе новый пул останется без владельца
+        async with self._reload_lock:
+            pass
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.store is not None:
+            await self.store.close()
@@ -0,0 +1,223 @@
+# bot/services/score_store.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Поля результата, которые сохраняются на диск (исходный текст не храним)
+STORED_FIELDS = ("score", "is_viral", "probability", "confidence", "message", "threshold", "model")
+
+Key = Tuple[str, str, float]  # (хеш текста, версия модели, порог)
+
+class ScoreStore:
+    """
+    Персистентное хранилище оценок на SQLite в режиме WAL
+
+    WAL позволяет нескольким процессам бота читать базу одновременно с
+    записью. Все обращения к соединению идут через один выделенный поток,
+    запись копится в памяти и сбрасывается пакетами по flush_interval
+    секунд или по batch_size записей. Если запись не удалась, пакет
+    остается в очереди до следующего сброса; сверх max_pending записей
+    очередь не растет, а лишние оценки считаются потерянными (dropped).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        batch_size: int = 256,
+        max_age: float = 30 * 86400,
+        compact_interval: float = 6 * 3600,
+        max_pending: int = 10000
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.compact_interval = compact_interval
+        self.max_pending = max(batch_size, max_pending)
+
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.dropped = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="score-store")
+        self._pending: Dict[Key, Tuple[Dict[str, Any], float]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def open(self):
+        """Открытие базы, компактация и запуск фонового сброса записей"""
+        await self._call(self._open)
+        await self.compact()
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " text_hash TEXT NOT NULL,"
+            " model_version TEXT NOT NULL,"
+            " threshold REAL NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (text_hash, model_version, threshold)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    async def get(self, key: Key) -> Optional[Dict[str, Any]]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: List[Key]) -> List[Optional[Dict[str, Any]]]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            pending = self._pending.get(key)
+            if pending is not None:
+                results[i] = dict(pending[0])
+            else:
+                missing.append(i)
+
+        if missing and self._conn is not None:
+            rows = await self._call(self._select, [keys[i] for i in missing])
+            for i, row in zip(missing, rows):
+                results[i] = row
+
+        found = sum(result is not None for result in results)
+        self.hits += found
+        self.misses += len(keys) - found
+        return results
+
+    def _select(self, keys: List[Key]) -> List[Optional[Dict[str, Any]]]:
+        rows = []
+        for key in keys:
+            row = self._conn.execute(
+                "SELECT result FROM scores WHERE text_hash = ? AND model_version = ? AND threshold = ?",
+                key
+            ).fetchone()
+            rows.append(json.loads(row[0]) if row else None)
+        return rows
+
+    def put(self, key: Key, result: Dict[str, Any]):
+        """Постановка результата в очередь на запись (без ожидания диска)"""
+        self._pending[key] = ({field: result[field] for field in STORED_FIELDS if field in result}, time.time())
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def put_many(self, items: Iterable[Tuple[Key, Dict[str, Any]]]):
+        for key, result in items:
+            self.put(key, result)
+
+    async def flush(self):
+        if not self._pending or self._conn is None:
+            return
+        batch, self._pending = self._pending, {}
+        rows = [
+            (*key, json.dumps(result, ensure_ascii=False), created_at)
+            for key, (result, created_at) in batch.items()
+        ]
+        try:
+            await self._call(self._insert, rows)
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            # Более новые оценки тех же ключей, пришедшие за время записи, важнее
+            for key, item in batch.items():
+                if key in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    continue
+                self._pending[key] = item
+            logger.error(f"❌ Ошибка записи в хранилище оценок, повтор при следующем сбросе: {e}")
+
+    def _insert(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scores"
+                " (text_hash, model_version, threshold, result, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    async def compact(self):
+        """
+        Удаление оценок старше max_age
+
+        Оценки других версий модели не удаляются: базу делят процессы и
+        реплики, которые могут работать на разных версиях (A/B, поэтапная
+        выкатка, горячая замена), а оценки версии, которую больше никто
+        не использует, уходят по возрасту.
+        """
+        deleted = await self._call(self._compact, time.time() - self.max_age)
+        if deleted:
+            logger.info(f"🧹 Хранилище оценок: удалено {deleted} устаревших записей")
+
+    def _compact(self, min_created_at: float) -> int:
+        with self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM scores WHERE created_at < ?", (min_created_at,)
+            ).rowcount
+        # Усекаем WAL, чтобы файл журнала не рос бесконечно
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    async def _flush_loop(self):
+        last_compact = time.monotonic()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+            if time.monotonic() - last_compact > self.compact_interval:
+                await self.compact()
+                last_compact = time.monotonic()
+
+    async def close(self):
+        # Цикл останавливается флагом, а не cancel(): wait_for может
+        # проглотить отмену, если событие сработало одновременно с ней,
+        # а отмена посреди flush потеряла бы пакет
+        if self._flusher is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+        if self._conn is not None:
+            await self._call(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
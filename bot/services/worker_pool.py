@@ -0,0 +1,264 @@
+# bot/services/worker_pool.py
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+def _init_worker(
+    model_path: str,
+    tokenizer_path: str,
+    intra_op_threads: int,
+    inter_op_threads: int,
+    sequence_cache_size: int,
+    padding_buckets: tuple,
+    variants: Dict[str, Tuple[str, str]],
+    shadows: Sequence[str]
+):
+    """Инициализация процесса-воркера: модели и токенизаторы грузятся один раз"""
+    from predictor.viral_predictor import (
+        configure_buckets,
+        configure_sequence_cache,
+        configure_shadows,
+        load_model_and_tokenizer,
+        load_variant,
+        set_thread_limits
+    )
+
+    set_thread_limits(intra_op_threads, inter_op_threads)
+    configure_sequence_cache(sequence_cache_size)
+    configure_buckets(padding_buckets)
+    load_model_and_tokenizer(model_path, tokenizer_path)
+    for name, (variant_model_path, variant_tokenizer_path) in variants.items():
+        load_variant(name, variant_model_path, variant_tokenizer_path)
+    configure_shadows(shadows)
+
+def process_rss_mb(pid: str = "self") -> Optional[float]:
+    """RSS процесса, МБ (None вне Linux или если процесс уже завершился)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+
+def _worker_ping() -> Tuple[int, Optional[float]]:
+    return os.getpid(), process_rss_mb()
+
+def _worker_predict_batch(
+    texts: List[str],
+    threshold: float,
+    models: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    from predictor.viral_predictor import predict_viral_batch
+
+    return predict_viral_batch(texts, threshold, models=models)
+
+def run_analysis(kind: str, text: str, threshold: float, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Анализ одного текста: "explain" - вклад слов (explain_viral),
+    "optimize" - поиск лучших правок (optimize_post). Вызывается в
+    воркере пула или в пуле потоков сервиса
+    """
+    if kind == "optimize":
+        from predictor.post_optimizer import optimize_post
+
+        return optimize_post(text, threshold, **options)
+
+    from predictor.viral_predictor import explain_viral
+
+    return explain_viral(text, threshold, **options)
+
+class InferencePool:
+    """
+    Пул процессов для инференса в обход GIL
+
+    Каждый воркер держит свою копию модели. Если воркер падает, пул
+    помечается сломанным (BrokenProcessPool) - тогда он пересоздается,
+    а запрос повторяется один раз.
+
+    Горячая замена модели - перекат на новый пул: prepare поднимает
+    воркеры с новой моделью рядом со старыми, activate направляет на них
+    новые запросы, retire дожидается запросов старого пула и завершает
+    его процессы вместе с моделью.
+    """
+
+    # Минимальный кусок пакета, который имеет смысл отдавать отдельному воркеру
+    MIN_SLICE_SIZE = 64
+
+    def __init__(
+        self,
+        model_path: str,
+        tokenizer_path: str,
+        workers: int = 0,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        sequence_cache_size: int = 50000,
+        padding_buckets: tuple = (32, 64, 128, 200),
+        variants: Optional[Dict[str, Tuple[str, str]]] = None,
+        shadows: Sequence[str] = ()
+    ):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.workers = workers or os.cpu_count() or 1
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.sequence_cache_size = sequence_cache_size
+        self.padding_buckets = tuple(padding_buckets)
+        self.variants = dict(variants or {})
+        self.shadows = tuple(shadows)
+        self.restarts = 0
+        # Суммарный RSS воркеров после загрузки модели, МБ
+        self.worker_rss_mb: Optional[float] = None
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._restart_lock = threading.Lock()
+
+    def start(self):
+        """Создание процессов и ожидание загрузки модели во всех воркерах"""
+        self._executor, self.worker_rss_mb = self._spawn(self.model_path, self.tokenizer_path)
+
+    def _spawn(self, model_path: str, tokenizer_path: str) -> Tuple[ProcessPoolExecutor, Optional[float]]:
+        """Новый пул с загруженной моделью и суммарный RSS его воркеров"""
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # fork после импорта TensorFlow небезопасен
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                model_path,
+                tokenizer_path,
+                self.intra_op_threads,
+                self.inter_op_threads,
+                self.sequence_cache_size,
+                self.padding_buckets,
+                self.variants,
+                self.shadows
+            )
+        )
+        try:
+            # Каждый submit без свободного воркера порождает новый процесс,
+            # так что все воркеры поднимаются сразу, а не на первых запросах
+            pings = [executor.submit(_worker_ping) for _ in range(self.workers)]
+            rss = dict(ping.result() for ping in pings)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        logger.info(f"✅ Пул инференса запущен: {len(rss)} процессов")
+        if None in rss.values():
+            return executor, None
+        return executor, sum(rss.values())
+
+    def prepare(
+        self,
+        model_path: str,
+        tokenizer_path: str,
+        max_rss_mb: Optional[float] = None
+    ) -> Tuple[ProcessPoolExecutor, Optional[float], float]:
+        """
+        Пул с новой моделью рядом с текущим (запросы идут в текущий):
+        (пул, RSS его воркеров, RSS бота со старыми и новыми воркерами), МБ
+
+        Старые и новые воркеры живут одновременно до retire, поэтому
+        лимит max_rss_mb (МБ, на бота и все воркеры) проверяется заранее
+        по RSS текущих воркеров и еще раз после загрузки.
+        """
+        main_rss = process_rss_mb() or 0.0
+        if max_rss_mb and self.worker_rss_mb is not None:
+            projected = main_rss + 2 * self.worker_rss_mb
+            if projected > max_rss_mb:
+                raise MemoryError(
+                    f"Перекат пула превысит лимит памяти: ~{projected:.0f} из {max_rss_mb:.0f} МБ"
+                )
+
+        executor, rss = self._spawn(model_path, tokenizer_path)
+        total = main_rss + (self.worker_rss_mb or 0.0) + (rss or 0.0)
+        if max_rss_mb and total > max_rss_mb:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise MemoryError(f"Новый пул превысил лимит памяти: {total:.0f} из {max_rss_mb:.0f} МБ")
+        return executor, rss, total
+
+    def activate(
+        self,
+        executor: ProcessPoolExecutor,
+        worker_rss_mb: Optional[float],
+        model_path: str,
+        tokenizer_path: str
+    ) -> Optional[ProcessPoolExecutor]:
+        """Переключение новых запросов на пул из prepare; возвращает прежний"""
+        previous, self._executor = self._executor, executor
+        self.worker_rss_mb = worker_rss_mb
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        return previous
+
+    @staticmethod
+    def retire(executor: ProcessPoolExecutor):
+        """Завершение прежнего пула после выполнения уже отправленных в него запросов"""
+        executor.shutdown(wait=True)
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # Пересоздаем пул только один раз, даже если упали сразу несколько
+        # запросов: остальные ждут на блокировке, пока поднимается новый пул,
+        # и после нее видят, что сломанный уже заменен
+        with self._restart_lock:
+            if self._executor is not broken:
+                return
+            logger.error("❌ Воркер инференса упал, пул перезапускается")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.restarts += 1
+            self.start()
+
+    async def predict_batch(
+        self,
+        texts: List[str],
+        threshold: float,
+        models: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Пакетное предсказание; крупные пакеты делятся между воркерами"""
+        slice_size = max(self.MIN_SLICE_SIZE, math.ceil(len(texts) / self.workers))
+        starts = range(0, len(texts), slice_size)
+
+        parts = await asyncio.gather(*(
+            self._submit(
+                _worker_predict_batch,
+                texts[i:i + slice_size],
+                threshold,
+                None if models is None else models[i:i + slice_size]
+            )
+            for i in starts
+        ))
+        return [result for part in parts for result in part]
+
+    async def analyze(
+        self,
+        kind: str,
+        text: str,
+        threshold: float,
+        options: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Анализ одного текста (run_analysis): все его варианты считает один воркер"""
+        return await self._submit(run_analysis, kind, text, threshold, options)
+
+    async def _submit(self, fn, *args) -> Any:
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                await loop.run_in_executor(None, self._restart, executor)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,175 @@
+# bot/webhook.py
+import asyncio
+import logging
+import signal
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from predictor.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class WebhookServer:
+    """
+    Прием апдейтов по вебхуку на встроенном aiohttp-сервере
+
+    Апдейт подтверждается ответом 200 сразу после постановки в обработку,
+    сам обработчик выполняется в фоне. Одновременно обрабатывается не
+    больше max_concurrent апдейтов: когда все слоты заняты, ответ Telegram
+    задерживается до освобождения слота (backpressure), и новые апдейты
+    копятся на стороне Telegram, а не в памяти бота.
+
+    При остановке сервер перестает принимать соединения и ждет завершения
+    начатых обработчиков не дольше drain_timeout секунд.
+    """
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        path: str = "/webhook",
+        secret_token: Optional[str] = None,
+        max_concurrent: int = 256,
+        drain_timeout: float = 30.0
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token or None
+        self.max_concurrent = max(1, max_concurrent)
+        self.drain_timeout = drain_timeout
+
+        self.received = 0
+        self.failed = 0
+        self.rejected = 0
+
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+        self._draining = False
+
+        REGISTRY.gauge(
+            "viral_webhook_in_flight", "Апдейты, принятые по вебхуку и еще обрабатываемые",
+            lambda: len(self._tasks)
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get(self.SECRET_HEADER) != self.secret_token:
+            return web.Response(status=401)
+        if self._draining:
+            # Telegram повторит апдейт позже (или его примет другая реплика)
+            return web.Response(status=503)
+
+        try:
+            # JSONDecodeError и UnicodeDecodeError - подклассы ValueError
+            update = await request.json()
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            self.rejected += 1
+            logger.warning("⚠️ Вебхук: тело запроса - не объект JSON")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        if self._draining:
+            self._slots.release()
+            return web.Response(status=503)
+        self.received += 1
+
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return web.Response()
+
+    async def _process(self, update: dict):
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🌐 Вебхук слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Прекращение приема апдейтов и ожидание начатых обработчиков"""
+        self._draining = True
+        if self._runner is not None:
+            # Закрывает слушающий сокет; запросы, уже ждущие слота, получат ответ
+            for site in list(self._runner.sites):
+                await site.stop()
+
+        if self._tasks:
+            logger.info(f"⏳ Дожидаемся {len(self._tasks)} обработчиков (до {self.drain_timeout:.0f} с)")
+            done, pending = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"⚠️ Прервано обработчиков: {len(pending)}")
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    server: WebhookServer,
+    webhook_url: Optional[str] = None
+):
+    """
+    Запуск бота в режиме вебхука до SIGINT/SIGTERM
+
+    Если webhook_url пуст, вебхук в Telegram не регистрируется: его ставят
+    один раз при деплое (например, на адрес балансировщика перед репликами).
+    При остановке вебхук не удаляется, чтобы остальные реплики продолжали
+    получать апдейты.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остановка только по KeyboardInterrupt
+            pass
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        if webhook_url:
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=server.secret_token,
+                max_connections=min(100, server.max_concurrent),
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"🔗 Вебхук зарегистрирован: {webhook_url}")
+        await stop.wait()
+        logger.info("👋 Остановка: завершаем обработку принятых апдейтов")
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
@@ -0,0 +1,410 @@
+# predictor/benchmark.py
+"""
+Офлайн-бенчмарк конвейера предсказания (без бота и токена)
+
+Замеряет холодный старт, задержку одиночного запроса (p50/p95/p99) на
+текстах разной длины до MAX_TEXT_LENGTH, пропускную способность пакетов,
+память процесса и скорость токенизатора.
+
+Старт и память разных бэкендов инференса (Keras, TFLite, NumPy) - каждый
+в отдельном чистом процессе:
+    python -m predictor.benchmark --backends models/complete_model.keras models/complete_model.npz
+
+Запуск из корня проекта:
+    python -m predictor.benchmark --model models/complete_model.keras --output new.json
+
+Сравнение двух сохраненных прогонов или двух коммитов:
+    python -m predictor.benchmark --compare base.json new.json
+    python -m predictor.benchmark --revs HEAD~1 HEAD --model models/complete_model.keras
+
+При --revs оба коммита должны уже содержать этот бенчмарк; при
+ухудшении любой метрики больше --tolerance код выхода 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Как settings.MAX_TEXT_LENGTH: длиннее бот тексты не принимает
+MAX_TEXT_LENGTH = 5000
+# Длины синтетических текстов в символах
+SYNTHETIC_LENGTHS = (50, 300, 1000, MAX_TEXT_LENGTH)
+# Как PADDING_BUCKETS в viral_predictor (импорт модуля здесь исказил бы холодный старт)
+DEFAULT_BUCKETS = (32, 64, 128, 200)
+# Метрики, для которых рост - это улучшение (для остальных рост - регрессия)
+HIGHER_IS_BETTER = ("per_second",)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def measure(fn, runs, warmup=10):
+    """Время одного вызова fn() в секундах для каждого из runs прогонов"""
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def latency_summary(samples):
+    return {f"p{q}_ms": round(percentile_ms(samples, q), 3) for q in (50, 95, 99)}
+
+
+def memory_usage():
+    """Текущий и пиковый RSS процесса, МБ"""
+    # ru_maxrss на Linux в килобайтах, на macOS в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+    usage = {"peak_rss_mb": round(peak_mb, 1)}
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        usage["rss_mb"] = round(pages * os.sysconf("SC_PAGE_SIZE") / (1 << 20), 1)
+    except OSError:
+        pass
+    return usage
+
+
+def synthetic_corpus(words, length, count, seed=0):
+    """count текстов примерно по length символов из слов словаря"""
+    rng = random.Random(f"{seed}-{length}")
+    punctuation = ["", "", "", ",", ".", "!", "?"]
+    texts = []
+    for _ in range(count):
+        tokens, size = [], 0
+        while size < length:
+            word = rng.choice(words) + rng.choice(punctuation)
+            tokens.append(word)
+            size += len(word) + 1
+        texts.append(" ".join(tokens)[:length].strip() or words[0])
+    return texts
+
+
+def load_corpus(path):
+    """Записанные посты: по одному на строку, длиннее MAX_TEXT_LENGTH обрезаются"""
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n")[:MAX_TEXT_LENGTH] for line in f if line.strip()]
+
+
+def bench_cold_start(model_path, tokenizer_path, buckets=None):
+    """Импорт предиктора, загрузка с прогревом (с импортом рантайма бэкенда) и первый запрос"""
+    start = time.perf_counter()
+    from predictor import viral_predictor
+    imported = time.perf_counter()
+    if buckets is not None:
+        viral_predictor.configure_buckets(buckets)
+    viral_predictor.load_model_and_tokenizer(model_path, tokenizer_path)
+    loaded = time.perf_counter()
+    viral_predictor.predict_viral("cold start benchmark request")
+    first = time.perf_counter()
+    return {
+        "import_s": round(imported - start, 3),
+        "load_s": round(loaded - imported, 3),
+        "first_predict_s": round(first - loaded, 3),
+        "total_s": round(first - start, 3),
+    }
+
+
+def bench_backend(model_path, tokenizer_path):
+    """
+    Холодный старт и память бэкенда в отдельном процессе
+
+    В текущем процессе уже могут быть загружены tensorflow и другая
+    модель, поэтому замер делает дочерний процесс с --cold-start-only.
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", "predictor.benchmark", "--cold-start-only",
+         "--model", model_path, "--tokenizer", tokenizer_path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    # Последняя строка - JSON, выше - логи загрузки
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _cold_start_report(model_path, tokenizer_path):
+    report = bench_cold_start(model_path, tokenizer_path)
+    from predictor import viral_predictor
+    report["backend"] = viral_predictor._model.name
+    report["tensorflow_imported"] = "tensorflow" in sys.modules
+    report["memory"] = memory_usage()
+    return report
+
+
+def bench_latency(viral_predictor, corpus, runs):
+    """Задержка predict_viral на одиночных текстах корпуса"""
+    position = itertools.count()
+    samples = measure(lambda: viral_predictor.predict_viral(corpus[next(position) % len(corpus)]), runs)
+    return latency_summary(samples)
+
+
+def bench_throughput(viral_predictor, corpus, batch_size, min_texts=256):
+    """Тексты в секунду для predict_viral_batch блоками по batch_size"""
+    count = max(min_texts, batch_size * 8)
+    texts = [corpus[i % len(corpus)] for i in range(count)]
+    viral_predictor.predict_viral_batch(texts[:batch_size], chunk_size=batch_size)
+
+    start = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        viral_predictor.predict_viral_batch(texts[offset:offset + batch_size], chunk_size=batch_size)
+    return round(count / (time.perf_counter() - start), 1)
+
+
+def bench_tokenizer(viral_predictor, corpus, repeats=3):
+    """Токены в секунду для нормализации, токенизации и паддинга без модели"""
+    cleaned = [" ".join(text.lower().split()) for text in corpus]
+    out = np.zeros((len(cleaned), viral_predictor.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    total_tokens = sum(len(text.split()) for text in cleaned)
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        viral_predictor._encode(cleaned, out)
+        best = min(best, time.perf_counter() - start)
+    return round(total_tokens / best, 1)
+
+
+def bench_inference(viral_predictor, runs, batch_size):
+    """Сравнение model.predict и скомпилированной функции на одном входе"""
+    rng = np.random.default_rng(0)
+    padded = rng.integers(
+        1, 10000, size=(batch_size, viral_predictor.MAX_SEQUENCE_LENGTH), dtype=np.int32
+    )
+
+    paths = {"compiled": lambda: viral_predictor._run_model(padded)}
+    if isinstance(viral_predictor._model, viral_predictor.KerasBackend):
+        paths["model.predict"] = lambda: viral_predictor._model.model.predict(padded, verbose=0)
+    return {name: latency_summary(measure(fn, runs)) for name, fn in paths.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    results = {"meta": {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": args.runs,
+    }}
+
+    results["cold_start"] = bench_cold_start(args.model, args.tokenizer, args.buckets)
+    from predictor import viral_predictor
+    results["meta"]["backend"] = viral_predictor._model.name
+    results["meta"]["buckets"] = viral_predictor.active_buckets()
+    if "tensorflow" in sys.modules:
+        results["meta"]["tensorflow"] = sys.modules["tensorflow"].__version__
+
+    # Кэш по входу модели исказил бы замеры повторяющихся текстов
+    viral_predictor.configure_sequence_cache(0)
+
+    words = sorted(viral_predictor._tokenizer.word_index, key=viral_predictor._tokenizer.word_index.get)
+    words = words[:20000]
+    corpora = {
+        f"synthetic_{length}": synthetic_corpus(words, length, args.runs)
+        for length in SYNTHETIC_LENGTHS
+    }
+    if args.corpus:
+        corpora["recorded"] = load_corpus(args.corpus)
+
+    results["latency"] = {}
+    results["tokenizer_tokens_per_second"] = {}
+    for name, corpus in corpora.items():
+        results["latency"][name] = bench_latency(viral_predictor, corpus, args.runs)
+        results["tokenizer_tokens_per_second"][name] = bench_tokenizer(viral_predictor, corpus)
+
+    mixed = [text for corpus in corpora.values() for text in corpus]
+    random.Random(0).shuffle(mixed)
+    results["throughput_texts_per_second"] = {
+        str(batch_size): bench_throughput(viral_predictor, mixed, batch_size)
+        for batch_size in args.batch_sizes
+    }
+
+    if args.model_paths:
+        results["model_paths"] = {
+            str(batch_size): bench_inference(viral_predictor, args.runs, batch_size)
+            for batch_size in args.batch_sizes
+        }
+
+    if args.backends:
+        results["backends"] = {
+            os.path.basename(path): bench_backend(path, args.tokenizer)
+            for path in args.backends
+        }
+
+    results["memory"] = memory_usage()
+    return results
+
+
+def print_results(results):
+    meta = results["meta"]
+    print(f"\n Бенчмарк {meta.get('commit') or ''} (бэкенд {meta.get('backend')}, "
+          f"TF {meta.get('tensorflow', '-')}, прогонов {meta['runs']})")
+    print(f" Корзины паддинга: {', '.join(map(str, meta.get('buckets') or [])) or 'нет'}")
+
+    cold = results["cold_start"]
+    print(f"\n Холодный старт: {cold['total_s']:.2f} с "
+          f"(импорт {cold['import_s']:.2f}, загрузка {cold['load_s']:.2f}, "
+          f"первый запрос {cold['first_predict_s']:.3f})")
+
+    print(f"\n Одиночный запрос")
+    print(f"   {'корпус':<18}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'токенов/с':>14}")
+    for name, latency in results["latency"].items():
+        tokens = results["tokenizer_tokens_per_second"][name]
+        print(f"   {name:<18}{latency['p50_ms']:>10.2f}{latency['p95_ms']:>10.2f}"
+              f"{latency['p99_ms']:>10.2f}{tokens:>14,.0f}")
+
+    print(f"\n Пакеты")
+    for batch_size, speed in results["throughput_texts_per_second"].items():
+        print(f"   батч {batch_size:>4}: {speed:>10,.1f} текстов/с")
+
+    for batch_size, paths in results.get("model_paths", {}).items():
+        print(f"\n Инференс, батч={batch_size}")
+        for name, latency in paths.items():
+            print(f"   {name:<16}{latency['p50_ms']:>10.2f}{latency['p99_ms']:>10.2f}")
+
+    if results.get("backends"):
+        print(f"\n Бэкенды (отдельный процесс на каждый)")
+        print(f"   {'модель':<28}{'бэкенд':<10}{'старт, с':>10}{'RSS, МБ':>10}  tensorflow")
+        for name, report in results["backends"].items():
+            print(f"   {name:<28}{report['backend']:<10}{report['total_s']:>10.2f}"
+                  f"{report['memory'].get('rss_mb', 0):>10.1f}  "
+                  f"{'да' if report['tensorflow_imported'] else 'нет'}")
+
+    memory = results["memory"]
+    print(f"\n Память: RSS {memory.get('rss_mb', '-')} МБ, пик {memory['peak_rss_mb']} МБ")
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, float(value)
+
+
+def compare(base, new, tolerance=0.1):
+    """Таблица изменений; возвращает список метрик, ухудшившихся больше tolerance"""
+    base_values = dict(_flatten(base))
+    regressions = []
+
+    print(f"\n Сравнение {base['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    print(f"   {'метрика':<52}{'было':>12}{'стало':>12}{'изм.':>9}")
+    for name, value in _flatten(new):
+        old = base_values.get(name)
+        if old is None or old == 0:
+            continue
+        change = (value - old) / old
+        worse = -change if any(marker in name for marker in HIGHER_IS_BETTER) else change
+        flag = " ⚠️" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"   {name:<52}{old:>12.2f}{value:>12.2f}{change * 100:>+8.1f}%{flag}")
+    return regressions
+
+
+def _read_report(path):
+    """Результаты прогона, сохраненные через --output"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_revision(rev, args, output):
+    """Прогон бенчмарка на коммите rev во временном worktree"""
+    with tempfile.TemporaryDirectory() as root:
+        worktree = os.path.join(root, "tree")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, rev], check=True)
+        try:
+            command = [
+                sys.executable, "-m", "predictor.benchmark",
+                "--model", os.path.abspath(args.model),
+                "--tokenizer", os.path.abspath(args.tokenizer),
+                "--runs", str(args.runs),
+                "--batch-sizes", *map(str, args.batch_sizes),
+                "--output", output,
+            ]
+            if args.corpus:
+                command += ["--corpus", os.path.abspath(args.corpus)]
+            if args.buckets != list(DEFAULT_BUCKETS):
+                command += ["--buckets", *map(str, args.buckets)]
+            # Отдельный процесс на коммит: холодный старт и память не смешиваются
+            subprocess.run(command, cwd=worktree, check=True)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк предсказания виральности")
+    parser.add_argument("--model", default="models/complete_model.keras")
+    parser.add_argument("--tokenizer", default="tokenizers/vocab.npz")
+    parser.add_argument("--corpus", help="записанные посты, по одному на строку")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--buckets", type=int, nargs="*", default=list(DEFAULT_BUCKETS),
+                        help="корзины паддинга (без значений - всегда полный вход 200)")
+    parser.add_argument("--model-paths", action="store_true",
+                        help="сравнить model.predict и скомпилированный путь (tf.function или TFLite)")
+    parser.add_argument("--backends", nargs="+", metavar="MODEL",
+                        help="сравнить старт и память бэкендов для этих файлов моделей")
+    parser.add_argument("--cold-start-only", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="сравнить два сохраненных JSON")
+    parser.add_argument("--revs", nargs=2, metavar=("BASE", "NEW"),
+                        help="прогнать бенчмарк на двух коммитах и сравнить")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="допустимое ухудшение при сравнении (доля)")
+    args = parser.parse_args()
+
+    if args.cold_start_only:
+        print(json.dumps(_cold_start_report(args.model, args.tokenizer)))
+        return
+
+    if args.compare or args.revs:
+        if args.revs:
+            with tempfile.TemporaryDirectory(prefix="benchmark-") as directory:
+                paths = [os.path.join(directory, f"{i}.json") for i in range(2)]
+                for rev, path in zip(args.revs, paths):
+                    run_revision(rev, args, path)
+                base, new = map(_read_report, paths)
+        else:
+            base, new = map(_read_report, args.compare)
+        regressions = compare(base, new, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ Ухудшилось больше чем на {args.tolerance:.0%}: {len(regressions)} метрик")
+            raise SystemExit(1)
+        return
+
+    results = run_suite(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# predictor/bulk_score.py
+"""
+Потоковая оценка больших архивов постов (CSV или JSONL)
+
+Вход читается с диска блоками по --chunk-size строк, токенизация идет в
+пуле процессов, модель считает пакетами по --batch-size, а результаты
+дописываются в выходной файл после каждого блока. В памяти одновременно
+не больше --workers * 2 блоков, сколько бы строк ни было во входе.
+
+После каждого записанного блока обновляется файл контрольной точки
+(число обработанных строк и размер выходного файла); с --resume оценка
+продолжается с этого места, а недописанный хвост выхода отбрасывается.
+
+Запуск из корня проекта:
+    python -m predictor.bulk_score posts.csv scores.csv --text-column selftext --id-column id
+    python -m predictor.bulk_score posts.jsonl scores.jsonl --resume
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+import numpy as np
+
+from predictor import viral_predictor
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+
+# Токенизатор процесса-воркера (загружается один раз в инициализаторе)
+_worker_tokenizer = None
+
+
+def _init_worker(tokenizer_path):
+    global _worker_tokenizer
+    _worker_tokenizer = viral_predictor.load_tokenizer(tokenizer_path)
+
+
+def _encode_chunk(texts):
+    return viral_predictor.encode_texts(_worker_tokenizer, texts)
+
+
+def detect_format(path, default=None):
+    extension = os.path.splitext(str(path))[1].lower().lstrip('.')
+    if extension in ("json", "ndjson"):
+        extension = "jsonl"
+    if extension in FORMATS:
+        return extension
+    if default:
+        return default
+    raise ValueError(f"Не удалось определить формат {path}, укажите --input-format/--output-format")
+
+
+def read_rows(path, fmt, text_field, id_field=None, skip=0):
+    """
+    Построчное чтение входа: (id, текст) без загрузки файла целиком
+
+    Первые skip строк пропускаются (продолжение с контрольной точки).
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            # Длинные посты не влезают в лимит поля по умолчанию (128 КБ)
+            csv.field_size_limit(2 ** 31 - 1)
+            rows = csv.DictReader(f)
+            if text_field not in (rows.fieldnames or ()):
+                raise ValueError(f"В {path} нет колонки {text_field}")
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for number, row in enumerate(rows):
+            if number < skip:
+                continue
+            yield (row.get(id_field) if id_field else number), row.get(text_field) or ""
+
+
+def read_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ResultWriter:
+    """Дозапись результатов в CSV/JSONL с фиксацией на диске после каждого блока"""
+
+    FIELDS = ("id", "probability", "viral", "error")
+
+    def __init__(self, path, fmt, resume_size=None):
+        self.path = path
+        self.fmt = fmt
+        if resume_size is not None and os.path.exists(path):
+            # Строки, записанные после последней контрольной точки, будут посчитаны заново
+            self.file = open(path, "r+", encoding="utf-8", newline="")
+            self.file.truncate(resume_size)
+            self.file.seek(resume_size)
+        else:
+            self.file = open(path, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self.file) if fmt == "csv" else None
+        if self._csv is not None and self.file.tell() == 0:
+            self._csv.writerow(self.FIELDS)
+
+    def write(self, ids, probabilities, threshold):
+        for row_id, probability in zip(ids, probabilities):
+            if np.isnan(probability):
+                values = (row_id, "", "", "empty")
+            else:
+                probability = round(float(probability), 6)
+                values = (row_id, probability, probability > threshold, "")
+            if self._csv is not None:
+                self._csv.writerow(values)
+            else:
+                record = dict(zip(self.FIELDS, values))
+                if not record["error"]:
+                    del record["error"]
+                else:
+                    del record["probability"], record["viral"]
+                self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def commit(self):
+        """Сброс на диск; возвращает размер файла для контрольной точки"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def load_checkpoint(path, input_path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        raise ValueError(f"Контрольная точка {path} относится к другому входу: {checkpoint.get('input')}")
+    return checkpoint
+
+
+def save_checkpoint(path, input_path, rows, output_size):
+    """Атомарная запись: после сбоя остается либо старая, либо новая точка"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"input": os.path.abspath(input_path), "rows": rows, "output_size": output_size}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def score_padded(padded, empty, batch_size):
+    """Вероятности пакетами по batch_size; у пустых текстов - NaN"""
+    probabilities = np.full(len(padded), np.nan, dtype=np.float32)
+    rows = np.flatnonzero(~empty)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        probabilities[batch] = viral_predictor.score_inputs(padded[batch])
+    return probabilities
+
+
+class Progress:
+    """Периодический отчет о скорости: за последний интервал и в среднем"""
+
+    def __init__(self, every=10.0, done=0):
+        self.every = every
+        self.started = self._last = time.perf_counter()
+        self.done = self._last_done = done
+        self._initial = done
+
+    @property
+    def average(self):
+        return (self.done - self._initial) / max(time.perf_counter() - self.started, 1e-9)
+
+    def update(self, rows):
+        self.done += rows
+        now = time.perf_counter()
+        if now - self._last < self.every:
+            return
+        current = (self.done - self._last_done) / max(now - self._last, 1e-9)
+        logger.info(f"📊 {self.done:,} строк, {current:,.0f} строк/с (в среднем {self.average:,.0f})")
+        self._last, self._last_done = now, self.done
+
+
+class _EncodedNow:
+    """Результат токенизации в основном процессе с интерфейсом Future"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def _finish(item, writer, args, checkpoint_path, done, progress):
+    ids, texts, future = item
+    padded = future.result()
+    probabilities = score_padded(padded, np.array([not text for text in texts]), args.batch_size)
+    writer.write(ids, probabilities, args.threshold)
+    output_size = writer.commit()
+    done += len(ids)
+    save_checkpoint(checkpoint_path, args.input, done, output_size)
+    progress.update(len(ids))
+    return done
+
+
+def run(args):
+    input_format = detect_format(args.input, args.input_format)
+    output_format = detect_format(args.output, args.output_format or input_format)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+
+    checkpoint = load_checkpoint(checkpoint_path, args.input) if args.resume else None
+    skip = checkpoint["rows"] if checkpoint else 0
+    if checkpoint:
+        logger.info(f"↩️ Продолжение с контрольной точки: {skip:,} строк уже оценено")
+
+    viral_predictor.configure_sequence_cache(args.sequence_cache)
+    viral_predictor.load_model_and_tokenizer(args.model, args.tokenizer)
+
+    writer = ResultWriter(args.output, output_format, checkpoint["output_size"] if checkpoint else None)
+    rows = read_rows(args.input, input_format, args.text_column, args.id_column, skip=skip)
+    chunks = read_chunks(rows, args.chunk_size)
+
+    executor = None
+    if args.workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            # fork после импорта TensorFlow небезопасен
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(args.tokenizer,)
+        )
+
+    def encode(texts):
+        if executor is None:
+            return _EncodedNow(viral_predictor.encode_texts(viral_predictor._tokenizer, texts))
+        return executor.submit(_encode_chunk, texts)
+
+    progress = Progress(args.report_every, done=skip)
+    # Очередь блоков в токенизации: порядок выхода совпадает с порядком входа
+    in_flight = deque()
+    max_in_flight = max(1, args.workers) * 2
+    done = skip
+    try:
+        for chunk in chunks:
+            ids = [row_id for row_id, _ in chunk]
+            texts = [str(text).strip() for _, text in chunk]
+            in_flight.append((ids, texts, encode(texts)))
+            while len(in_flight) >= max_in_flight:
+                done = _finish(in_flight.popleft(), writer, args, checkpoint_path, done, progress)
+        while in_flight:
+            done = _finish(in_flight.popleft(), writer, args, checkpoint_path, done, progress)
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    logger.info(f"✅ Готово: {done:,} строк ({progress.average:,.0f} строк/с), результаты в {args.output}")
+    return done
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s", stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Потоковая оценка виральности для CSV/JSONL")
+    parser.add_argument("input", help="посты: .csv с заголовком или .jsonl")
+    parser.add_argument("output", help="результаты: .csv или .jsonl")
+    parser.add_argument("--model", default="models/complete_model.keras")
+    parser.add_argument("--tokenizer", default="tokenizers/vocab.npz")
+    parser.add_argument("--input-format", choices=FORMATS)
+    parser.add_argument("--output-format", choices=FORMATS)
+    parser.add_argument("--text-column", default="text", help="колонка CSV или поле JSONL с текстом")
+    parser.add_argument("--id-column", help="колонка с id поста (по умолчанию - номер строки)")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=8192, help="строк в блоке чтения и токенизации")
+    parser.add_argument("--batch-size", type=int, default=viral_predictor.BATCH_CHUNK_SIZE,
+                        help="строк в одном вызове модели")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="процессов токенизации (0 - в основном процессе)")
+    parser.add_argument("--sequence-cache", type=int, default=0,
+                        help="размер кэша по входу модели (полезен при дубликатах)")
+    parser.add_argument("--checkpoint", help="файл контрольной точки (по умолчанию OUTPUT.checkpoint)")
+    parser.add_argument("--resume", action="store_true", help="продолжить с контрольной точки")
+    parser.add_argument("--report-every", type=float, default=10.0, help="интервал отчета о скорости, с")
+    args = parser.parse_args()
+
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
-from viral_predictor import load_model_and_tokenizer, predict_viral, predict_viral_simple, predict_viral_score
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from predictor.viral_predictor import load_model_and_tokenizer, predict_viral, predict_viral_simple, predict_viral_score
 
 print(" Инициализация модели...")
 load_model_and_tokenizer(
     model_path='models/complete_model.keras',
-    tokenizer_path='tokenizers/tokenizer.pkl'
+    tokenizer_path='tokenizers/vocab.npz'
 )
 
 text1 = "A phase-locked loop or phase lock loop (PLL) is a control system that generates an output signal whose phase is fixed relative to the phase of an input signal."
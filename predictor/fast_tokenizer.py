@@ -0,0 +1,238 @@
+# predictor/fast_tokenizer.py
+"""
+Быстрый токенизатор, совместимый с keras Tokenizer по id и паддингу
+
+Словарь экспортируется один раз из tokenizer.pkl в компактный .npz:
+хранятся только слова с индексом < num_words (остальные все равно
+превращаются в OOV), отсортированные по алфавиту.
+
+Экспорт со сверкой с исходным токенизатором:
+    python -m predictor.fast_tokenizer tokenizers/tokenizer.pkl tokenizers/vocab.npz
+"""
+import argparse
+import itertools
+import json
+import pickle
+import random
+import re
+import time
+
+import numpy as np
+
+
+# Фрагмент текста между пробельными символами (те же, что у str.split())
+_CHUNK_RE = re.compile(r'\S+')
+
+
+class FastTokenizer:
+    """
+    Кодирование текстов в id без keras
+
+    Разбиение на слова - один проход скомпилированного регулярного
+    выражения (эквивалент translate(filters -> split) + split у keras),
+    поиск id - по хеш-таблице, собранной из отсортированного словаря.
+    """
+
+    def __init__(self, words, ids, filters, lower=True, split=' ', oov_index=None):
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.oov_index = oov_index
+        self.word_index = dict(zip(words, (int(i) for i in ids)))
+
+        # Слово - максимальная последовательность символов не из filters и не split
+        self._word_re = re.compile('[^' + re.escape(filters + split) + ']+')
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        config = json.loads(str(data['config']))
+        blob = data['words'].tobytes().decode('utf-8')
+        offsets = data['offsets']
+        words = [blob[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        return cls(words, data['ids'], **config)
+
+    def words(self, text, limit=None):
+        """Слова текста в том виде, в каком их ищет словарь (первые limit слов)"""
+        if self.lower:
+            text = text.lower()
+        if limit is None:
+            return self._word_re.findall(text)
+        # При усечении 'post' дальше limit слов текст можно не сканировать
+        return [m.group() for m in itertools.islice(self._word_re.finditer(text), limit)]
+
+    def word_spans(self, text):
+        """
+        Слова текста и их позиции (start, end) в text
+
+        Слова те же, что после нормализации пробелов при предсказании
+        (' '.join(text.lower().split())): неразрывный и другие пробелы
+        Unicode разделяют слова. Позиция None, если нижний регистр
+        изменил длину фрагмента и в исходном тексте ее не найти.
+        """
+        for chunk in _CHUNK_RE.finditer(text):
+            part = chunk.group().lower() if self.lower else chunk.group()
+            exact = len(part) == chunk.end() - chunk.start()
+            for match in self._word_re.finditer(part):
+                span = (chunk.start() + match.start(), chunk.start() + match.end()) if exact else None
+                yield match.group(), span
+
+    def _lookup(self, words):
+        get = self.word_index.get
+        if self.oov_index is None:
+            return [i for i in map(get, words) if i is not None]
+        return [get(word, self.oov_index) for word in words]
+
+    def texts_to_sequences(self, texts, maxlen=None):
+        """
+        Тот же результат, что у keras Tokenizer.texts_to_sequences;
+        с maxlen последовательности усекаются ('post') до maxlen id
+        """
+        if maxlen is None:
+            return [self._lookup(self.words(text)) for text in texts]
+        # Без OOV неизвестные слова выбрасываются, и заранее обрезать нельзя
+        limit = maxlen if self.oov_index is not None else None
+        return [self._lookup(self.words(text, limit))[:maxlen] for text in texts]
+
+    def encode(self, texts, maxlen=200, out=None):
+        """
+        Тексты -> массив int32 (N, maxlen), как
+        pad_sequences(texts_to_sequences(texts), padding='post', truncating='post')
+        """
+        if out is None:
+            out = np.zeros((len(texts), maxlen), dtype=np.int32)
+        else:
+            out.fill(0)
+        for row, sequence in zip(out, self.texts_to_sequences(texts, out.shape[1])):
+            row[:len(sequence)] = sequence
+        return out
+
+
+def export_vocabulary(tokenizer, path):
+    """Сохранение словаря keras Tokenizer в .npz для FastTokenizer"""
+    if tokenizer.char_level or getattr(tokenizer, 'analyzer', None) is not None:
+        raise ValueError("Поддерживается только пословный токенизатор без analyzer")
+
+    num_words = tokenizer.num_words
+    oov_index = tokenizer.word_index.get(tokenizer.oov_token) if tokenizer.oov_token else None
+
+    vocab = sorted(
+        (word, index) for word, index in tokenizer.word_index.items()
+        if not num_words or index < num_words
+    )
+    config = {
+        'filters': tokenizer.filters,
+        'lower': tokenizer.lower,
+        'split': tokenizer.split,
+        'oov_index': oov_index,
+    }
+    # Смещения считаются в символах: при загрузке блоб декодируется целиком
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum([len(word) for word, _ in vocab], out=offsets[1:])
+
+    np.savez_compressed(
+        path,
+        words=np.frombuffer(''.join(word for word, _ in vocab).encode('utf-8'), dtype=np.uint8),
+        offsets=offsets,
+        ids=np.array([index for _, index in vocab], dtype=np.int32),
+        config=np.array(json.dumps(config)),
+    )
+
+
+SAMPLE_POSTS = [
+    "This life hack will change your life",
+    "A phase-locked loop or phase lock loop (PLL) is a control system that generates "
+    "an output signal whose phase is fixed relative to the phase of an input signal.",
+    "TIL that bees can recognize human faces!!! #science @everyone",
+    "My cat knocked over the Christmas tree... again. 10/10 would adopt again :)",
+    "Breaking: city council votes 7-2 to ban e-scooters downtown; residents react",
+    "Why does nobody talk about how hard it is to make friends after 30?",
+    "Просто текст на русском языке, которого нет в словаре",
+    "emoji 🚀🚀 test\twith\ttabs and\nnew lines and non-breaking spaces",
+    "I'm not sure if this is the right sub, but here's my story about my landlord's dog",
+    "",
+]
+
+
+def sample_corpus(tokenizer, size=2000, seed=0):
+    """Посты из SAMPLE_POSTS и синтетика из словаря с пунктуацией, регистром и OOV"""
+    rng = random.Random(seed)
+    words = list(tokenizer.word_index)[:30000]
+    punctuation = ['', '', '', ',', '.', '!', '?', '...', ':)', "'s", '-']
+
+    corpus = list(SAMPLE_POSTS)
+    while len(corpus) < size:
+        length = rng.choice([3, 10, 30, 100, 199, 200, 201, 400, 1000])
+        tokens = []
+        for _ in range(length):
+            word = rng.choice(words) if rng.random() > 0.05 else f"oov{rng.randrange(10**6)}"
+            if rng.random() < 0.1:
+                word = word.capitalize()
+            tokens.append(word + rng.choice(punctuation))
+        corpus.append(' '.join(tokens))
+    return corpus
+
+
+def check_parity(tokenizer, fast, corpus, maxlen=200):
+    """Сверка id и паддинга; возвращает число расхождений"""
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+    expected = tokenizer.texts_to_sequences(corpus)
+    mismatches = sum(a != b for a, b in zip(expected, fast.texts_to_sequences(corpus)))
+
+    expected_padded = pad_sequences(expected, maxlen=maxlen, padding='post', truncating='post')
+    mismatches += int((expected_padded != fast.encode(corpus, maxlen)).any(axis=1).sum())
+    return mismatches
+
+
+def tokens_per_second(fn, corpus, repeats=3):
+    total_tokens = sum(len(text.split()) for text in corpus)
+    best = min(_timed(fn, corpus) for _ in range(repeats))
+    return total_tokens / best
+
+
+def _timed(fn, corpus):
+    start = time.perf_counter()
+    fn(corpus)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт словаря для FastTokenizer")
+    parser.add_argument("src", help="tokenizer.pkl (keras Tokenizer)")
+    parser.add_argument("dst", help="путь для .npz")
+    parser.add_argument("--corpus", help="файл с постами для сверки, по одному на строку")
+    args = parser.parse_args()
+
+    with open(args.src, 'rb') as f:
+        tokenizer = pickle.load(f)
+
+    export_vocabulary(tokenizer, args.dst)
+    fast = FastTokenizer.load(args.dst)
+    print(f" Словарь сохранен в {args.dst}: {len(fast.word_index)} слов")
+
+    corpus = sample_corpus(tokenizer)
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            corpus.extend(line.rstrip('\n') for line in f)
+
+    mismatches = check_parity(tokenizer, fast, corpus)
+    print(f" Сверка на {len(corpus)} текстах: расхождений {mismatches}")
+
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+    keras_speed = tokens_per_second(
+        lambda texts: pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=200,
+                                    padding='post', truncating='post'),
+        corpus
+    )
+    fast_speed = tokens_per_second(fast.encode, corpus)
+    print(f"   keras Tokenizer + pad_sequences: {keras_speed:,.0f} токенов/с")
+    print(f"   FastTokenizer.encode:            {fast_speed:,.0f} токенов/с")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
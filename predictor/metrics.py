@@ -0,0 +1,205 @@
+# predictor/metrics.py
+"""
+Легковесные метрики в формате Prometheus без внешних зависимостей
+
+Запись метрики - это perf_counter, bisect по границам бакетов и
+инкремент под блокировкой (вызовы идут и из потоков пула).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Границы бакетов гистограмм времени, секунды
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join(f'{name}="{value}"' for name, value in pairs)
+    return '{' + inner + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self):
+        for key, value in sorted(self.values().items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(_Metric):
+    """
+    Значение снимается вызовом функции в момент экспорта
+
+    Функция возвращает число или словарь {значение метки: число} для
+    метки labelname; None - метрика сейчас недоступна. С kind='counter'
+    так экспортируются счетчики, которые уже ведут сами компоненты.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, fn, labelname=None, kind=None):
+        super().__init__(name, help_text, (labelname,) if labelname else ())
+        self.fn = fn
+        if kind:
+            self.kind = kind
+
+    def _samples(self):
+        value = self.fn()
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for label, item in sorted(value.items()):
+                yield f'{self.name}{_format_labels(self.labelnames, (label,))} {_format_value(item)}'
+        else:
+            yield f'{self.name} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key: [counts по бакетам + inf, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def series(self):
+        """Снимок серий под блокировкой: observe из других потоков не меняет его на ходу"""
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def quantile(self, q, **labels):
+        """Оценка квантиля по бакетам (линейная интерполяция внутри бакета)"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            counts = list(series[0]) if series is not None else None
+        if counts is None:
+            return None
+        total = sum(counts)
+        if not total:
+            return None
+
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def _samples(self):
+        for key, (counts, total) in sorted(self.series().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric):
+        # Повторная регистрация (например, при перезагрузке модуля) возвращает прежнюю метрику
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn, labelname=None, kind=None):
+        # Функция обновляется: источник значения мог смениться
+        metric = self._add(Gauge(name, help_text, fn, labelname, kind))
+        metric.fn = fn
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Время этапов обработки: normalize, tokenize, pad, model (в viral_predictor),
+# predict (весь запрос в сервисе), explain (разбор вклада слов), optimize (поиск правок)
+# и telegram_send (ответ пользователю)
+STAGE_SECONDS = REGISTRY.histogram(
+    'viral_stage_seconds', 'Время этапа обработки запроса', labelnames=('stage',)
+)
@@ -0,0 +1,280 @@
+# predictor/numpy_runtime.py
+"""
+Инференс модели на чистом NumPy, без TensorFlow
+
+Веса и конфигурация слоев экспортируются из Keras-модели один раз в .npz,
+после чего модель считается без импорта tensorflow. Поддерживается
+линейная цепочка слоев: Embedding (в т.ч. mask_zero), Dropout,
+SpatialDropout1D, Dense, Conv1D, GlobalAveragePooling1D,
+GlobalMaxPooling1D, Flatten, LSTM и Bidirectional(LSTM).
+
+Экспорт со сверкой с исходной моделью:
+    python -m predictor.numpy_runtime models/complete_model.keras models/complete_model.npz
+"""
+import argparse
+import json
+
+import numpy as np
+
+# Длина входа модели (как MAX_SEQUENCE_LENGTH в viral_predictor)
+SEQUENCE_LENGTH = 200
+
+
+def _sigmoid(x):
+    # Через tanh: без переполнения exp на больших по модулю значениях
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(x / 6.0 + 0.5, 0.0, 1.0)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'tanh': np.tanh,
+    'softmax': _softmax,
+}
+
+# Слои, которые на инференсе ничего не делают
+IDENTITY_LAYERS = ('InputLayer', 'Dropout', 'SpatialDropout1D', 'GaussianNoise', 'ActivityRegularization')
+
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Активация {name} не поддерживается")
+    return ACTIVATIONS[name]
+
+
+def _lstm(x, mask, weights, spec, reverse=False):
+    """
+    LSTM по времени; замаскированные шаги не меняют состояние (как в Keras)
+
+    Вклад входа x @ kernel считается сразу для всех шагов одним умножением,
+    в цикле остается только рекуррентная часть.
+    """
+    kernel, recurrent, bias = weights
+    units = recurrent.shape[0]
+    activation = _activation(spec['activation'])
+    recurrent_activation = _activation(spec['recurrent_activation'])
+
+    steps = x.shape[1]
+    if mask is not None:
+        # Паддинг в конце: шаги после последнего токена ничего не меняют
+        # ни в прямом, ни в обратном проходе
+        active = np.flatnonzero(mask.any(axis=0))
+        steps = int(active[-1]) + 1 if len(active) else 0
+
+    batch = x.shape[0]
+    h = np.zeros((batch, units), dtype=np.float32)
+    c = np.zeros((batch, units), dtype=np.float32)
+    if steps == 0:
+        return h
+
+    projected = x[:, :steps] @ kernel + bias
+    order = range(steps - 1, -1, -1) if reverse else range(steps)
+    for t in order:
+        z = projected[:, t] + h @ recurrent
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        g = activation(z[:, 2 * units:3 * units])
+        o = recurrent_activation(z[:, 3 * units:])
+        c_new = f * c + i * g
+        h_new = o * activation(c_new)
+        if mask is None:
+            h, c = h_new, c_new
+        else:
+            m = mask[:, t:t + 1]
+            h = np.where(m, h_new, h)
+            c = np.where(m, c_new, c)
+    return h
+
+
+def _conv1d(x, kernel, bias, spec):
+    width = kernel.shape[0]
+    if spec['padding'] == 'same':
+        left = (width - 1) // 2
+        x = np.pad(x, ((0, 0), (left, width - 1 - left), (0, 0)))
+    elif spec['padding'] != 'valid':
+        raise ValueError(f"Conv1D с padding={spec['padding']} не поддерживается")
+    # (N, T', C, width) -> свертка одним einsum
+    windows = np.lib.stride_tricks.sliding_window_view(x, width, axis=1)
+    out = np.einsum('ntcw,wcf->ntf', windows, kernel, optimize=True)
+    if bias is not None:
+        out = out + bias
+    return _activation(spec['activation'])(out)
+
+
+class NumpyModel:
+    """Модель из .npz: вызов (N, 200) int32 -> вероятности (N, 1) float32"""
+
+    def __init__(self, layers, weights):
+        self.layers = layers
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        layers = json.loads(str(data['config']))
+        weights = [
+            [data[f'{i}_{j}'].astype(np.float32) for j in range(layer['weights'])]
+            for i, layer in enumerate(layers)
+        ]
+        return cls(layers, weights)
+
+    def __call__(self, padded):
+        x = np.asarray(padded)
+        mask = None
+
+        for spec, weights in zip(self.layers, self.weights):
+            kind = spec['type']
+            if kind == 'Embedding':
+                if spec['mask_zero']:
+                    mask = x != 0
+                x = weights[0][x]
+            elif kind == 'Dense':
+                x = x @ weights[0]
+                if spec['use_bias']:
+                    x = x + weights[1]
+                x = _activation(spec['activation'])(x)
+            elif kind == 'Conv1D':
+                x = _conv1d(x, weights[0], weights[1] if spec['use_bias'] else None, spec)
+                mask = None
+            elif kind == 'GlobalAveragePooling1D':
+                if mask is None:
+                    x = x.mean(axis=1)
+                else:
+                    m = mask[:, :, None].astype(np.float32)
+                    x = (x * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1.0)
+                mask = None
+            elif kind == 'GlobalMaxPooling1D':
+                if mask is not None:
+                    x = np.where(mask[:, :, None], x, -np.inf)
+                x = x.max(axis=1)
+                mask = None
+            elif kind == 'Flatten':
+                x = x.reshape(len(x), -1)
+                mask = None
+            elif kind == 'LSTM':
+                x = _lstm(x, mask, weights, spec, reverse=spec['go_backwards'])
+                mask = None
+            elif kind == 'Bidirectional':
+                half = len(weights) // 2
+                forward = _lstm(x, mask, weights[:half], spec['forward'])
+                backward = _lstm(x, mask, weights[half:], spec['backward'], reverse=True)
+                x = np.concatenate([forward, backward], axis=-1)
+                mask = None
+            # IDENTITY_LAYERS пропускаются
+
+        return x
+
+
+def _lstm_spec(layer):
+    config = layer.get_config()
+    if config.get('return_sequences') or config.get('stateful'):
+        raise ValueError(f"{layer.name}: поддерживается только LSTM с return_sequences=False")
+    if not config.get('use_bias', True):
+        raise ValueError(f"{layer.name}: LSTM без bias не поддерживается")
+    return {
+        'activation': config['activation'],
+        'recurrent_activation': config['recurrent_activation'],
+        'go_backwards': config.get('go_backwards', False),
+    }
+
+
+def export_model(model, path):
+    """Сохранение конфигурации и весов Keras-модели в .npz для NumpyModel"""
+    layers, arrays = [], {}
+
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        weights = layer.get_weights()
+
+        if kind in IDENTITY_LAYERS:
+            spec = {'type': kind}
+            weights = []
+        elif kind == 'Embedding':
+            spec = {'type': kind, 'mask_zero': bool(config.get('mask_zero'))}
+        elif kind == 'Dense':
+            spec = {'type': kind, 'activation': config['activation'], 'use_bias': config['use_bias']}
+        elif kind == 'Conv1D':
+            if tuple(config['strides']) != (1,) or tuple(config['dilation_rate']) != (1,):
+                raise ValueError(f"{layer.name}: Conv1D поддерживается только со strides=1, dilation=1")
+            spec = {
+                'type': kind,
+                'activation': config['activation'],
+                'use_bias': config['use_bias'],
+                'padding': config['padding'],
+            }
+        elif kind in ('GlobalAveragePooling1D', 'GlobalMaxPooling1D', 'Flatten'):
+            spec = {'type': kind}
+        elif kind == 'LSTM':
+            spec = {'type': kind, **_lstm_spec(layer)}
+        elif kind == 'Bidirectional':
+            if type(layer.forward_layer).__name__ != 'LSTM' or config.get('merge_mode') != 'concat':
+                raise ValueError(f"{layer.name}: поддерживается только Bidirectional(LSTM) с merge_mode='concat'")
+            spec = {
+                'type': kind,
+                'forward': _lstm_spec(layer.forward_layer),
+                'backward': _lstm_spec(layer.backward_layer),
+            }
+        else:
+            raise ValueError(f"Слой {kind} ({layer.name}) не поддерживается NumPy-рантаймом")
+
+        for j, weight in enumerate(weights):
+            arrays[f'{len(layers)}_{j}'] = np.asarray(weight, dtype=np.float32)
+        spec['weights'] = len(weights)
+        layers.append(spec)
+
+    np.savez(path, config=np.array(json.dumps(layers)), **arrays)
+
+
+def check_parity(model, numpy_model, samples=512, seed=0):
+    """Максимальное расхождение вероятностей с Keras на случайных входах с паддингом"""
+    rng = np.random.default_rng(seed)
+    # У функциональной модели layers[0] - InputLayer, размер словаря - у Embedding
+    embedding = next((layer for layer in model.layers if type(layer).__name__ == 'Embedding'), None)
+    if embedding is None:
+        raise ValueError("В модели нет слоя Embedding")
+    vocab = embedding.input_dim
+    padded = np.zeros((samples, SEQUENCE_LENGTH), dtype=np.int32)
+    for row in padded:
+        length = rng.integers(1, SEQUENCE_LENGTH + 1)
+        row[:length] = rng.integers(1, vocab, size=length)
+
+    expected = model(padded, training=False)
+    expected = np.asarray(expected.numpy() if hasattr(expected, 'numpy') else expected)
+    return float(np.abs(expected - numpy_model(padded)).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт весов модели для NumPy-рантайма")
+    parser.add_argument("src", help="модель Keras (.keras/.h5)")
+    parser.add_argument("dst", help="путь для .npz")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="допустимое расхождение вероятностей с Keras")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(args.src)
+    export_model(model, args.dst)
+    numpy_model = NumpyModel.load(args.dst)
+    print(f" Веса сохранены в {args.dst}: {len(numpy_model.layers)} слоев")
+
+    diff = check_parity(model, numpy_model)
+    print(f" Сверка с Keras: макс. |Δp| = {diff:.2e}")
+    if diff > args.tolerance:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
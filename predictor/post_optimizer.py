@@ -0,0 +1,343 @@
+# predictor/post_optimizer.py
+"""
+Поиск улучшенной версии поста: варианты текста строятся локально и
+оцениваются моделью большими пакетами
+
+Правки: обрезка до первых предложений, удаление предложения, перенос
+предложения в начало, удаление слова и замена слова близким словом из
+словаря токенизатора (соседи по эмбеддингу самой модели - слова, которые
+она "понимает" похоже). Поиск лучевой: на каждом раунде лучшие варианты
+расширяются новыми правками, и все новые варианты раунда считаются
+одним пакетом.
+
+Токенизация выполняется один раз по предложениям: вход модели для
+варианта - склейка id его предложений, так что общие части текста (и
+общий префикс, и нетронутые предложения) заново не токенизируются;
+после правки слова токенизируется только это предложение. Правки
+упорядочиваются по вкладу слов (окклюзия на исходном тексте) и
+отсекаются до вызова модели, если не обещают роста, а варианты без
+улучшения не расширяются дальше. Число вариантов в раунде ограничено
+оставшимся временем по оценке viral_predictor.call_cost.
+"""
+import math
+import re
+import time
+import weakref
+from collections import namedtuple
+
+import numpy as np
+
+from predictor import viral_predictor
+from predictor.fast_tokenizer import FastTokenizer
+
+# Соседи для замены ищутся среди самых частых слов (id токенизатора - ранг частоты)
+SYNONYM_VOCABULARY = 20000
+# Граница предложения: пробелы после .!?… или перевод строки (разделители сохраняются)
+SENTENCE_SPLIT_RE = re.compile(r'((?<=[.!?…])\s+|\s*\n\s*)')
+# Длина цитаты в описании правки
+QUOTE_CHARS = 40
+# Доля бюджета на разбор вклада слов в исходном тексте
+OCCLUSION_SHARE = 0.3
+
+# Предложение: текст, id, позиции слов в тексте (None - правки слов недоступны),
+# вклад слов из окклюзии и разделитель после предложения
+Sentence = namedtuple('Sentence', 'text ids spans priors sep')
+# Вариант текста и список правок, которыми он получен из исходного
+Candidate = namedtuple('Candidate', 'sentences edits')
+
+# Нормализованная матрица эмбеддингов и обратный словарь (строятся один раз на модель);
+# модель хранится слабой ссылкой, чтобы индекс не держал ее в памяти после замены
+_neighbour_index = None
+
+
+def _tokenize(text):
+    """
+    id предложения (с той же нормализацией пробелов, что в predict_viral)
+    и позиции соответствующих им слов в тексте
+    """
+    tokenizer = viral_predictor.current_model().tokenizer
+    if isinstance(tokenizer, FastTokenizer):
+        ids, spans = [], []
+        for word, span in tokenizer.word_spans(text):
+            index = tokenizer.word_index.get(word, tokenizer.oov_index)
+            if index is not None:
+                ids.append(index)
+                spans.append(span)
+        return ids, (spans if None not in spans else None)
+    return tokenizer.texts_to_sequences([' '.join(text.lower().split())])[0], None
+
+
+def split_sentences(text):
+    """Предложения с разделителями: склейка text + sep всех предложений дает исходный текст"""
+    parts = SENTENCE_SPLIT_RE.split(text.strip())
+    pairs = zip(parts[0::2], parts[1::2] + [''])
+    return [(sentence, sep) for sentence, sep in pairs if sentence]
+
+
+def join_sentences(sentences):
+    if not sentences:
+        return ''
+    return ''.join(s.text + (s.sep or ' ') for s in sentences[:-1]) + sentences[-1].text
+
+
+def _ids(sentences):
+    return [index for s in sentences for index in s.ids][:viral_predictor.MAX_SEQUENCE_LENGTH]
+
+
+def _quote(text):
+    text = ' '.join(text.split())
+    return f"«{text[:QUOTE_CHARS]}…»" if len(text) > QUOTE_CHARS else f"«{text}»"
+
+
+def _neighbours(word_id, count):
+    """Ближайшие по косинусу эмбеддинга слова из частой части словаря"""
+    global _neighbour_index
+
+    model = viral_predictor.current_model()
+    if _neighbour_index is None or _neighbour_index[0]() is not model:
+        matrix = model.model.embeddings()
+        index_word = {}
+        if matrix is not None and isinstance(model.tokenizer, FastTokenizer):
+            limit = min(len(matrix), SYNONYM_VOCABULARY)
+            matrix = np.asarray(matrix[:limit], dtype=np.float32)
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-8)
+            index_word = {
+                index: word for word, index in model.tokenizer.word_index.items()
+                if index < limit and word.isalpha()
+            }
+        else:
+            matrix = None
+        _neighbour_index = (weakref.ref(model), matrix, index_word, {})
+
+    _, matrix, index_word, found = _neighbour_index
+    if matrix is None or word_id not in index_word:
+        return []
+    if (word_id, count) not in found:
+        similarity = matrix @ matrix[word_id]
+        similarity[word_id] = -np.inf
+        top = np.argpartition(-similarity, min(count * 4, len(similarity) - 1))[:count * 4]
+        top = top[np.argsort(-similarity[top])]
+        found[word_id, count] = [index_word[i] for i in top if i in index_word][:count]
+    return found[word_id, count]
+
+
+def _replace_word(sentence, position, replacement):
+    """
+    Предложение с заменой слова (или его удалением при replacement=None);
+    токенизируется заново только это предложение. None, если правка
+    меняет токенизацию не так, как ожидалось
+    """
+    start, end = sentence.spans[position]
+    if replacement is None:
+        text = sentence.text[:start].rstrip() + ' ' + sentence.text[end:].lstrip()
+        text = re.sub(r'\s+([,.!?;:…])', r'\1', text).strip()
+    else:
+        if sentence.text[start:start + 1].isupper():
+            replacement = replacement[:1].upper() + replacement[1:]
+        text = sentence.text[:start] + replacement + sentence.text[end:]
+
+    ids, spans = _tokenize(text)
+    kept = (0.0,) if replacement is not None else ()
+    priors = sentence.priors[:position] + kept + sentence.priors[position + 1:]
+    if not text or spans is None or len(ids) != len(priors):
+        return None
+    return Sentence(text, tuple(ids), tuple(spans), priors, sentence.sep)
+
+
+def _edits(candidate, synonyms):
+    """
+    Правки варианта: (ожидаемый прирост вероятности по вкладу слов, build),
+    где build() возвращает (предложения, описание) или None. Сами варианты
+    строятся лениво - только для правок, которые попадут в пакет.
+    Удаляются и заменяются только слова, понижающие оценку
+    """
+    sentences = candidate.sentences
+    count = len(sentences)
+
+    for keep in range(1, count):
+        yield (
+            -sum(sum(s.priors) for s in sentences[keep:]),
+            lambda keep=keep: (sentences[:keep], f"оставлены первые предложения ({keep} из {count})")
+        )
+
+    for i, sentence in enumerate(sentences):
+        if count > 1:
+            yield (
+                -sum(sentence.priors),
+                lambda i=i, sentence=sentence: (
+                    sentences[:i] + sentences[i + 1:], f"убрано предложение {_quote(sentence.text)}"
+                )
+            )
+        if i > 0:
+            yield (
+                0.0,
+                lambda i=i, sentence=sentence: (
+                    (sentence,) + sentences[:i] + sentences[i + 1:],
+                    f"предложение {_quote(sentence.text)} перенесено в начало"
+                )
+            )
+
+    def word_edit(i, position, rank):
+        sentence = sentences[i]
+        start, end = sentence.spans[position]
+        word = sentence.text[start:end]
+        if rank is None:
+            replacement, description = None, f"убрано слово {_quote(word)}"
+        else:
+            neighbours = _neighbours(sentence.ids[position], synonyms)
+            if rank >= len(neighbours):
+                return None
+            replacement = neighbours[rank]
+            description = f"{_quote(word)} → {_quote(replacement)}"
+        edited = _replace_word(sentence, position, replacement)
+        if edited is None:
+            return None
+        return sentences[:i] + (edited,) + sentences[i + 1:], description
+
+    for i, sentence in enumerate(sentences):
+        if sentence.spans is None:
+            continue
+        for position, prior in enumerate(sentence.priors):
+            if prior >= 0:
+                continue
+            yield -prior, lambda i=i, position=position: word_edit(i, position, None)
+            for rank in range(synonyms):
+                # Замена обещает меньше удаления: новое слово тоже что-то весит
+                yield -prior / (2 + rank), lambda i=i, position=position, rank=rank: word_edit(i, position, rank)
+
+
+def _prepare(text, threshold, budget):
+    """
+    Предложения исходного текста с вкладом слов и результат для него;
+    если на окклюзию по словам не хватает budget секунд, вклад отрезка
+    из нескольких слов делится между ними поровну
+    """
+    sentences = []
+    for sentence_text, sep in split_sentences(text):
+        ids, spans = _tokenize(sentence_text)
+        sentences.append(Sentence(sentence_text, tuple(ids), tuple(spans) if spans else spans, (), sep))
+
+    ids = np.array(_ids(sentences), dtype=np.int32)
+    padded = np.zeros((1, viral_predictor.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    padded[0, :len(ids)] = ids
+    probability = float(viral_predictor.score_inputs(padded)[0])
+    window = max(1, math.ceil(len(ids) / viral_predictor.rows_within(budget)))
+    deltas = np.repeat(viral_predictor.occlusion(ids, probability, window) / window, window)
+
+    # Слова за пределами входа модели ни на что не влияют
+    offset, prepared = 0, []
+    for sentence in sentences:
+        priors = tuple(float(d) for d in deltas[offset:offset + len(sentence.ids)])
+        priors += (0.0,) * (len(sentence.ids) - len(priors))
+        prepared.append(sentence._replace(priors=priors))
+        offset += len(sentence.ids)
+    return tuple(prepared), viral_predictor.build_result(text, probability, threshold)
+
+
+@viral_predictor.with_pinned_model
+def optimize_post(
+    text,
+    threshold=0.5,
+    top_k=3,
+    budget_ms=1000.0,
+    beam_width=4,
+    max_rounds=3,
+    synonyms=3,
+    min_length=10
+):
+    """
+    Лучшие найденные правки текста за budget_ms
+
+    Args:
+        text (str): текст поста
+        threshold (float): порог виральности
+        top_k (int): сколько вариантов вернуть
+        budget_ms (float): ограничение времени поиска (вместе с разбором вклада слов)
+        beam_width (int): сколько лучших вариантов расширяется на следующем раунде
+        max_rounds (int): максимум правок подряд в одном варианте
+        synonyms (int): замен на каждое слово, понижающее оценку
+        min_length (int): варианты короче этого (в символах) не рассматриваются
+
+    Returns:
+        dict: результат predict_viral для исходного текста, а также
+        'candidates' - до top_k словарей text / probability / delta / edits
+        (только варианты лучше исходного, по убыванию вероятности),
+        'evaluated' - сколько вариантов посчитано моделью
+    """
+    text = str(text).strip()
+    if not text:
+        raise ValueError("Текст не может быть пустым")
+
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    sentences, result = _prepare(text, threshold, budget_ms / 1000 * OCCLUSION_SHARE)
+    base = result['probability']
+
+    seen = {tuple(_ids(sentences))}
+    beam = [(base, Candidate(sentences, ()))]
+    found = []
+    evaluated = 0
+    # Фактическое время строки на прошлых раундах: оценка call_cost
+    # по пакету из 32 строк бывает занижена
+    seconds_per_row = 0.0
+
+    for _ in range(max_rounds):
+        proposals = [
+            (probability + gain, build, candidate.edits)
+            for probability, candidate in beam
+            for gain, build in _edits(candidate, synonyms)
+        ]
+        # Сначала самые многообещающие по вкладу слов
+        proposals.sort(key=lambda proposal: proposal[0], reverse=True)
+
+        single, per_row = viral_predictor.call_cost()
+        per_row = max(per_row, seconds_per_row)
+        rows, batch = [], []
+        for _, build, edits in proposals:
+            # Построение вариантов тоже тратит бюджет: пакет должен успеть посчитаться
+            if time.perf_counter() + single + per_row * len(batch) > deadline:
+                break
+            built = build()
+            if built is None:
+                continue
+            edited, description = built
+            ids = tuple(_ids(edited))
+            if not ids or ids in seen or len(join_sentences(edited)) < min_length:
+                continue
+            seen.add(ids)
+            rows.append(ids)
+            batch.append(Candidate(edited, edits + (description,)))
+        if not batch:
+            break
+
+        padded = np.zeros((len(rows), viral_predictor.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+        for row, ids in zip(padded, rows):
+            row[:len(ids)] = ids
+        scoring_started = time.perf_counter()
+        scores = viral_predictor.score_rows(padded)
+        seconds_per_row = (time.perf_counter() - scoring_started) / len(batch)
+        evaluated += len(batch)
+
+        # Дальше расширяются только варианты лучше исходного текста
+        scored = sorted(
+            ((float(p), candidate) for p, candidate in zip(scores, batch) if p > base),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        found.extend(scored)
+        beam = scored[:beam_width]
+        if not beam:
+            break
+
+    found.sort(key=lambda item: item[0], reverse=True)
+    result['candidates'] = [
+        {
+            'text': join_sentences(candidate.sentences),
+            'probability': probability,
+            'delta': probability - base,
+            'edits': list(candidate.edits),
+        }
+        for probability, candidate in found[:top_k]
+    ]
+    result['evaluated'] = evaluated
+    return result
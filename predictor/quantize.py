@@ -0,0 +1,157 @@
+# predictor/quantize.py
+"""
+Экспорт модели в квантованный TFLite со сверкой с исходной float-моделью
+
+Режимы:
+    dynamic - веса int8, активации float (без калибровки)
+    int8    - веса и активации int8, калибровка на корпусе постов
+              (на рекуррентных слоях калибратор TF может аварийно завершаться -
+              для таких моделей используйте dynamic)
+    float16 - веса float16
+
+Бэкенд выбирается по расширению ML_MODEL_PATH: файл .tflite загружается
+через TFLiteBackend из viral_predictor.
+
+Запуск из корня проекта:
+    python -m predictor.quantize models/complete_model.keras models/complete_model.tflite
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from predictor import viral_predictor
+from predictor.benchmark import latency_summary, measure, memory_usage
+from predictor.fast_tokenizer import sample_corpus
+
+logger = logging.getLogger(__name__)
+
+MODES = ("dynamic", "int8", "float16")
+
+
+def _converter(model, batch_size):
+    """Конвертер из SavedModel с сигнатурой (batch_size, 200) int32"""
+    import keras
+
+    directory = tempfile.mkdtemp()
+    archive = keras.export.ExportArchive()
+    archive.track(model)
+    archive.add_endpoint(
+        "serve",
+        lambda inputs: model(inputs, training=False),
+        input_signature=[
+            tf.TensorSpec(shape=(batch_size, viral_predictor.MAX_SEQUENCE_LENGTH), dtype=tf.int32)
+        ],
+    )
+    archive.write_out(directory)
+    return tf.lite.TFLiteConverter.from_saved_model(directory)
+
+
+def export_tflite(model, mode="dynamic", representative=None, batch_size=None):
+    """
+    Конвертация Keras-модели в TFLite
+
+    Если batch_size не задан, сначала пробуется переменный размер пакета.
+    Рекуррентные слои с ним не конвертируются во встроенные операции
+    TFLite - тогда модель экспортируется с фиксированным пакетом 1
+    (минимальная задержка одиночного запроса; пакеты считаются по строке).
+
+    Returns:
+        (содержимое .tflite, фиксированный размер пакета или None)
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим {mode}, доступны: {', '.join(MODES)}")
+    if mode == "int8" and representative is None:
+        raise ValueError("Для int8 нужен калибровочный набор")
+
+    for batch in ([batch_size] if batch_size else [None, 1]):
+        converter = _converter(model, batch)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if mode == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif mode == "int8":
+            def dataset():
+                for row in representative:
+                    yield [np.tile(row, (batch or 1, 1)).astype(np.int32)]
+            converter.representative_dataset = dataset
+        try:
+            return converter.convert(), batch
+        except Exception as e:
+            if batch is not None:
+                raise
+            logger.warning(f"⚠️ Переменный размер пакета не поддерживается ({type(e).__name__}), "
+                           f"экспорт с пакетом 1")
+
+
+def agreement(expected, actual, threshold=0.5):
+    """Совпадение вероятностей и решений is_viral на валидационном наборе"""
+    diff = np.abs(expected - actual)
+    return {
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "label_agreement": float(((expected > threshold) == (actual > threshold)).mean()),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Квантование модели виральности в TFLite")
+    parser.add_argument("src", help="модель Keras (.keras/.h5)")
+    parser.add_argument("dst", help="путь для .tflite")
+    parser.add_argument("--mode", choices=MODES, default="dynamic")
+    parser.add_argument("--tokenizer", default="tokenizers/vocab.npz")
+    parser.add_argument("--corpus", help="валидационные посты, по одному на строку")
+    parser.add_argument("--batch-size", type=int, help="фиксированный размер пакета")
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="минимальная доля совпадающих решений is_viral")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    tokenizer = viral_predictor.load_tokenizer(args.tokenizer)
+    texts = sample_corpus(tokenizer, size=2000)
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            texts.extend(line.rstrip('\n') for line in f if line.strip())
+    validation = viral_predictor.encode_texts(tokenizer, texts)
+
+    model = tf.keras.models.load_model(args.src)
+    content, batch = export_tflite(
+        model, args.mode, representative=validation[:200], batch_size=args.batch_size
+    )
+    with open(args.dst, 'wb') as f:
+        f.write(content)
+    print(f" TFLite ({args.mode}) сохранен в {args.dst}, пакет: {batch or 'переменный'}")
+
+    rss_before = memory_usage().get("rss_mb")
+    lite = viral_predictor.TFLiteBackend(args.dst)
+    rss_lite = memory_usage().get("rss_mb")
+
+    float_infer = viral_predictor.KerasBackend(model)
+    expected = np.concatenate([float_infer(validation[i:i + 256]) for i in range(0, len(validation), 256)])
+    actual = lite(validation)
+    report = agreement(expected[:, 0], actual[:, 0])
+    print(f"\n Сверка на {len(validation)} текстах:")
+    print(f"   совпадение решений:        {report['label_agreement'] * 100:.2f}%")
+    print(f"   макс. |Δp|:                {report['max_abs_diff']:.5f}")
+    print(f"   средн. |Δp|:               {report['mean_abs_diff']:.5f}")
+
+    print(f"\n Задержка одного запроса, мс (p50 / p99):")
+    for name, fn in (("float (tf.function)", float_infer), ("tflite", lite)):
+        row = validation[:1]
+        summary = latency_summary(measure(lambda: fn(row), args.runs))
+        print(f"   {name:<22}{summary['p50_ms']:>8.2f} / {summary['p99_ms']:.2f}")
+
+    print(f"\n Размер: {os.path.getsize(args.src) / 1e6:.2f} МБ -> {os.path.getsize(args.dst) / 1e6:.2f} МБ")
+    if rss_before is not None:
+        print(f" RSS интерпретатора TFLite: +{rss_lite - rss_before:.1f} МБ")
+
+    if report["label_agreement"] < args.min_agreement:
+        print(f"\n❌ Совпадение ниже {args.min_agreement:.2%}, модель не стоит выкатывать")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,1251 @@
-import tensorflow as tf
 import numpy as np
+import functools
+import gc
+import hashlib
+import itertools
+import logging
+import math
+import os
 import pickle
-from tensorflow.keras.preprocessing.sequence import pad_sequences
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-# Глобальные переменные для загруженных объектов
+from predictor.fast_tokenizer import FastTokenizer, sample_corpus
+from predictor.metrics import REGISTRY, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Длина входной последовательности модели
+MAX_SEQUENCE_LENGTH = 200
+# Максимальный размер пакета за один вызов модели
+BATCH_CHUNK_SIZE = 512
+# Длины корзин паддинга по умолчанию (см. configure_buckets)
+PADDING_BUCKETS = (32, 64, 128, MAX_SEQUENCE_LENGTH)
+# Допустимое расхождение вероятностей на корзине и на полном входе
+BUCKET_TOLERANCE = 1e-6
+# Максимум возмущенных входов в explain_viral (по одному на слово)
+EXPLAIN_MAX_PERTURBATIONS = MAX_SEQUENCE_LENGTH
+# Имя основной модели (load_model_and_tokenizer) в реестре моделей и метриках
+PRIMARY_MODEL = 'primary'
+# Пакетов в очереди теневой оценки; сверх этого теневая оценка пакета пропускается
+SHADOW_MAX_PENDING = 4
+
+BUCKET_ROWS = REGISTRY.counter(
+    'viral_bucket_rows_total', 'Строки, посчитанные моделью, по ширине входа', labelnames=('length',)
+)
+MODEL_SECONDS = REGISTRY.histogram(
+    'viral_model_seconds', 'Время вызова модели по моделям реестра', labelnames=('model',)
+)
+MODEL_SCORES = REGISTRY.histogram(
+    'viral_model_score', 'Вероятности по моделям: выданные пользователю (served) и теневые (shadow)',
+    labelnames=('model', 'role'), buckets=tuple(i / 10 for i in range(1, 11))
+)
+SHADOW_ROWS = REGISTRY.counter(
+    'viral_shadow_rows_total', 'Строки теневой оценки: посчитаны, с другим решением is_viral, пропущены',
+    labelnames=('model', 'outcome')
+)
+SHADOW_ERRORS = REGISTRY.counter(
+    'viral_shadow_errors_total', 'Блоки, на которых теневая модель завершилась ошибкой', labelnames=('model',)
+)
+SHADOW_ABS_DIFF = REGISTRY.histogram(
+    'viral_shadow_abs_diff', 'Расхождение вероятностей теневой и выданной модели',
+    labelnames=('model',), buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+)
+
+# Основная модель (LoadedModel): заменяется одной ссылкой (activate_model),
+# так что запрос видит согласованные модель, словарь, корзины и кэш входов
+_primary = None
+# Бэкенд и токенизатор основной модели - для офлайн-скриптов; запросы берут current_model()
 _model = None
 _tokenizer = None
+# Ограничения потоков из set_thread_limits (0 - по умолчанию)
+_intra_op_threads = 0
+_inter_op_threads = 0
+# Запрошенные корзины (configure_buckets); включенные хранит каждая модель
+_requested_buckets = PADDING_BUCKETS
+# Размер кэша входов основной модели (configure_sequence_cache), 0 - без кэша
+_sequence_cache_size = 50000
+# Замена основной модели и учет вызовов, закрепивших ее (pinned)
+_swap_lock = threading.Condition()
+_pinned = threading.local()
+# Дополнительные модели для A/B и теневой оценки: имя -> LoadedModel
+_variants = {}
+# Теневые модели, их поток и число пакетов в очереди
+_shadows = ()
+_shadow_executor = None
+_shadow_pending = 0
+_shadow_lock = threading.Lock()
+
+
+class InferenceBackend:
+    """
+    Бэкенд инференса: вызов с массивом (N, 200) int32 возвращает
+    вероятности (N, 1) float32
+
+    Бэкенд выбирается по расширению файла модели (см. BACKENDS) и сам
+    импортирует свой рантайм в load, поэтому tensorflow загружается
+    только для моделей Keras. Бэкенды с variable_length принимают и
+    более узкий вход (N, L) - на этом строятся корзины паддинга.
+    """
+
+    name = None
+    variable_length = False
+
+    @classmethod
+    def load(cls, path):
+        raise NotImplementedError
+
+    @classmethod
+    def import_runtime(cls):
+        """Импорт и инициализация рантайма без загрузки модели (см. prepare_model)"""
+
+    def __call__(self, padded):
+        raise NotImplementedError
+
+    def embeddings(self):
+        """Матрица слоя Embedding (словарь x размерность) или None, если недоступна"""
+        return None
+
+
+class KerasBackend(InferenceBackend):
+    """
+    Модель Keras (.keras/.h5) через tf.function с сигнатурой (None, L) int32
+
+    В отличие от model.predict, вызов не создает data adapter и цикл по
+    батчам, а граф трассируется один раз для любого размера пакета -
+    отдельно для каждой ширины входа L (корзины паддинга).
+
+    Вход сохраненной модели обычно зафиксирован на 200, поэтому для
+    узких входов те же слои (с теми же весами) пересобираются поверх
+    Input(shape=(None,)). Если модель - не линейная цепочка слоев или
+    какой-то слой требует фиксированной длины, variable_length = False.
+    """
+
+    name = "keras"
+
+    def __init__(self, model):
+        import tensorflow as tf
+
+        self.model = model
+        self._tf = tf
+        self._functions = {}
+        self._lock = threading.Lock()
+        self._variable_model = self._chain_with_variable_length(model)
+        self.variable_length = self._variable_model is not None
+
+    @staticmethod
+    def _chain_with_variable_length(model):
+        import keras
+
+        try:
+            inputs = keras.Input(shape=(None,), dtype='int32')
+            x = inputs
+            for layer in model.layers:
+                if not isinstance(layer, keras.layers.InputLayer):
+                    x = layer(x)
+            return keras.Model(inputs, x)
+        except Exception:
+            return None
+
+    @classmethod
+    def import_runtime(cls):
+        import tensorflow as tf
+
+        # Первая операция создает контекст исполнения и пулы потоков TF
+        tf.constant(0)
+
+    @classmethod
+    def load(cls, path):
+        import tensorflow as tf
+
+        try:
+            if _intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(_intra_op_threads)
+            if _inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(_inter_op_threads)
+        except RuntimeError:
+            # Рантайм TF уже инициализирован (повторная загрузка) - настройки остаются прежними
+            pass
+        return cls(tf.keras.models.load_model(path))
+
+    def _function(self, length):
+        function = self._functions.get(length)
+        if function is None:
+            tf = self._tf
+            # Полный вход всегда считает исходная модель
+            model = self.model if length == MAX_SEQUENCE_LENGTH else self._variable_model
+            with self._lock:
+                function = self._functions.get(length)
+                if function is None:
+                    function = tf.function(
+                        lambda inputs: model(inputs, training=False),
+                        input_signature=[tf.TensorSpec(shape=(None, length), dtype=tf.int32)]
+                    )
+                    self._functions[length] = function
+        return function
+
+    def __call__(self, padded):
+        inputs = self._tf.convert_to_tensor(padded, dtype=self._tf.int32)
+        return self._function(padded.shape[1])(inputs).numpy()
+
+    def embeddings(self):
+        for layer in self.model.layers:
+            if type(layer).__name__ == 'Embedding':
+                return np.asarray(layer.get_weights()[0])
+        return None
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    Модель .tflite (см. predictor/quantize.py) через интерпретатор LiteRT
+
+    Модели с рекуррентными слоями экспортируются с фиксированным размером
+    пакета - тогда вход режется на блоки этого размера, а последний блок
+    дополняется нулями. Интерпретатор не потокобезопасен, поэтому вызовы
+    идут под блокировкой.
+    """
 
+    name = "tflite"
 
-def load_model_and_tokenizer(model_path, tokenizer_path):
+    def __init__(self, path, num_threads=None):
+        self.interpreter = _lite_interpreter(path, num_threads)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self._input = input_details['index']
+        self._output = self.interpreter.get_output_details()[0]['index']
+        batch = int(input_details['shape_signature'][0])
+        # None - размер пакета меняется под каждый вызов
+        self.fixed_batch = batch if batch > 0 else None
+        self._batch = int(input_details['shape'][0])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def import_runtime(cls):
+        _lite_interpreter_class()
+
+    @classmethod
+    def load(cls, path):
+        return cls(path, num_threads=_intra_op_threads or None)
+
+    def __call__(self, padded):
+        with self._lock:
+            if self.fixed_batch is None:
+                return self._invoke(padded)
+
+            size = self.fixed_batch
+            outputs = []
+            for start in range(0, len(padded), size):
+                block = padded[start:start + size]
+                if len(block) < size:
+                    block = np.concatenate(
+                        [block, np.zeros((size - len(block), block.shape[1]), dtype=block.dtype)]
+                    )
+                outputs.append(self._invoke(block))
+            return np.concatenate(outputs)[:len(padded)]
+
+    def _invoke(self, padded):
+        if len(padded) != self._batch:
+            self.interpreter.resize_tensor_input(self._input, padded.shape)
+            self.interpreter.allocate_tensors()
+            self._batch = len(padded)
+        self.interpreter.set_tensor(self._input, np.ascontiguousarray(padded, dtype=np.int32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self._output).copy()
+
+
+def _lite_interpreter(path, num_threads=None):
+    return _lite_interpreter_class()(model_path=str(path), num_threads=num_threads)
+
+
+def _lite_interpreter_class():
+    """
+    Интерпретатор из ai_edge_litert или tflite_runtime, если они установлены
+    (без импорта tensorflow), иначе tf.lite
     """
-    Загружает модель и токенизатор (вызвать один раз при старте)
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class NumpyBackend(InferenceBackend):
+    """Веса, экспортированные в .npz (predictor/numpy_runtime.py), на чистом NumPy"""
+
+    name = "numpy"
+    variable_length = True
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def import_runtime(cls):
+        import predictor.numpy_runtime
+
+    @classmethod
+    def load(cls, path):
+        from predictor.numpy_runtime import NumpyModel
+
+        return cls(NumpyModel.load(path))
+
+    def __call__(self, padded):
+        return self.model(padded)
+
+    def embeddings(self):
+        for spec, weights in zip(self.model.layers, self.model.weights):
+            if spec['type'] == 'Embedding':
+                return weights[0]
+        return None
+
+
+# Бэкенды по расширению файла модели; остальные пути открываются через Keras
+BACKENDS = {
+    '.keras': KerasBackend,
+    '.h5': KerasBackend,
+    '.tflite': TFLiteBackend,
+    '.npz': NumpyBackend,
+}
+
+
+def register_backend(suffix, backend):
+    """Регистрация бэкенда для файлов моделей с расширением suffix"""
+    BACKENDS[suffix.lower()] = backend
+
+
+def backend_for_path(path):
+    return BACKENDS.get(os.path.splitext(str(path))[1].lower(), KerasBackend)
+
+
+class SequenceCache:
+    """
+    LRU-кэш вероятностей по входу модели (строке паддинга из 200 id)
+
+    Разные тексты часто дают одинаковый вход: отличаются только
+    пунктуацией, OOV-словами или хвостом после 200-го токена.
+    Ключ - 16-байтный хеш строки, поэтому запись занимает десятки байт.
+    Вызывается из потоков пула, поэтому операции под блокировкой.
+    """
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(row):
+        return hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            probability = self._entries.get(key)
+            if probability is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return probability
+
+    def put(self, key, probability):
+        with self._lock:
+            self._entries[key] = probability
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def configure_sequence_cache(max_entries):
+    """Размер кэша по входу модели; 0 отключает кэш"""
+    global _sequence_cache_size
+    _sequence_cache_size = max_entries
+    if _primary is not None:
+        _primary.sequence_cache = SequenceCache(max_entries) if max_entries > 0 else None
+
+
+def sequence_cache_stats():
+    """Счетчики кэша по входу модели (None, если кэш отключен)"""
+    model = current_model()
+    if model is None or model.sequence_cache is None:
+        return None
+    return model.sequence_cache.stats()
+
+
+def configure_buckets(lengths=PADDING_BUCKETS):
+    """
+    Длины корзин паддинга; пустой список - всегда полный вход 200
+
+    Вызывать до загрузки модели: корзины включаются при загрузке, только
+    если бэкенд принимает вход переменной длины и проверка check_buckets
+    показала совпадение с полным входом.
+    """
+    global _requested_buckets
+    lengths = sorted({int(length) for length in lengths if 0 < int(length) <= MAX_SEQUENCE_LENGTH})
+    if lengths and lengths[-1] != MAX_SEQUENCE_LENGTH:
+        lengths.append(MAX_SEQUENCE_LENGTH)
+    _requested_buckets = tuple(lengths)
+
+
+def active_buckets():
+    """Включенные корзины паддинга (None - модель считает полный вход)"""
+    model = current_model()
+    return model.buckets if model is not None else None
+
+
+def set_thread_limits(intra_op_threads=0, inter_op_threads=0):
+    """
+    Ограничивает пулы потоков инференса (0 - значение по умолчанию)
+
+    Вызывать до загрузки модели: настройки применяются бэкендом при
+    загрузке, а после инициализации рантайма TF их менять нельзя.
+    intra_op_threads задает и число потоков интерпретатора для моделей .tflite.
+    """
+    global _intra_op_threads, _inter_op_threads
+    _intra_op_threads = intra_op_threads
+    _inter_op_threads = inter_op_threads
+
+
+def load_tokenizer(path):
+    """Словарь .npz (FastTokenizer) или pickle keras Tokenizer (.pkl)"""
+    if str(path).endswith('.npz'):
+        return FastTokenizer.load(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def encode_texts(tokenizer, texts, out=None):
+    """
+    Нормализация, токенизация и паддинг текстов без загруженной модели
+    (для процессов, которые только готовят вход, и офлайн-скриптов)
+    """
+    cleaned = [' '.join(str(text).lower().split()) for text in texts]
+    if out is None:
+        out = np.zeros((len(cleaned), MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    if isinstance(tokenizer, FastTokenizer):
+        return tokenizer.encode(cleaned, out=out)
+    return _pad_into(out, tokenizer.texts_to_sequences(cleaned))
+
+
+def load_model_and_tokenizer(model_path, tokenizer_path, on_stage=None, max_rss_mb=None):
+    """
+    Загружает модель и токенизатор и переключает на них запросы
+
+    При старте вызывается один раз; повторный вызов - горячая замена:
+    prepare_model, activate_model и retire_model подряд (сервис бота
+    вызывает их по отдельности, чтобы переключить версию в кэшах ровно
+    в момент замены).
+
+    Args:
+        model_path: путь к модели; бэкенд выбирается по расширению (см. BACKENDS):
+            .keras/.h5 - Keras, .tflite - LiteRT, .npz - NumPy без TensorFlow
+        tokenizer_path: путь к словарю .npz (FastTokenizer) или к токенизатору .pkl
+        on_stage: необязательный колбэк, вызывается с именем этапа
+            ("model", "warmup", "tokenizer", "buckets") перед его началом
+        max_rss_mb: ограничение памяти процесса на время загрузки (см. prepare_model)
+
+    Returns:
+        LoadedModel: загруженная модель
+    """
+    loaded = prepare_model(model_path, tokenizer_path, on_stage, max_rss_mb)
+    previous = activate_model(loaded)
+    if previous is not None:
+        retire_model(previous)
+    return loaded
+
+
+def prepare_model(model_path, tokenizer_path, on_stage=None, max_rss_mb=None, name=PRIMARY_MODEL):
+    """
+    Загрузка и прогрев модели без переключения на нее запросов
+
+    Если словарь совпадает со словарем уже загруженной модели (по хешу
+    файла), токенизатор не загружается повторно, а берется общий.
 
     Args:
-        model_path: путь к файлу модели .h5
-        tokenizer_path: путь к файлу токенизатора .pkl
+        max_rss_mb: ограничение RSS процесса, МБ (None или 0 - без него).
+            Загрузка не начинается, если текущий RSS плюс объем памяти,
+            который заняла основная модель (с поправкой на размер файла),
+            его превысит, и прерывается, если RSS превысил его после чтения
+            модели. Обе модели живут в памяти одновременно до retire_model.
+
+    Returns:
+        LoadedModel с footprint_mb (прирост RSS за загрузку) и peak_rss_mb
+        (пик RSS процесса за загрузку, если его можно измерить)
     """
-    global _model, _tokenizer
+    on_stage = on_stage or (lambda stage: None)
+    label = '' if name == PRIMARY_MODEL else f' {name}'
 
+    # Рантайм (TensorFlow - сотни МБ) грузится один раз на процесс: замер
+    # до его импорта приписал бы его первой модели, и по нему
+    # _estimate_footprint завысил бы прогноз для следующих загрузок
+    backend = backend_for_path(model_path)
     try:
-        _model = tf.keras.models.load_model(model_path)
-        print(f" Модель загружена из {model_path}")
-    except Exception as e:
-        raise Exception(f"Ошибка загрузки модели: {e}")
+        backend.import_runtime()
+    except ImportError as e:
+        raise Exception(f"Ошибка загрузки модели{label}: {e}")
+    before = _rss_mb()
+    if max_rss_mb and before is not None:
+        estimate = _estimate_footprint(model_path)
+        if estimate is not None and before + estimate > max_rss_mb:
+            raise MemoryError(
+                f"Загрузка модели{label} превысит лимит памяти: "
+                f"~{before + estimate:.0f} из {max_rss_mb:.0f} МБ"
+            )
+    tracking = _reset_peak_rss()
 
+    on_stage("model")
     try:
-        with open(tokenizer_path, 'rb') as f:
-            _tokenizer = pickle.load(f)
-        print(f"Токенизатор загружен из {tokenizer_path}")
+        model = backend.load(model_path)
     except Exception as e:
-        raise Exception(f"Ошибка загрузки токенизатора: {e}")
+        raise Exception(f"Ошибка загрузки модели{label}: {e}")
+    print(f" Модель{label} загружена из {model_path} (бэкенд {model.name})")
+
+    rss = _rss_mb()
+    if max_rss_mb and rss is not None and rss > max_rss_mb:
+        del model
+        gc.collect()
+        raise MemoryError(f"Модель{label} превысила лимит памяти: {rss:.0f} из {max_rss_mb:.0f} МБ")
+
+    on_stage("warmup")
+    # Прогрев: трассировка графа (или выделение тензоров TFLite) здесь, а не на первом запросе
+    model(np.zeros((1, MAX_SEQUENCE_LENGTH), dtype=np.int32))
+
+    on_stage("tokenizer")
+    vocabulary = _file_digest(tokenizer_path)
+    tokenizer = _shared_tokenizer(vocabulary)
+    if tokenizer is None:
+        try:
+            tokenizer = load_tokenizer(tokenizer_path)
+            print(f"Токенизатор загружен из {tokenizer_path}")
+        except Exception as e:
+            raise Exception(f"Ошибка загрузки токенизатора: {e}")
+
+    sequence_cache = None
+    if name == PRIMARY_MODEL and _sequence_cache_size > 0:
+        # Свой кэш у каждой версии: старые вероятности уходят вместе со старой моделью
+        sequence_cache = SequenceCache(_sequence_cache_size)
+    loaded = LoadedModel(name, model, tokenizer, vocabulary, sequence_cache=sequence_cache, path=model_path)
+
+    if _requested_buckets and model.variable_length:
+        on_stage("buckets")
+        loaded.buckets, loaded.bucket_costs = _select_buckets(model, tokenizer)
+
+    after = _rss_mb()
+    if before is not None and after is not None:
+        loaded.footprint_mb = max(0.0, after - before)
+        loaded.peak_rss_mb = _peak_rss_mb() if tracking else after
+
+    # Сотни тысяч объектов TensorFlow и модели живут до ее замены: без
+    # заморозки каждая полная сборка мусора обходит их заново (пауза ~0.2 с)
+    gc.freeze()
+    return loaded
+
+
+def activate_model(loaded):
+    """
+    Атомарно переключает новые запросы на основную модель loaded
+
+    Вызовы, уже закрепившие прежнюю модель (pinned), досчитываются на ней.
+
+    Returns:
+        прежняя основная модель (None при первой загрузке)
+    """
+    global _primary, _model, _tokenizer
+
+    with _swap_lock:
+        previous, _primary = _primary, loaded
+        _model, _tokenizer = loaded.model, loaded.tokenizer
+    return previous
+
+
+def retire_model(model, timeout=None):
+    """
+    Освобождает замененную модель, когда завершатся закрепившие ее вызовы
+
+    Объекты модели заморожены gc.freeze(), и циклы ссылок TensorFlow
+    собираются только после gc.unfreeze(). Сборка до окончания вызовов
+    не освободила бы модель, а повторная заморозка оставила бы ее в
+    памяти навсегда, поэтому если вызовы не завершились за timeout,
+    модель остается у них, а сборка откладывается до следующей замены.
+
+    Returns:
+        True, если все вызовы завершились за timeout секунд
+    """
+    with _swap_lock:
+        drained = _swap_lock.wait_for(lambda: model.pins == 0, timeout)
+    if drained:
+        model.release()
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        _trim_heap()
+    return drained
+
+
+def current_model():
+    """Основная модель текущего вызова: закрепленная (pinned) или активная"""
+    return getattr(_pinned, 'model', None) or _primary
+
+
+@contextmanager
+def pinned():
+    """
+    Закрепляет основную модель за потоком на время вызова: горячая замена
+    не смешает в одном запросе старую модель с новым словарем, а старая
+    освобождается только после снятия всех закреплений (retire_model)
+    """
+    model = getattr(_pinned, 'model', None)
+    if model is not None:
+        # Вложенный вызов (optimize_post -> occlusion) использует ту же модель
+        yield model
+        return
+
+    with _swap_lock:
+        model = _primary
+        if model is None:
+            raise Exception("Сначала вызовите load_model_and_tokenizer()")
+        model.pins += 1
+    _pinned.model = model
+    try:
+        yield model
+    finally:
+        _pinned.model = None
+        with _swap_lock:
+            model.pins -= 1
+            if not model.pins:
+                _swap_lock.notify_all()
+
+
+def with_pinned_model(fn):
+    """Декоратор: весь вызов fn выполняется на одной основной модели (pinned)"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with pinned():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _shared_tokenizer(vocabulary):
+    """Уже загруженный токенизатор с тем же словарем или None"""
+    models = ([_primary] if _primary is not None else []) + list(_variants.values())
+    for model in models:
+        if model.vocabulary == vocabulary and model.tokenizer is not None:
+            return model.tokenizer
+    return None
+
+
+def _estimate_footprint(model_path):
+    """Ожидаемый прирост RSS от загрузки модели по замеру текущей основной, МБ"""
+    if _primary is None or _primary.footprint_mb is None:
+        return None
+    try:
+        ratio = os.path.getsize(model_path) / max(1, os.path.getsize(_primary.path))
+    except OSError:
+        return None
+    return _primary.footprint_mb * max(1.0, ratio)
+
+
+def _rss_mb():
+    """Текущий RSS процесса, МБ (None вне Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
 
 
-def predict_viral(text, threshold=0.5):
-    global _model, _tokenizer
+def _reset_peak_rss():
+    """Сбрасывает пик RSS (VmHWM) до текущего; False, если ядро этого не умеет"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return None
 
-    # Проверка загрузки
-    if _model is None or _tokenizer is None:
-        raise Exception("Сначала вызовите load_model_and_tokenizer()")
 
+def _trim_heap():
+    """Возвращает системе освобожденную память кучи (glibc), чтобы RSS упал сразу"""
+    try:
+        import ctypes
+
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _select_buckets(infer, tokenizer):
+    """
+    Корзины паддинга и замеры их стоимости, если модель дает на них те же
+    оценки, что на полном входе, иначе (None, None). Заодно трассирует
+    функцию для каждой корзины
+    """
+    diff = check_buckets(infer, _requested_buckets, _probe_rows(tokenizer))
+    if diff > BUCKET_TOLERANCE:
+        print(f" Корзины паддинга отключены: выход модели зависит от паддинга (|Δp| = {diff:.1e})")
+        return None, None
+    costs = measure_bucket_costs(infer, _requested_buckets)
+    print(f" Корзины паддинга: {', '.join(map(str, _requested_buckets))} (|Δp| = {diff:.1e})")
+    return _requested_buckets, costs
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LoadedModel:
+    """
+    Загруженная модель: бэкенд, токенизатор, корзины паддинга и кэш входов
+
+    Так устроены и основная модель, и дополнительные модели реестра
+    (A/B, теневые). vocabulary - хеш файла словаря: модели с одинаковым
+    словарем делят один объект токенизатора, а текст для них
+    токенизируется один раз (см. _score_models). Кэш входов есть только
+    у основной модели. pins - вызовы, закрепившие модель (pinned).
+    """
+
+    def __init__(self, name, model, tokenizer, vocabulary, buckets=None, bucket_costs=None,
+                 sequence_cache=None, path=None):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        self.vocabulary = vocabulary
+        self.buckets = buckets
+        # Оценка времени вызова по корзинам: ширина -> (пакет из 1 строки, каждая следующая строка), с
+        self.bucket_costs = bucket_costs
+        # То же для полного входа без корзин, замеряется при первом call_cost()
+        self.full_input_cost = None
+        self.sequence_cache = sequence_cache
+        self.path = path
+        self.footprint_mb = None
+        self.peak_rss_mb = None
+        self.pins = 0
+
+    def __call__(self, padded):
+        """Вероятности (N,) для входа (N, 200) в словаре этой модели"""
+        with MODEL_SECONDS.time(model=self.name):
+            if self.buckets is None:
+                BUCKET_ROWS.inc(len(padded), length=padded.shape[1])
+                return self.model(padded)[:, 0]
+            return _run_bucketed(self.model, padded, self.buckets, self.bucket_costs, counter=BUCKET_ROWS)[:, 0]
+
+    def release(self):
+        """Отпускает бэкенд, токенизатор и кэш (после замены, см. retire_model)"""
+        self.model = self.tokenizer = self.sequence_cache = None
+
+
+def load_variant(name, model_path, tokenizer_path):
+    """
+    Загружает дополнительную модель рядом с основной (вызывать после
+    load_model_and_tokenizer); повторная загрузка под тем же именем
+    заменяет модель
+    """
+    if name == PRIMARY_MODEL:
+        raise ValueError(f"Имя {PRIMARY_MODEL} занято основной моделью")
+    _variants[name] = prepare_model(model_path, tokenizer_path, name=name)
+
+
+def configure_shadows(names):
+    """Модели, которые считают каждый пакет в фоне для сравнения (вызывать после load_variant)"""
+    global _shadows
+    unknown = [name for name in names if name not in _variants]
+    if unknown:
+        raise ValueError(f"Теневые модели не загружены: {', '.join(unknown)}")
+    _shadows = tuple(names)
+
+
+def model_names():
+    """Основная модель и загруженные дополнительные"""
+    return (PRIMARY_MODEL,) + tuple(_variants)
+
+
+@with_pinned_model
+def predict_viral(text, threshold=0.5, model=None):
+    """
+    Предсказание для одного текста; model - имя модели реестра
+    (None - основная). В результате 'model' - какая модель его дала
+    """
     # Очистка текста
     text = str(text).strip()
     if not text:
         raise ValueError("Текст не может быть пустым")
 
-    cleaned_text = ' '.join(text.lower().split())
+    with STAGE_SECONDS.time(stage='normalize'):
+        cleaned_text = ' '.join(text.lower().split())
+
+    padded = _encode([cleaned_text], np.zeros((1, MAX_SEQUENCE_LENGTH), dtype=np.int32))
+
+    probabilities, models = _score_models([cleaned_text], padded, None if model is None else [model], threshold)
+
+    return build_result(text, float(probabilities[0]), threshold, models[0])
+
+
+@with_pinned_model
+def predict_viral_batch(texts, threshold=0.5, chunk_size=BATCH_CHUNK_SIZE, models=None):
+    """
+    Пакетное предсказание: один проход токенизатора и один вызов модели
+    на каждый блок из chunk_size текстов
+
+    Args:
+        texts (list[str]): тексты постов
+        threshold (float): порог виральности
+        chunk_size (int): ограничение размера блока (память под вход модели)
+        models (list[str]): имя модели реестра для каждого текста (A/B);
+            None - все тексты считает основная модель
+
+    Returns:
+        list[dict]: результаты в том же порядке, что и texts
+    """
+    texts = [str(text).strip() for text in texts]
+    if not texts:
+        return []
+    if not all(texts):
+        raise ValueError("Текст не может быть пустым")
+
+    chunk_size = max(1, chunk_size)
+    # Буфер под вход модели выделяется один раз и переиспользуется для блоков
+    buffer = np.zeros((min(len(texts), chunk_size), MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    results = []
+
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start:start + chunk_size]
+        with STAGE_SECONDS.time(stage='normalize'):
+            cleaned_texts = [' '.join(text.lower().split()) for text in chunk]
+
+        padded = _encode(cleaned_texts, buffer[:len(chunk)])
+
+        probabilities, served = _score_models(
+            cleaned_texts, padded, None if models is None else models[start:start + chunk_size], threshold
+        )
+
+        results.extend(
+            build_result(text, float(probability), threshold, model)
+            for text, probability, model in zip(chunk, probabilities, served)
+        )
+
+    return results
+
+
+@with_pinned_model
+def explain_viral(text, threshold=0.5, max_perturbations=EXPLAIN_MAX_PERTURBATIONS, budget_ms=None):
+    """
+    Вклад слов в оценку методом окклюзии (leave-one-out)
+
+    Для каждого слова строится вход модели, из которого это слово удалено
+    (остальные сдвигаются влево, как если бы его не было в тексте), и все
+    такие входы считаются одним пакетом. Вклад слова - насколько падает
+    вероятность без него: положительный тянет оценку вверх.
+
+    Если слов больше, чем позволяет бюджет, удаляются не отдельные слова,
+    а отрезки из window слов подряд.
+
+    Args:
+        text (str): текст поста
+        threshold (float): порог виральности
+        max_perturbations (int): максимум возмущенных входов (строк пакета)
+        budget_ms (float): ограничение времени модели на возмущенные входы;
+            число строк подбирается по оценке времени вызова (call_cost)
+
+    Returns:
+        dict: результат predict_viral, а также 'attributions' - список
+        (фрагмент, вклад) в порядке текста, 'window' - слов во фрагменте,
+        'truncated' - текст длиннее входа модели и хвост не учитывается
+    """
+    text = str(text).strip()
+    if not text:
+        raise ValueError("Текст не может быть пустым")
+
+    ids, words, truncated = _tokens(' '.join(text.lower().split()))
+    padded = np.zeros((1, MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    padded[0, :len(ids)] = ids
+    # Через score_inputs, как в predict_viral: та же вероятность и тот же кэш входов
+    probability = float(score_inputs(padded)[0])
+
+    limit = max(1, max_perturbations)
+    if budget_ms is not None:
+        limit = min(limit, rows_within(budget_ms / 1000))
+    window = max(1, math.ceil(len(ids) / limit))
+
+    deltas = occlusion(ids, probability, window)
+    attributions = [
+        (' '.join(words[start:start + window]), float(delta))
+        for start, delta in zip(range(0, len(ids), window), deltas)
+    ]
 
-    sequence = _tokenizer.texts_to_sequences([cleaned_text])
+    result = build_result(text, probability, threshold)
+    result['attributions'] = attributions
+    result['window'] = window
+    result['truncated'] = truncated
+    return result
+
+
+def occlusion(ids, probability, window=1):
+    """
+    Падение вероятности при удалении каждого отрезка из window id подряд
+    (остальные id сдвигаются влево); все варианты - одним пакетом
+    """
+    starts = range(0, len(ids), window)
+    rows = np.zeros((len(starts), MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    for row, start in zip(rows, starts):
+        kept = np.concatenate([ids[:start], ids[start + window:]])
+        row[:len(kept)] = kept
+    return probability - score_rows(rows)
 
-    padded = pad_sequences(sequence, maxlen=200, padding='post', truncating='post')
 
-    probability = float(_model.predict(padded, verbose=0)[0][0])
+def score_rows(rows):
+    """
+    Вероятности для подготовленных входов (N, 200) блоками по BATCH_CHUNK_SIZE
+    мимо кэша входов: сгенерированные варианты текста больше не встретятся
+    """
+    if not len(rows):
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate([
+        _run_model(rows[i:i + BATCH_CHUNK_SIZE])
+        for i in range(0, len(rows), BATCH_CHUNK_SIZE)
+    ])
+
+
+def call_cost():
+    """
+    Оценка времени вызова на полном входе (худший случай для любой корзины):
+    (пакет из 1 строки, каждая следующая строка), с. Берется из замеров
+    корзин, а без них измеряется при первом обращении
+    """
+    model = current_model()
+    if model.bucket_costs is not None:
+        return model.bucket_costs[model.buckets[-1]]
+    if model.full_input_cost is None:
+        model.full_input_cost = measure_bucket_costs(model.model, (MAX_SEQUENCE_LENGTH,))[MAX_SEQUENCE_LENGTH]
+    return model.full_input_cost
+
+
+def rows_within(seconds):
+    """Сколько строк (не меньше одной) модель успеет посчитать за seconds по call_cost"""
+    single, per_row = call_cost()
+    if per_row <= 0:
+        return BATCH_CHUNK_SIZE
+    return max(1, 1 + int((seconds - single) / per_row))
+
+
+def _tokens(cleaned_text):
+    """
+    id входа модели и соответствующие им слова (до MAX_SEQUENCE_LENGTH)
+    и признак того, что текст был усечен
+    """
+    tokenizer = current_model().tokenizer
+    if isinstance(tokenizer, FastTokenizer):
+        get, oov = tokenizer.word_index.get, tokenizer.oov_index
+        pairs = [(get(word, oov), word) for word in tokenizer.words(cleaned_text)]
+        pairs = [(i, word) for i, word in pairs if i is not None]
+    else:
+        index_word = tokenizer.index_word
+        pairs = [(i, index_word.get(i, '?')) for i in tokenizer.texts_to_sequences([cleaned_text])[0]]
+
+    truncated = len(pairs) > MAX_SEQUENCE_LENGTH
+    pairs = pairs[:MAX_SEQUENCE_LENGTH]
+    ids = np.array([i for i, _ in pairs], dtype=np.int32)
+    return ids, [word for _, word in pairs], truncated
+
+
+def score_inputs(padded):
+    """
+    Вероятности для строк padded; модель вызывается только для входов,
+    которых нет в кэше, причем одинаковые строки считаются один раз
+    """
+    cache = current_model().sequence_cache
+    if cache is None:
+        return _run_model(padded)
+
+    probabilities = np.empty(len(padded), dtype=np.float32)
+    keys = [cache.key(row) for row in padded]
+    pending = {}  # ключ -> индексы строк с этим входом
+
+    for i, key in enumerate(keys):
+        if key in pending:
+            pending[key].append(i)
+            continue
+        probability = cache.get(key)
+        if probability is None:
+            pending[key] = [i]
+        else:
+            probabilities[i] = probability
+
+    if pending:
+        first_rows = [rows[0] for rows in pending.values()]
+        computed = _run_model(padded[first_rows])
+        for (key, rows), probability in zip(pending.items(), computed):
+            probabilities[rows] = probability
+            cache.put(key, float(probability))
+
+    return probabilities
+
+
+def _score_models(cleaned_texts, padded, models, threshold):
+    """
+    Вероятности строк по моделям реестра: models - имя модели для каждой
+    строки или None (все считает основная). padded - вход основной модели;
+    для другого словаря тексты токенизируются один раз на весь блок.
+    После ответа блок в фоне считают теневые модели (см. configure_shadows)
+
+    Returns:
+        (вероятности (N,), имя модели для каждой строки)
+    """
+    inputs = {current_model().vocabulary: padded}
+    if models is None or all(model == PRIMARY_MODEL for model in models):
+        models = [PRIMARY_MODEL] * len(padded)
+        probabilities = score_inputs(padded)
+    else:
+        probabilities = np.empty(len(padded), dtype=np.float32)
+        for name in set(models):
+            rows = [i for i, model in enumerate(models) if model == name]
+            if name == PRIMARY_MODEL:
+                probabilities[rows] = score_inputs(padded[rows])
+                continue
+            variant = _variants.get(name)
+            if variant is None:
+                raise ValueError(f"Модель {name} не загружена")
+            probabilities[rows] = variant(_input_for(variant, cleaned_texts, inputs)[rows])
+
+    for model, probability in zip(models, probabilities):
+        MODEL_SCORES.observe(float(probability), model=model, role='served')
+    if _shadows:
+        # Буфер padded переиспользуется следующим блоком
+        _submit_shadow(cleaned_texts, {key: rows.copy() for key, rows in inputs.items()}, probabilities, threshold)
+    return probabilities, models
+
+
+def _input_for(variant, cleaned_texts, inputs):
+    """Вход модели в ее словаре; inputs - уже посчитанные входы по хешу словаря"""
+    padded = inputs.get(variant.vocabulary)
+    if padded is None:
+        with STAGE_SECONDS.time(stage='tokenize'):
+            padded = inputs[variant.vocabulary] = encode_texts(variant.tokenizer, cleaned_texts)
+    return padded
+
+
+def _submit_shadow(cleaned_texts, inputs, served, threshold):
+    """Теневая оценка блока в отдельном потоке, если очередь не переполнена"""
+    global _shadow_executor, _shadow_pending
+
+    with _shadow_lock:
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            for name in _shadows:
+                SHADOW_ROWS.inc(len(served), model=name, outcome='dropped')
+            return
+        _shadow_pending += 1
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+    _shadow_executor.submit(_run_shadow, cleaned_texts, inputs, served, threshold)
+
+
+def _run_shadow(cleaned_texts, inputs, served, threshold):
+    global _shadow_pending
+
+    try:
+        for name in _shadows:
+            # Ошибка одной теневой модели не мешает остальным
+            try:
+                variant = _variants[name]
+                probabilities = variant(_input_for(variant, cleaned_texts, inputs))
+            except Exception as e:
+                SHADOW_ERRORS.inc(model=name)
+                logger.exception(f"⚠️ Ошибка теневой оценки {name}: {e}")
+                continue
+            SHADOW_ROWS.inc(len(probabilities), model=name, outcome='scored')
+            SHADOW_ROWS.inc(
+                int(((probabilities > threshold) != (served > threshold)).sum()), model=name, outcome='disagreed'
+            )
+            for probability, diff in zip(probabilities, np.abs(probabilities - served)):
+                MODEL_SCORES.observe(float(probability), model=name, role='shadow')
+                SHADOW_ABS_DIFF.observe(float(diff), model=name)
+    finally:
+        with _shadow_lock:
+            _shadow_pending -= 1
+
+
+def _run_model(padded):
+    """Вероятности (N,) основной модели для подготовленного массива (N, 200)"""
+    with STAGE_SECONDS.time(stage='model'):
+        return current_model()(padded)
+
+
+def _sequence_lengths(padded):
+    """Длина каждой строки без хвостового паддинга (0 для пустых строк)"""
+    nonzero = padded != 0
+    last = padded.shape[1] - np.argmax(nonzero[:, ::-1], axis=1)
+    return np.where(nonzero.any(axis=1), last, 0)
+
+
+def _run_bucketed(infer, padded, buckets, costs=None, counter=None):
+    """
+    Строки раскладываются по наименьшей корзине, вмещающей последовательность,
+    и каждая группа считается одним вызовом на входе шириной в корзину
+
+    Отрезается только хвостовой паддинг, поэтому для моделей с маскированием
+    (Embedding(mask_zero=True) -> LSTM или пулинг с маской) результат тот же,
+    что на полном входе - это проверяет check_buckets при загрузке.
+
+    У рекуррентной модели время вызова почти не зависит от числа строк,
+    поэтому с оценкой costs соседние группы объединяются в более широкую
+    корзину, если один вызов дешевле нескольких (см. _plan_calls).
+    """
+    index = np.searchsorted(buckets, _sequence_lengths(padded))
+    groups, counts = np.unique(index, return_counts=True)
+    calls = _plan_calls(groups, counts, buckets, costs)
+
+    if len(calls) == 1:
+        width = buckets[calls[0][-1]]
+        if counter is not None:
+            counter.inc(len(padded), length=width)
+        return infer(padded[:, :width])
+
+    out = None
+    for call in calls:
+        rows = np.flatnonzero(np.isin(index, call))
+        width = buckets[call[-1]]
+        if counter is not None:
+            counter.inc(len(rows), length=width)
+        probabilities = infer(padded[rows, :width])
+        if out is None:
+            out = np.empty((len(padded),) + probabilities.shape[1:], dtype=probabilities.dtype)
+        out[rows] = probabilities
+    return out
+
+
+def _plan_calls(groups, counts, buckets, costs):
+    """
+    Разбиение непустых корзин (по возрастанию) на вызовы модели
+
+    Каждый вызов - подряд идущие корзины, которые считаются на ширине
+    последней из них. Корзин не больше нескольких, поэтому перебираются
+    все разбиения и берется самое дешевое по оценке costs. Без оценки
+    каждая корзина считается отдельно.
+    """
+    groups = [int(group) for group in groups]
+    if costs is None or len(groups) == 1:
+        return [[group] for group in groups]
+
+    best, best_cost = None, float('inf')
+    for cuts in itertools.product((False, True), repeat=len(groups) - 1):
+        calls, rows, cost = [[groups[0]]], [int(counts[0])], 0.0
+        for cut, group, count in zip(cuts, groups[1:], counts[1:]):
+            if cut:
+                calls.append([group])
+                rows.append(int(count))
+            else:
+                calls[-1].append(group)
+                rows[-1] += int(count)
+        for call, n in zip(calls, rows):
+            single, per_row = costs[buckets[call[-1]]]
+            cost += single + per_row * (n - 1)
+        if cost < best_cost:
+            best, best_cost = calls, cost
+    return best
+
+
+def measure_bucket_costs(infer, buckets, rows=32, repeats=5):
+    """Время вызова на каждой корзине: для пакета из 1 строки и прирост на строку"""
+    costs = {}
+    for width in buckets:
+        samples = {}
+        for n in (1, rows):
+            batch = np.ones((n, width), dtype=np.int32)
+            infer(batch)
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                infer(batch)
+                best = min(best, time.perf_counter() - start)
+            samples[n] = best
+        costs[width] = (samples[1], max(0.0, samples[rows] - samples[1]) / (rows - 1))
+    return costs
+
+
+def _probe_rows(tokenizer, size=256, seed=0):
+    """Входы модели всех длин от 1 до 200 из id, которые реально выдает токенизатор"""
+    rng = np.random.default_rng(seed)
+    encoded = _pad_into(
+        np.zeros((200, MAX_SEQUENCE_LENGTH), dtype=np.int32),
+        tokenizer.texts_to_sequences([' '.join(text.lower().split()) for text in sample_corpus(tokenizer, 200)])
+    )
+    ids = np.unique(encoded[encoded != 0])
+    if not len(ids):
+        ids = np.array([1], dtype=np.int32)
+
+    rows = np.zeros((size, MAX_SEQUENCE_LENGTH), dtype=np.int32)
+    for i, length in enumerate(np.linspace(1, MAX_SEQUENCE_LENGTH, size).astype(int)):
+        rows[i, :length] = rng.choice(ids, size=length)
+    return rows
+
+
+def check_buckets(infer, buckets, rows):
+    """Максимальное расхождение вероятностей при счете по корзинам и на полном входе"""
+    expected = infer(rows)
+    actual = _run_bucketed(infer, rows, buckets)
+    return float(np.abs(expected - actual).max())
+
+
+def _encode(cleaned_texts, out):
+    """Токенизация с паддингом до out.shape[1] прямо в буфер out"""
+    tokenizer = current_model().tokenizer
+    with STAGE_SECONDS.time(stage='tokenize'):
+        if isinstance(tokenizer, FastTokenizer):
+            sequences = tokenizer.texts_to_sequences(cleaned_texts, out.shape[1])
+        else:
+            sequences = tokenizer.texts_to_sequences(cleaned_texts)
+    with STAGE_SECONDS.time(stage='pad'):
+        return _pad_into(out, sequences)
+
+
+def _pad_into(out, sequences):
+    """
+    Заполняет out последовательностями так же, как
+    pad_sequences(padding='post', truncating='post')
+    """
+    out.fill(0)
+    maxlen = out.shape[1]
+    for row, sequence in zip(out, sequences):
+        sequence = sequence[:maxlen]
+        row[:len(sequence)] = sequence
+    return out
+
 
+def build_result(text, probability, threshold, model=PRIMARY_MODEL):
+    """Формирует словарь результата по вероятности модели"""
     is_viral = probability > threshold
 
     if is_viral:
@@ -70,7 +1264,8 @@ def predict_viral(text, threshold=0.5):
         'probability': probability,
         'text_sample': text[:100] + '...' if len(text) > 100 else text,
         'message': message,
-        'threshold': threshold
+        'threshold': threshold,
+        'model': model
     }
 
 
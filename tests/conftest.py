@@ -0,0 +1,44 @@
+# tests/conftest.py
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKENIZER_PATH = os.path.join(ROOT, "tokenizers", "vocab.npz")
+KERAS_TOKENIZER_PATH = os.path.join(ROOT, "tokenizers", "tokenizer.pkl")
+
+
+def build_lstm_model(vocabulary_size=10000, seed=0):
+    """Небольшая модель той же архитектуры, что основная: Embedding с маской + LSTM"""
+    import keras
+
+    keras.utils.set_random_seed(seed)
+    inputs = keras.Input(shape=(200,), dtype="int32")
+    x = keras.layers.Embedding(vocabulary_size, 16, mask_zero=True)(inputs)
+    x = keras.layers.LSTM(8)(x)
+    outputs = keras.layers.Dense(1, activation="sigmoid")(x)
+    model = keras.Model(inputs, outputs)
+    # Случайные веса дают вероятности около 0.5: растягиваем, чтобы различия были заметны
+    embedding = model.layers[1]
+    embedding.set_weights([np.random.default_rng(seed).normal(0, 1, (vocabulary_size, 16)).astype("float32")])
+    return model
+
+
+@pytest.fixture(scope="session")
+def lstm_model_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("models") / "lstm.keras"
+    build_lstm_model().save(path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def loaded_model(lstm_model_path):
+    """Основная модель viral_predictor: маленькая LSTM со словарем из tokenizers/vocab.npz"""
+    from predictor import viral_predictor
+
+    viral_predictor.configure_buckets(viral_predictor.PADDING_BUCKETS)
+    return viral_predictor.load_model_and_tokenizer(lstm_model_path, TOKENIZER_PATH)
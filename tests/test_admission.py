@@ -0,0 +1,133 @@
+# tests/test_admission.py
+import asyncio
+import time
+
+import pytest
+
+from bot.services.admission import AdmissionController, Overloaded, RequestExpired
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def hold(admission, release, weight=1, deadline=None):
+    async with admission.slot(deadline, weight=weight):
+        await release.wait()
+
+
+def test_admits_up_to_max_concurrent_then_queues():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2, max_queue=4)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, release)) for _ in range(3)]
+        await asyncio.sleep(0)
+        busy = (admission.active, admission.waiting)
+        release.set()
+        await asyncio.gather(*tasks)
+        return busy, admission.stats()
+
+    busy, stats = run(scenario())
+    assert busy == (2, 1)
+    assert (stats["active"], stats["waiting"], stats["admitted"]) == (0, 0, 3)
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            async with admission.slot():
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return error.value.retry_after, admission.rejected
+
+    retry_after, rejected = run(scenario())
+    assert retry_after >= 1
+    assert rejected == 1
+
+
+def test_expired_deadline_is_refused_before_queueing():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1)
+        with pytest.raises(RequestExpired):
+            async with admission.slot(time.time() - 1):
+                pass
+        return admission.stats()
+
+    stats = run(scenario())
+    assert (stats["expired"], stats["admitted"], stats["active"]) == (1, 0, 0)
+
+
+def test_waiting_past_deadline_expires():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1)
+        release = asyncio.Event()
+        task = asyncio.create_task(hold(admission, release))
+        await asyncio.sleep(0)
+        with pytest.raises(RequestExpired):
+            async with admission.slot(time.time() + 0.05):
+                pass
+        waiting = admission.waiting
+        release.set()
+        await task
+        return waiting, admission.expired
+
+    assert run(scenario()) == (0, 1)
+
+
+def test_weighted_slot_waits_for_enough_free_slots():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=3, max_queue=10)
+        first = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, first, weight=2))
+        await asyncio.sleep(0)
+
+        second = asyncio.Event()
+        batch = asyncio.create_task(hold(admission, second, weight=2))
+        await asyncio.sleep(0.01)
+        queued = (admission.active, admission.waiting)
+
+        first.set()
+        await holder
+        await asyncio.sleep(0.01)
+        running = (admission.active, admission.waiting)
+        second.set()
+        await batch
+        return queued, running, admission.active
+
+    queued, running, active = run(scenario())
+    assert queued == (2, 2)
+    assert running == (2, 0)
+    assert active == 0
+
+
+def test_weight_is_capped_by_max_concurrent():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2)
+        async with admission.slot(weight=100):
+            inside = admission.active
+        return inside, admission.active
+
+    assert run(scenario()) == (2, 0)
+
+
+def test_expired_weighted_slot_returns_partial_slots():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, release))
+        await asyncio.sleep(0)
+        with pytest.raises(RequestExpired):
+            async with admission.slot(time.time() + 0.05, weight=2):
+                pass
+        release.set()
+        await holder
+        # Оба слота снова свободны
+        async with admission.slot(weight=2):
+            return admission.active
+
+    assert run(scenario()) == 2
@@ -0,0 +1,43 @@
+# tests/test_buckets.py
+import numpy as np
+import pytest
+
+from predictor import viral_predictor
+from predictor.viral_predictor import MAX_SEQUENCE_LENGTH, PADDING_BUCKETS
+
+# Длины на границах корзин и по обе стороны от них; 250 - длиннее входа модели
+LENGTHS = [1, 2, 31, 32, 33, 63, 64, 65, 127, 128, 129, 199, 200, 250]
+
+
+@pytest.fixture(scope="module")
+def padded(loaded_model):
+    words = [word for word, index in sorted(loaded_model.tokenizer.word_index.items(), key=lambda item: item[1])
+             if index > 1 and word.isalpha()]
+    rng = np.random.default_rng(0)
+    texts = [" ".join(rng.choice(words, size=length)) for length in LENGTHS]
+    return viral_predictor.encode_texts(loaded_model.tokenizer, texts)
+
+
+def test_lengths_sit_on_bucket_boundaries(padded):
+    lengths = (padded != 0).sum(axis=1)
+    assert list(lengths) == [min(length, MAX_SEQUENCE_LENGTH) for length in LENGTHS]
+    assert set(PADDING_BUCKETS) <= set(lengths)
+
+
+def test_model_accepts_buckets(loaded_model):
+    assert loaded_model.buckets == PADDING_BUCKETS
+
+
+@pytest.mark.parametrize("use_costs", [False, True], ids=["per-bucket", "merged"])
+def test_bucketed_scores_match_full_padding(loaded_model, padded, use_costs):
+    expected = loaded_model.model(padded)[:, 0]
+    costs = loaded_model.bucket_costs if use_costs else None
+    actual = viral_predictor._run_bucketed(loaded_model.model, padded, PADDING_BUCKETS, costs)[:, 0]
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_single_row_matches_full_padding(loaded_model, padded, length):
+    row = padded[LENGTHS.index(length):LENGTHS.index(length) + 1]
+    expected = loaded_model.model(row)[:, 0]
+    np.testing.assert_allclose(loaded_model(row), expected, rtol=0, atol=1e-6)
@@ -0,0 +1,89 @@
+# tests/test_explain.py
+import numpy as np
+import pytest
+
+from predictor import viral_predictor
+
+SHORT_TEXT = "Как мы запустили бота за неделю и что из этого вышло"
+
+
+def long_text(loaded_model, count=150):
+    """Текст из count известных словарю слов"""
+    words = [word for word, _ in sorted(loaded_model.tokenizer.word_index.items(), key=lambda item: item[1])]
+    return " ".join(words[1:count + 1])
+
+
+@pytest.fixture
+def fixed_cost(monkeypatch):
+    """Оценка времени вызова: 1 мс на пакет и 0.1 мс на каждую следующую строку"""
+    monkeypatch.setattr(viral_predictor, "call_cost", lambda: (0.001, 0.0001))
+
+
+@pytest.fixture
+def scored_rows(monkeypatch):
+    """Размеры пакетов возмущенных входов, ушедших в модель"""
+    sizes = []
+    score_rows = viral_predictor.score_rows
+
+    def recording(rows):
+        sizes.append(len(rows))
+        return score_rows(rows)
+
+    monkeypatch.setattr(viral_predictor, "score_rows", recording)
+    return sizes
+
+
+@pytest.mark.parametrize("budget_ms", [1.5, 3, 5, 10])
+def test_window_widens_to_fit_budget(loaded_model, fixed_cost, scored_rows, budget_ms):
+    text = long_text(loaded_model)
+    result = viral_predictor.explain_viral(text, budget_ms=budget_ms)
+
+    limit = viral_predictor.rows_within(budget_ms / 1000)
+    assert limit < 150
+    assert scored_rows == [len(result["attributions"])]
+    assert scored_rows[0] <= limit
+    assert result["window"] == -(-150 // limit)
+
+
+def test_max_perturbations_limits_rows(loaded_model, scored_rows):
+    result = viral_predictor.explain_viral(long_text(loaded_model), max_perturbations=16)
+    assert scored_rows[0] <= 16
+    assert result["window"] == 10
+
+
+@pytest.mark.parametrize("window", [1, 3])
+def test_attributions_follow_tokens(loaded_model, window):
+    text = long_text(loaded_model, 10) + " " + SHORT_TEXT
+    ids, words, truncated = viral_predictor._tokens(" ".join(text.lower().split()))
+    result = viral_predictor.explain_viral(text, max_perturbations=-(-len(ids) // window))
+
+    assert result["window"] == window
+    assert not truncated and not result["truncated"]
+    fragments = [fragment for fragment, _ in result["attributions"]]
+    assert fragments == [" ".join(words[i:i + window]) for i in range(0, len(words), window)]
+
+
+def test_attribution_is_drop_without_word(loaded_model):
+    result = viral_predictor.explain_viral(SHORT_TEXT)
+    ids, words, _ = viral_predictor._tokens(" ".join(SHORT_TEXT.lower().split()))
+
+    assert result["probability"] == pytest.approx(viral_predictor.predict_viral(SHORT_TEXT)["probability"])
+    for i, (fragment, delta) in enumerate(result["attributions"]):
+        row = np.zeros((1, viral_predictor.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+        kept = np.delete(ids, i)
+        row[0, :len(kept)] = kept
+        assert fragment == words[i]
+        assert delta == pytest.approx(result["probability"] - float(loaded_model(row)[0]), abs=1e-6)
+
+
+def test_long_text_is_truncated_to_model_input(loaded_model):
+    result = viral_predictor.explain_viral(long_text(loaded_model, 250))
+    assert result["truncated"]
+    assert sum(len(fragment.split()) for fragment, _ in result["attributions"]) == viral_predictor.MAX_SEQUENCE_LENGTH
+
+
+def test_punctuation_only_text_has_no_attributions(loaded_model, scored_rows):
+    result = viral_predictor.explain_viral("!!! ??? ... --- ,,, ;;;")
+    assert result["attributions"] == []
+    assert result["window"] == 1
+    assert 0.0 <= result["probability"] <= 1.0
@@ -0,0 +1,45 @@
+# tests/test_fast_tokenizer.py
+import pickle
+
+import pytest
+
+from conftest import KERAS_TOKENIZER_PATH, TOKENIZER_PATH
+from predictor.fast_tokenizer import FastTokenizer, check_parity, sample_corpus
+
+EDGE_CASES = [
+    "Hello, World! How ARE you?!",
+    "MiXeD CaSe and punctuation: commas, dots... (brackets) [more] {braces} #tags @users",
+    "non\u00a0breaking\u00a0spaces and thin\u2009spaces",
+    "emoji 🚀🔥 inside😂words and 👍",
+    "tabs\tand\nnew lines\r\nand  double  spaces",
+    "qwertyuiopasdf zxcvbnmlkj oov123 слова не из словаря",
+    "I'm sure it's the dog's toy — isn't it?",
+    "",
+    " ",
+]
+
+
+@pytest.fixture(scope="module")
+def tokenizers():
+    with open(KERAS_TOKENIZER_PATH, "rb") as f:
+        keras_tokenizer = pickle.load(f)
+    return keras_tokenizer, FastTokenizer.load(TOKENIZER_PATH)
+
+
+def test_parity_on_edge_cases(tokenizers):
+    keras_tokenizer, fast = tokenizers
+    for text in EDGE_CASES:
+        assert fast.texts_to_sequences([text]) == keras_tokenizer.texts_to_sequences([text]), text
+    assert check_parity(keras_tokenizer, fast, EDGE_CASES) == 0
+
+
+def test_parity_on_sample_corpus(tokenizers):
+    keras_tokenizer, fast = tokenizers
+    assert check_parity(keras_tokenizer, fast, sample_corpus(keras_tokenizer, size=500)) == 0
+
+
+def test_truncation_matches_full_sequences(tokenizers):
+    _, fast = tokenizers
+    texts = sample_corpus(fast, size=200)
+    full = fast.texts_to_sequences(texts)
+    assert fast.texts_to_sequences(texts, maxlen=200) == [sequence[:200] for sequence in full]
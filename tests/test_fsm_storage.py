@@ -0,0 +1,178 @@
+# tests/test_fsm_storage.py
+import asyncio
+import sqlite3
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.services import fsm_storage
+from bot.services.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_state_and_data_round_trip(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+        await storage.open()
+        await storage.set_state(KEY, "PredictStates:waiting_for_text")
+        await storage.set_data(KEY, {"text": "привет"})
+        result = (await storage.get_state(KEY), await storage.get_data(KEY), await storage.get_state(OTHER))
+        await storage.close()
+        return result
+
+    assert run(scenario()) == ("PredictStates:waiting_for_text", {"text": "привет"}, None)
+
+
+def test_empty_records_are_dropped(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+        await storage.open()
+        await storage.set_state(KEY, "PredictStates:waiting_for_text")
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        size = len(storage)
+        await storage.close()
+        return size
+
+    assert run(scenario()) == 0
+
+
+def test_states_expire_after_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fsm_storage.time, "time", clock.time)
+
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"), ttl=60)
+        await storage.open()
+        await storage.set_state(KEY, "a")
+        clock.now += 30
+        await storage.set_state(OTHER, "b")
+        fresh = await storage.get_state(KEY)
+
+        clock.now += 31
+        expired = await storage.get_state(KEY)
+        survivor = await storage.get_state(OTHER)
+        stats = storage.stats()
+        await storage.close()
+        return fresh, expired, survivor, stats["expired"]
+
+    assert run(scenario()) == ("a", None, "b", 1)
+
+
+def test_states_survive_reopen_unless_expired(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fsm_storage.time, "time", clock.time)
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path, ttl=60)
+        await storage.open()
+        await storage.set_state(KEY, "a")
+        await storage.set_data(KEY, {"n": 1})
+        clock.now += 45
+        await storage.set_state(OTHER, "b")
+        await storage.close()
+
+        clock.now += 20
+        storage = SQLiteStorage(path, ttl=60)
+        await storage.open()
+        result = (
+            await storage.get_state(KEY), await storage.get_data(KEY),
+            await storage.get_state(OTHER), len(storage)
+        )
+        await storage.close()
+        return result
+
+    assert run(scenario()) == (None, {}, "b", 1)
+
+
+def reopened_states(path, *keys):
+    async def scenario():
+        storage = SQLiteStorage(path)
+        await storage.open()
+        states = [await storage.get_state(key) for key in keys]
+        await storage.close()
+        return states
+
+    return run(scenario())
+
+
+def test_unserializable_data_is_rejected_at_set_data(tmp_path):
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / "fsm.sqlite3"))
+        await storage.open()
+        await storage.set_data(KEY, {"n": 1})
+        with pytest.raises(TypeError):
+            await storage.set_data(KEY, {"n": object()})
+        data = await storage.get_data(KEY)
+        await storage.close()
+        return data
+
+    assert run(scenario()) == {"n": 1}
+
+
+def test_bad_record_does_not_drop_other_users(tmp_path):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path)
+        await storage.open()
+        await storage.set_state(KEY, "a")
+        await storage.set_state(OTHER, "b")
+        data = {"items": []}
+        await storage.set_data(OTHER, data)
+        # Вложенный объект изменен после set_data
+        storage._records[OTHER].data["items"].append(object())
+        await storage.flush()
+        errors = storage.write_errors
+        await storage.close()
+        return errors
+
+    assert run(scenario()) == 1
+    assert reopened_states(path, KEY, OTHER) == ["a", None]
+
+
+def test_failed_write_is_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / "fsm.sqlite3")
+
+    async def scenario():
+        storage = SQLiteStorage(path)
+        await storage.open()
+        apply = storage._apply
+        failures = [sqlite3.OperationalError("database is locked")]
+
+        def flaky(upserts, deletes):
+            if failures:
+                raise failures.pop()
+            apply(upserts, deletes)
+
+        monkeypatch.setattr(storage, "_apply", flaky)
+        await storage.set_state(KEY, "a")
+        await storage.set_state(OTHER, "b")
+        await storage.flush()
+        pending = storage.stats()["pending"]
+        # Новое значение, пришедшее до повтора, не перезаписывается старым
+        await storage.set_state(OTHER, "c")
+        await storage.flush()
+        stats = storage.stats()
+        await storage.close()
+        return pending, stats
+
+    pending, stats = run(scenario())
+    assert pending == 2
+    assert (stats["pending"], stats["write_errors"]) == (0, 1)
+    assert reopened_states(path, KEY, OTHER) == ["a", "c"]
@@ -0,0 +1,34 @@
+# tests/test_loading.py
+import asyncio
+import time
+
+from bot.services.predictor import LOAD_PHASES, PredictorService
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_hashing_is_a_load_stage(tmp_path):
+    model_path, tokenizer_path = tmp_path / "model.keras", tmp_path / "vocab.npz"
+    model_path.write_bytes(b"model")
+    tokenizer_path.write_bytes(b"vocab")
+    service = PredictorService(str(model_path), str(tokenizer_path), batching=False)
+    phases = []
+
+    def slow_digest(*paths):
+        phases.append(service.phase)
+        time.sleep(0.05)
+        raise OSError("диск недоступен")
+
+    service._files_digest = slow_digest
+
+    async def scenario():
+        await service.start()
+        return await service.wait_ready(5)
+
+    assert run(scenario()) is False
+    assert phases == ["hashing"]
+    assert "hashing" in LOAD_PHASES
+    assert service.phase == "failed"
+    assert service.stage_timings["hashing"] >= 0.05
@@ -0,0 +1,55 @@
+# tests/test_metrics.py
+import sys
+import threading
+
+import pytest
+
+from predictor.metrics import Registry
+
+
+def test_histogram_render_and_quantile():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Задержка", labelnames=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value, stage="predict")
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="predict",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="predict",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{stage="predict"} 4' in lines
+    assert histogram.quantile(0.5, stage="predict") == pytest.approx(0.55)
+    assert histogram.quantile(0.5, stage="missing") is None
+
+
+@pytest.fixture
+def frequent_switches():
+    """Частое переключение потоков, чтобы observe попадал внутрь экспорта"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_scrape_while_observing_new_series(frequent_switches):
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Задержка", labelnames=("user",))
+    counter = registry.counter("requests_total", "Запросы", labelnames=("user",))
+
+    def observe(offset):
+        # Каждое наблюдение добавляет новую серию: словари растут во время экспорта
+        for user in range(offset, 8000, 4):
+            histogram.observe(0.01, user=str(user))
+            counter.inc(user=str(user))
+
+    writers = [threading.Thread(target=observe, args=(offset,)) for offset in range(4)]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers):
+        registry.render()
+        histogram.series()
+        histogram.quantile(0.9, user="0")
+    for writer in writers:
+        writer.join()
+
+    observed = sum(sum(counts) for counts, _ in histogram.series().values())
+    assert observed == sum(counter.values().values()) == 8000
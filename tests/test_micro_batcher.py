@@ -0,0 +1,153 @@
+# tests/test_micro_batcher.py
+import asyncio
+
+from bot.services.predictor import BatcherClosed, MicroBatcher
+
+
+class FakeModel:
+    """predict_batch, который запоминает пакеты и отвечает после паузы"""
+
+    def __init__(self, delay=0.0, fail=None):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, texts, threshold, models):
+        self.batches.append((list(texts), threshold))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail is not None:
+                raise self.fail
+            return [{"text": text, "threshold": threshold, "model": model} for text, model in zip(texts, models)]
+        finally:
+            self.running -= 1
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_requests_are_grouped_into_one_batch():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(f"text {i}", 0.5) for i in range(10)))
+        await batcher.close()
+        return model, results
+
+    model, results = run(scenario())
+    assert len(model.batches) == 1
+    assert [result["text"] for result in results] == [f"text {i}" for i in range(10)]
+
+
+def test_batch_is_limited_by_max_batch_size():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+        await asyncio.gather(*(batcher.submit(f"text {i}", 0.5) for i in range(10)))
+        await batcher.close()
+        return model
+
+    model = run(scenario())
+    assert [len(texts) for texts, _ in model.batches] == [4, 4, 2]
+
+
+def test_lone_request_waits_at_most_max_wait():
+    async def scenario():
+        batcher = MicroBatcher(FakeModel(), max_batch_size=32, max_wait_ms=20)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await batcher.submit("alone", 0.5)
+        elapsed = loop.time() - started
+        await batcher.close()
+        return elapsed
+
+    assert run(scenario()) < 0.5
+
+
+def test_thresholds_are_scored_separately():
+    async def scenario():
+        model = FakeModel()
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        results = await asyncio.gather(
+            batcher.submit("a", 0.5), batcher.submit("b", 0.7), batcher.submit("c", 0.5)
+        )
+        await batcher.close()
+        return model, results
+
+    model, results = run(scenario())
+    assert sorted((sorted(texts), threshold) for texts, threshold in model.batches) == [
+        (["a", "c"], 0.5), (["b"], 0.7)
+    ]
+    assert [result["threshold"] for result in results] == [0.5, 0.7, 0.5]
+
+
+def test_concurrent_batches_are_bounded():
+    async def scenario():
+        model = FakeModel(delay=0.05)
+        batcher = MicroBatcher(model, max_batch_size=2, max_wait_ms=1, max_concurrent_batches=2)
+        await asyncio.gather(*(batcher.submit(f"text {i}", 0.5) for i in range(12)))
+        await batcher.close()
+        return model
+
+    model = run(scenario())
+    assert model.max_running == 2
+
+
+def test_batch_error_reaches_every_request():
+    async def scenario():
+        batcher = MicroBatcher(FakeModel(fail=ValueError("boom")), max_batch_size=32, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(f"text {i}", 0.5) for i in range(3)), return_exceptions=True)
+        await batcher.close()
+        return results
+
+    results = run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_request_does_not_block_others():
+    async def scenario():
+        model = FakeModel(delay=0.01)
+        batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=30)
+        cancelled = asyncio.create_task(batcher.submit("gone", 0.5))
+        kept = asyncio.create_task(batcher.submit("kept", 0.5))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        result = await kept
+        await batcher.close()
+        return model, result
+
+    model, result = run(scenario())
+    assert result["text"] == "kept"
+    assert all("gone" not in texts for texts, _ in model.batches)
+
+
+def test_close_fails_running_queued_and_blocked_requests():
+    async def scenario():
+        model = FakeModel(delay=10)
+        batcher = MicroBatcher(
+            model, max_batch_size=2, max_wait_ms=1, max_queue_size=2, max_concurrent_batches=1
+        )
+        # 2 в идущем пакете, 2 в очереди, 3 ждут места в очереди
+        tasks = [asyncio.create_task(batcher.submit(f"text {i}", 0.5)) for i in range(7)]
+        await asyncio.sleep(0.05)
+        await batcher.close()
+        return await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+
+    results = run(scenario())
+    assert all(isinstance(result, BatcherClosed) for result in results)
+
+
+def test_close_fails_batch_being_collected():
+    async def scenario():
+        batcher = MicroBatcher(FakeModel(), max_batch_size=32, max_wait_ms=10000)
+        task = asyncio.create_task(batcher.submit("text", 0.5))
+        await asyncio.sleep(0.05)
+        await batcher.close()
+        return await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), 1)
+
+    assert isinstance(run(scenario())[0], BatcherClosed)
@@ -0,0 +1,151 @@
+# tests/test_models.py
+import collections
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from bot.services.predictor import PRIMARY_MODEL, PredictorService
+from predictor import viral_predictor
+from predictor.viral_predictor import LoadedModel
+
+TEXTS = [
+    "первый пост о запуске нашего бота",
+    "второй пост про выход новой версии",
+    "третий пост с итогами недели и планами",
+    "четвертый пост о том что пошло не так",
+    "пятый пост с благодарностью подписчикам",
+]
+
+
+class FakeBackend:
+    """Бэкенд, который запоминает входы и отвечает постоянной вероятностью"""
+
+    def __init__(self, probability, delay=0.0, fail=None):
+        self.probability = probability
+        self.delay = delay
+        self.fail = fail
+        self.inputs = []
+        self.done = threading.Event()
+
+    def __call__(self, padded):
+        self.inputs.append(np.array(padded))
+        try:
+            time.sleep(self.delay)
+            if self.fail is not None:
+                raise self.fail
+            return np.full((len(padded), 1), self.probability, dtype=np.float32)
+        finally:
+            self.done.set()
+
+
+def variant(name, backend, vocabulary, tokenizer):
+    return LoadedModel(name, backend, tokenizer, vocabulary)
+
+
+@pytest.fixture
+def registry(loaded_model, monkeypatch):
+    """Две модели со словарем основной (same_a, same_b) и одна с другим (other)"""
+    backends = {"same_a": FakeBackend(0.1), "same_b": FakeBackend(0.2), "other": FakeBackend(0.3)}
+    vocabularies = {"same_a": loaded_model.vocabulary, "same_b": loaded_model.vocabulary, "other": "other"}
+    for name, backend in backends.items():
+        monkeypatch.setitem(
+            viral_predictor._variants, name, variant(name, backend, vocabularies[name], loaded_model.tokenizer)
+        )
+    return backends
+
+
+def ab_service(**traffic):
+    variants = {name: ("model.keras", "vocab.npz") for name in traffic}
+    return PredictorService(batching=False, model_variants=variants, model_traffic=traffic)
+
+
+def test_route_is_deterministic_and_follows_traffic_shares():
+    first, second = ab_service(a=0.3, b=0.2), ab_service(a=0.3, b=0.2)
+    routes = [first.route(user_id) for user_id in range(20000)]
+
+    assert routes == [second.route(user_id) for user_id in range(20000)]
+    assert routes == [first.route(user_id) for user_id in range(20000)]
+    counts = collections.Counter(routes)
+    assert counts["a"] / len(routes) == pytest.approx(0.3, abs=0.02)
+    assert counts["b"] / len(routes) == pytest.approx(0.2, abs=0.02)
+    assert counts[PRIMARY_MODEL] / len(routes) == pytest.approx(0.5, abs=0.02)
+
+
+def test_route_without_user_or_traffic_is_primary():
+    assert ab_service(a=1.0).route(None) == PRIMARY_MODEL
+    assert ab_service().route(42) == PRIMARY_MODEL
+    assert ab_service(a=1.0).route(42) == "a"
+
+
+def test_mixed_batch_tokenizes_once_and_scores_rows_on_their_models(registry, loaded_model, monkeypatch):
+    encoded = []
+    encode_texts = viral_predictor.encode_texts
+
+    def counting_encode(tokenizer, texts, out=None):
+        encoded.append(list(texts))
+        return encode_texts(tokenizer, texts, out)
+
+    monkeypatch.setattr(viral_predictor, "encode_texts", counting_encode)
+    models = [PRIMARY_MODEL, "same_a", "other", "same_b", "other"]
+    results = viral_predictor.predict_viral_batch(TEXTS, models=models)
+
+    assert [result["model"] for result in results] == models
+    assert [result["probability"] for result in results[1:]] == pytest.approx([0.1, 0.3, 0.2, 0.3])
+    assert results[0]["probability"] == pytest.approx(viral_predictor.predict_viral(TEXTS[0])["probability"])
+
+    # Для словаря основной модели вход уже готов, для другого - один проход на блок
+    assert encoded == [[" ".join(text.lower().split()) for text in TEXTS]]
+    primary_input = viral_predictor.encode_texts(loaded_model.tokenizer, TEXTS)
+    assert [len(rows) for rows in registry["same_a"].inputs] == [1]
+    np.testing.assert_array_equal(registry["same_a"].inputs[0], primary_input[[1]])
+    np.testing.assert_array_equal(registry["same_b"].inputs[0], primary_input[[3]])
+    assert [len(rows) for rows in registry["other"].inputs] == [2]
+
+
+def test_unknown_model_is_an_error(loaded_model):
+    with pytest.raises(ValueError, match="не загружена"):
+        viral_predictor.predict_viral_batch(TEXTS[:1], models=["missing"])
+
+
+def wait_for_shadows(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while viral_predictor._shadow_pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not viral_predictor._shadow_pending
+
+
+def test_shadow_scoring_does_not_change_or_delay_result(loaded_model, monkeypatch):
+    expected = viral_predictor.predict_viral_batch(TEXTS)
+
+    slow, broken = FakeBackend(0.9, delay=0.5), FakeBackend(0.9, fail=RuntimeError("boom"))
+    monkeypatch.setitem(viral_predictor._variants, "slow", variant("slow", slow, "slow", loaded_model.tokenizer))
+    monkeypatch.setitem(viral_predictor._variants, "broken", variant("broken", broken, "broken", loaded_model.tokenizer))
+    monkeypatch.setattr(viral_predictor, "_shadows", ("broken", "slow"))
+    scored = viral_predictor.SHADOW_ROWS.value(model="slow", outcome="scored")
+    errors = viral_predictor.SHADOW_ERRORS.value(model="broken")
+
+    started = time.perf_counter()
+    results = viral_predictor.predict_viral_batch(TEXTS)
+    elapsed = time.perf_counter() - started
+    wait_for_shadows()
+
+    assert elapsed < slow.delay
+    assert results == expected
+    # Ошибка одной теневой модели учтена и не помешала другой
+    assert viral_predictor.SHADOW_ERRORS.value(model="broken") == errors + 1
+    assert viral_predictor.SHADOW_ROWS.value(model="slow", outcome="scored") == scored + len(TEXTS)
+
+
+def test_shadow_queue_overflow_drops_blocks(loaded_model, monkeypatch):
+    slow = FakeBackend(0.9, delay=0.2)
+    monkeypatch.setitem(viral_predictor._variants, "slow", variant("slow", slow, "slow", loaded_model.tokenizer))
+    monkeypatch.setattr(viral_predictor, "_shadows", ("slow",))
+    dropped = viral_predictor.SHADOW_ROWS.value(model="slow", outcome="dropped")
+
+    for _ in range(viral_predictor.SHADOW_MAX_PENDING + 2):
+        viral_predictor.predict_viral_batch(TEXTS[:1])
+    wait_for_shadows()
+
+    assert viral_predictor.SHADOW_ROWS.value(model="slow", outcome="dropped") >= dropped + 1
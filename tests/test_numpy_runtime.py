@@ -0,0 +1,59 @@
+# tests/test_numpy_runtime.py
+import numpy as np
+import pytest
+
+from predictor.numpy_runtime import NumpyModel, check_parity, export_model
+
+from conftest import build_lstm_model
+
+TOLERANCE = 1e-4
+
+
+def build_model(body, vocabulary_size=10000, mask_zero=False, seed=0):
+    import keras
+
+    keras.utils.set_random_seed(seed)
+    inputs = keras.Input(shape=(200,), dtype="int32")
+    x = keras.layers.Embedding(vocabulary_size, 16, mask_zero=mask_zero)(inputs)
+    for layer in body(keras.layers):
+        x = layer(x)
+    outputs = keras.layers.Dense(1, activation="sigmoid")(x)
+    return keras.Model(inputs, outputs)
+
+
+MODELS = {
+    "gap": lambda layers: [layers.Dropout(0.2), layers.GlobalAveragePooling1D(), layers.Dense(8, activation="relu")],
+    "conv": lambda layers: [layers.Conv1D(8, 5, padding="same", activation="relu"), layers.GlobalMaxPooling1D()],
+    "bilstm": lambda layers: [layers.Bidirectional(layers.LSTM(4))],
+}
+
+
+def exported(model, tmp_path):
+    path = tmp_path / "model.npz"
+    export_model(model, str(path))
+    return NumpyModel.load(str(path))
+
+
+def test_lstm_with_mask_matches_keras(tmp_path):
+    model = build_lstm_model()
+    assert check_parity(model, exported(model, tmp_path), samples=128) < TOLERANCE
+
+
+@pytest.mark.parametrize("name", sorted(MODELS))
+def test_layers_match_keras(name, tmp_path):
+    model = build_model(MODELS[name], mask_zero=name == "bilstm")
+    assert check_parity(model, exported(model, tmp_path), samples=128) < TOLERANCE
+
+
+def test_parity_inputs_stay_within_embedding_vocabulary(tmp_path):
+    # Словарь меньше 10000: id вне Embedding сломали бы сверку
+    model = build_model(MODELS["gap"], vocabulary_size=50)
+    assert check_parity(model, exported(model, tmp_path), samples=128) < TOLERANCE
+
+
+def test_numpy_model_handles_empty_rows(tmp_path):
+    model = build_lstm_model()
+    padded = np.zeros((2, 200), dtype=np.int32)
+    padded[1, :3] = [5, 6, 7]
+    expected = np.asarray(model(padded, training=False))
+    np.testing.assert_allclose(exported(model, tmp_path)(padded), expected, atol=TOLERANCE)
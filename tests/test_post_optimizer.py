@@ -0,0 +1,29 @@
+# tests/test_post_optimizer.py
+import pytest
+
+from predictor import viral_predictor
+from predictor.post_optimizer import _prepare, _tokenize, optimize_post
+
+TEXTS = [
+    "What do you think about my new puppy? He is the cutest thing ever. Honestly I am bored.",
+    # Неразрывный и узкий пробелы: при предсказании они разделяют слова
+    "What do you think about my new\u00a0puppy?\u00a0He is the cutest\u2009thing ever.",
+    "Best\tfood   ever!\n\nWould go again, 10/10 🚀",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_base_probability_matches_predict(loaded_model, text):
+    expected = viral_predictor.predict_viral(text)["probability"]
+    with viral_predictor.pinned():
+        _, result = _prepare(text, 0.5, 0.1)
+    assert result["probability"] == expected
+    assert optimize_post(text, budget_ms=200)["probability"] == expected
+
+
+def test_spans_point_to_words_in_original_text(loaded_model):
+    text = "Hello World, how are you?"
+    with viral_predictor.pinned():
+        ids, spans = _tokenize(text)
+    assert [text[start:end].lower() for start, end in spans] == ["hello", "world", "how", "are", "you"]
+    assert len(ids) == len(spans)
@@ -0,0 +1,33 @@
+# tests/test_predict_batch.py
+import pytest
+
+from predictor import viral_predictor
+
+TEXTS = [
+    "What do you think about my new puppy?",
+    "TIL that bees can recognize human faces!!! #science",
+    "My cat knocked over the Christmas tree... again",
+    "What do you think about my new puppy?",
+    " ".join(["word"] * 300),
+]
+
+
+def test_batch_matches_single_predictions(loaded_model):
+    expected = [viral_predictor.predict_viral(text) for text in TEXTS]
+    assert viral_predictor.predict_viral_batch(TEXTS) == expected
+
+
+def test_chunks_keep_order_and_scores(loaded_model):
+    whole = viral_predictor.predict_viral_batch(TEXTS)
+    assert viral_predictor.predict_viral_batch(TEXTS, chunk_size=2) == whole
+
+
+def test_threshold_is_applied_per_batch(loaded_model):
+    results = viral_predictor.predict_viral_batch(TEXTS, threshold=0.0)
+    assert all(result["viral"] and result["threshold"] == 0.0 for result in results)
+
+
+def test_empty_text_is_rejected(loaded_model):
+    assert viral_predictor.predict_viral_batch([]) == []
+    with pytest.raises(ValueError):
+        viral_predictor.predict_viral_batch(["text", "   "])
@@ -0,0 +1,139 @@
+# tests/test_prediction_cache.py
+import asyncio
+
+import pytest
+
+from bot.services.cache import PredictionCache, text_hash, text_key
+
+
+class LeaderError(Exception):
+    """Ошибка, относящаяся к запросу, а не к ключу (как RequestExpired)"""
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = PredictionCache(max_entries=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+    now = [1000.0]
+    monkeypatch.setattr("bot.services.cache.time.monotonic", lambda: now[0])
+    cache.set("d", 4)
+    now[0] += 11
+    assert cache.get("d") is None
+
+
+def test_keys_normalize_text_and_include_version():
+    assert text_hash("Hello  World") == text_hash("hello world ")
+    assert text_key("hello", "v1") != text_key("hello", "v2")
+
+
+def test_concurrent_requests_share_one_computation():
+    async def scenario():
+        cache = PredictionCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"p": 0.7}
+
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        return cache, calls, results
+
+    cache, calls, results = run(scenario())
+    assert len(calls) == 1
+    assert results == [{"p": 0.7}] * 5
+    assert cache.coalesced == 4
+    assert cache.get("k") == {"p": 0.7}
+
+
+def test_model_error_is_shared_and_not_cached():
+    async def scenario():
+        cache = PredictionCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("model failed")
+
+        results = await asyncio.gather(
+            *(cache.get_or_compute("k", compute) for _ in range(3)), return_exceptions=True
+        )
+        return cache, calls, results
+
+    cache, calls, results = run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache.get("k") is None
+
+
+def test_leader_request_error_is_not_passed_to_followers():
+    async def scenario():
+        cache = PredictionCache()
+        calls = []
+
+        async def compute(fail):
+            calls.append(fail)
+            await asyncio.sleep(0.01)
+            if fail:
+                raise LeaderError()
+            return "fresh"
+
+        leader = asyncio.create_task(cache.get_or_compute("k", lambda: compute(True), retry_on=(LeaderError,)))
+        await asyncio.sleep(0)
+        followers = [
+            asyncio.create_task(cache.get_or_compute("k", lambda: compute(False), retry_on=(LeaderError,)))
+            for _ in range(3)
+        ]
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+        return calls, results
+
+    calls, results = run(scenario())
+    assert isinstance(results[0], LeaderError)
+    assert results[1:] == ["fresh"] * 3
+    # Повторно вычисляет только один из ожидавших, остальные ждут уже его
+    assert calls == [True, False]
+
+
+def test_leader_cancellation_is_not_passed_to_followers():
+    async def scenario():
+        cache = PredictionCache()
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "value"
+
+        leader = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert run(scenario()) == "value"
+
+
+def test_uncacheable_value_is_returned_but_not_stored():
+    async def scenario():
+        cache = PredictionCache()
+
+        async def compute():
+            return {"error": True}
+
+        value = await cache.get_or_compute("k", compute, cacheable=lambda value: not value.get("error"))
+        return cache, value
+
+    cache, value = run(scenario())
+    assert value == {"error": True}
+    assert cache.get("k") is None
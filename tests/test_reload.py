@@ -0,0 +1,179 @@
+# tests/test_reload.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from bot.services.predictor import PredictorService
+from predictor import viral_predictor
+from predictor.viral_predictor import LoadedModel
+
+from conftest import TOKENIZER_PATH, build_lstm_model
+
+TEXT = "новый пост о том как мы запустили бота и что из этого вышло"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Holder:
+    """Вызов в отдельном потоке, закрепивший текущую основную модель (pinned)"""
+
+    def __init__(self):
+        self.pinned = threading.Event()
+        self.release = threading.Event()
+        self.model = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+        assert self.pinned.wait(5)
+
+    def _run(self):
+        with viral_predictor.pinned() as model:
+            self.model = model
+            self.pinned.set()
+            self.release.wait(5)
+            self.seen = viral_predictor.current_model()
+
+    def finish(self):
+        self.release.set()
+        self.thread.join(5)
+
+
+@pytest.fixture
+def old_model(loaded_model):
+    """Подставная основная модель на время теста; затем возвращается loaded_model"""
+    model = LoadedModel("primary", model=object(), tokenizer=None, vocabulary="old")
+    viral_predictor.activate_model(model)
+    yield model
+    viral_predictor.activate_model(loaded_model)
+
+
+def test_retire_times_out_while_model_is_pinned(old_model, loaded_model):
+    holder = Holder()
+    viral_predictor.activate_model(loaded_model)
+    try:
+        assert old_model.pins == 1
+        started = time.perf_counter()
+        assert viral_predictor.retire_model(old_model, timeout=0.1) is False
+        assert time.perf_counter() - started >= 0.1
+        # Модель осталась у закрепившего ее вызова
+        assert old_model.model is not None
+    finally:
+        holder.finish()
+    assert holder.seen is old_model
+    assert viral_predictor.retire_model(old_model, timeout=1) is True
+    assert old_model.pins == 0 and old_model.model is None
+
+
+def test_retire_waits_for_pinned_call(old_model, loaded_model):
+    holder = Holder()
+    viral_predictor.activate_model(loaded_model)
+    # Новые вызовы уже идут на новую модель
+    assert viral_predictor.current_model() is loaded_model
+
+    threading.Timer(0.1, holder.finish).start()
+    started = time.perf_counter()
+    assert viral_predictor.retire_model(old_model, timeout=5) is True
+    assert time.perf_counter() - started >= 0.1
+    assert old_model.model is None
+
+
+def test_hot_swap_keeps_pinned_calls_on_old_model(loaded_model, tmp_path):
+    path = tmp_path / "other.keras"
+    build_lstm_model(seed=1).save(path)
+    before = viral_predictor.predict_viral(TEXT)["probability"]
+
+    holder = Holder()
+    try:
+        swapped = viral_predictor.prepare_model(str(path), TOKENIZER_PATH)
+        previous = viral_predictor.activate_model(swapped)
+        assert previous is loaded_model
+        # Словарь тот же: токенизатор общий, а не загружен заново
+        assert swapped.tokenizer is loaded_model.tokenizer
+        assert viral_predictor.predict_viral(TEXT)["probability"] != before
+    finally:
+        holder.finish()
+        viral_predictor.activate_model(loaded_model)
+    assert holder.seen is loaded_model
+    assert viral_predictor.retire_model(swapped, timeout=1) is True
+    assert viral_predictor.predict_viral(TEXT)["probability"] == before
+
+
+def test_failed_prepare_keeps_current_model(loaded_model, tmp_path):
+    broken = tmp_path / "broken.keras"
+    broken.write_bytes(b"not a model")
+    before = viral_predictor.predict_viral(TEXT)["probability"]
+
+    with pytest.raises(Exception, match="Ошибка загрузки модели"):
+        viral_predictor.load_model_and_tokenizer(str(broken), TOKENIZER_PATH)
+
+    assert viral_predictor.current_model() is loaded_model
+    assert viral_predictor.predict_viral(TEXT)["probability"] == before
+
+
+def test_memory_cap_cancels_load(loaded_model, lstm_model_path):
+    with pytest.raises(MemoryError):
+        viral_predictor.load_model_and_tokenizer(lstm_model_path, TOKENIZER_PATH, max_rss_mb=1)
+    assert viral_predictor.current_model() is loaded_model
+
+
+def make_files(tmp_path, name):
+    model_path, tokenizer_path = tmp_path / f"{name}.keras", tmp_path / f"{name}.npz"
+    model_path.write_bytes(name.encode())
+    tokenizer_path.write_bytes(name.encode())
+    return str(model_path), str(tokenizer_path)
+
+
+class FakeReload:
+    """Замена PredictorService._reload: переключает пути и ждет сигнала"""
+
+    def __init__(self, service):
+        self.service = service
+        self.calls = 0
+        self.proceed = asyncio.Event()
+        self.proceed.set()
+
+    async def __call__(self, model_path, tokenizer_path):
+        self.calls += 1
+        await self.proceed.wait()
+        self.service.model_path, self.service.tokenizer_path = model_path, tokenizer_path
+        return {"outcome": "reloaded", "version": model_path, "model_path": model_path}
+
+
+def ready_service(tmp_path, **kwargs):
+    model_path, tokenizer_path = make_files(tmp_path, "old")
+    service = PredictorService(model_path, tokenizer_path, batching=False, **kwargs)
+    service.phase = "ready"
+    service._reload = FakeReload(service)
+    return service
+
+
+def test_second_reload_is_refused(tmp_path):
+    async def scenario():
+        service = ready_service(tmp_path)
+        service._reload.proceed.clear()
+        first = asyncio.create_task(service.reload())
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match="уже выполняется"):
+            await service.reload()
+        service._reload.proceed.set()
+        return await first, service._reload.calls
+
+    report, calls = run(scenario())
+    assert report["outcome"] == "reloaded"
+    assert calls == 1
+
+
+def test_watcher_ignores_files_replaced_by_reload(tmp_path):
+    async def scenario():
+        service = ready_service(tmp_path, watch_interval=0.01)
+        watcher = asyncio.create_task(service._watch_files())
+        await asyncio.sleep(0.03)
+        await service.reload(*make_files(tmp_path, "new"))
+        await asyncio.sleep(0.1)
+        watcher.cancel()
+        return service._reload.calls
+
+    assert run(scenario()) == 1
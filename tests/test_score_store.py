@@ -0,0 +1,126 @@
+# tests/test_score_store.py
+import asyncio
+import sqlite3
+import time
+
+from bot.services.score_store import ScoreStore
+
+
+def formatted(probability, model="primary"):
+    return {
+        "score": probability, "is_viral": probability > 0.5, "probability": probability,
+        "confidence": abs(probability - 0.5) * 2, "message": "", "threshold": 0.5, "model": model,
+        "original_result": {},
+    }
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_scores_survive_reopen(tmp_path):
+    path = str(tmp_path / "scores.sqlite3")
+
+    async def scenario():
+        store = ScoreStore(path)
+        await store.open()
+        store.put(("hash", "v1", 0.5), formatted(0.7))
+        await store.close()
+
+        store = ScoreStore(path)
+        await store.open()
+        found = await store.get(("hash", "v1", 0.5))
+        await store.close()
+        return found
+
+    stored = formatted(0.7)
+    del stored["original_result"]
+    assert run(scenario()) == stored
+
+
+def test_compaction_keeps_other_versions_and_drops_old_rows(tmp_path):
+    path = str(tmp_path / "scores.sqlite3")
+
+    async def scenario():
+        # Две реплики на разных версиях модели делят одну базу
+        first, second = ScoreStore(path, max_age=3600), ScoreStore(path, max_age=3600)
+        await first.open()
+        await second.open()
+        first.put(("hash", "v1", 0.5), formatted(0.1))
+        second.put(("hash", "v2", 0.5), formatted(0.2))
+        await first.flush()
+        await second.flush()
+        # Оценка v1 устарела: компактация удаляет ее по возрасту, а не по версии
+        await first._call(
+            first._conn.execute, "UPDATE scores SET created_at = ? WHERE model_version = 'v1'", (time.time() - 7200,)
+        )
+        first.put(("other", "v1", 0.5), formatted(0.3))
+        await first.flush()
+
+        await second.compact()
+        results = await second.get_many([("hash", "v1", 0.5), ("hash", "v2", 0.5), ("other", "v1", 0.5)])
+        await first.close()
+        await second.close()
+        return results
+
+    stored = [formatted(0.2), formatted(0.3)]
+    for item in stored:
+        del item["original_result"]
+    assert run(scenario()) == [None] + stored
+
+
+def failing_once(store):
+    insert = store._insert
+    failures = [sqlite3.OperationalError("disk I/O error")]
+
+    def flaky(rows):
+        if failures:
+            raise failures.pop()
+        insert(rows)
+
+    store._insert = flaky
+
+
+def test_failed_flush_is_retried(tmp_path):
+    path = str(tmp_path / "scores.sqlite3")
+
+    async def scenario():
+        store = ScoreStore(path)
+        await store.open()
+        failing_once(store)
+        store.put(("a", "v1", 0.5), formatted(0.1))
+        store.put(("b", "v1", 0.5), formatted(0.2))
+        await store.flush()
+        after_error = store.stats()
+        # Новая оценка того же ключа не заменяется старой из неудачного пакета
+        store.put(("b", "v1", 0.5), formatted(0.3))
+        await store.flush()
+        stats = store.stats()
+        await store.close()
+
+        store = ScoreStore(path)
+        await store.open()
+        found = await store.get_many([("a", "v1", 0.5), ("b", "v1", 0.5)])
+        await store.close()
+        return after_error, stats, [item["score"] for item in found]
+
+    after_error, stats, scores = run(scenario())
+    assert (after_error["pending"], after_error["written"]) == (2, 0)
+    assert (stats["pending"], stats["written"], stats["dropped"]) == (0, 2, 0)
+    assert scores == [0.1, 0.3]
+
+
+def test_failed_flush_beyond_max_pending_is_counted(tmp_path):
+    async def scenario():
+        store = ScoreStore(str(tmp_path / "scores.sqlite3"), batch_size=2, max_pending=3)
+        await store.open()
+        failing_once(store)
+        for i in range(5):
+            store.put((f"hash {i}", "v1", 0.5), formatted(0.1))
+        await store.flush()
+        stats = store.stats()
+        await store.close()
+        return stats
+
+    stats = run(scenario())
+    assert (stats["pending"], stats["dropped"]) == (3, 2)
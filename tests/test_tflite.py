@@ -0,0 +1,69 @@
+# tests/test_tflite.py
+import numpy as np
+import pytest
+
+from predictor import viral_predictor
+from predictor.fast_tokenizer import sample_corpus
+
+from conftest import TOKENIZER_PATH, build_lstm_model
+
+# Порог выкатки из predictor/quantize.py (--min-agreement)
+MIN_AGREEMENT = 0.99
+
+
+def lite_available():
+    try:
+        viral_predictor._lite_interpreter_class()
+    except ImportError:
+        return False
+    return True
+
+
+pytestmark = pytest.mark.skipif(not lite_available(), reason="интерпретатор TFLite недоступен")
+
+
+@pytest.fixture(scope="module")
+def validation():
+    tokenizer = viral_predictor.load_tokenizer(TOKENIZER_PATH)
+    return viral_predictor.encode_texts(tokenizer, sample_corpus(tokenizer, size=300))
+
+
+def build_gap_model():
+    import keras
+
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input(shape=(200,), dtype="int32")
+    x = keras.layers.Embedding(10000, 16)(inputs)
+    x = keras.layers.GlobalAveragePooling1D()(x)
+    outputs = keras.layers.Dense(1, activation="sigmoid")(keras.layers.Dense(8, activation="relu")(x))
+    return keras.Model(inputs, outputs)
+
+
+def converted(model, mode, tmp_path):
+    # Конвертеру нужен tensorflow, даже если интерпретатор - ai_edge_litert
+    pytest.importorskip("tensorflow")
+    from predictor.quantize import export_tflite
+
+    content, batch = export_tflite(model, mode)
+    path = tmp_path / f"model-{mode}.tflite"
+    path.write_bytes(content)
+    backend = viral_predictor.backend_for_path(str(path)).load(str(path))
+    assert isinstance(backend, viral_predictor.TFLiteBackend)
+    assert backend.fixed_batch == batch
+    return backend
+
+
+@pytest.mark.parametrize("build, mode", [(build_lstm_model, "dynamic"), (build_gap_model, "float16")])
+def test_tflite_agrees_with_keras(build, mode, validation, tmp_path):
+    from predictor.quantize import agreement
+
+    model = build()
+    lite = converted(model, mode, tmp_path)
+    expected = viral_predictor.KerasBackend(model)(validation)
+    # Нечетный размер: последний блок при фиксированном пакете дополняется нулями
+    actual = lite(validation[:299])
+
+    assert actual.shape == (299, 1)
+    report = agreement(expected[:299, 0], actual[:, 0])
+    assert report["label_agreement"] >= MIN_AGREEMENT
+    assert report["max_abs_diff"] < 0.05
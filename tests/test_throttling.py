@@ -0,0 +1,120 @@
+# tests/test_throttling.py
+import asyncio
+
+import pytest
+
+from bot.middlewares import throttling
+from bot.middlewares.throttling import MemoryBucketStore, RateLimit, SQLiteBucketStore
+
+LIMIT = RateLimit(rate=0.5, burst=2)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(throttling.time, "monotonic", clock)
+    monkeypatch.setattr(throttling.time, "time", clock)
+    return clock
+
+
+async def take(store, times, user_id=1, name="default", limit=LIMIT):
+    return [await store.acquire(user_id, name, limit) for _ in range(times)]
+
+
+def check_bucket(store, clock):
+    async def scenario():
+        burst = await take(store, 3)
+        clock.now += 1.0
+        early = await take(store, 1)
+        clock.now += 1.0
+        refilled = await take(store, 2)
+        return burst, early, refilled
+
+    burst, early, refilled = run(scenario())
+    assert [d.allowed for d in burst] == [True, True, False]
+    assert burst[2].warn and burst[2].retry_after == pytest.approx(2.0)
+    # Повторный отказ подряд без предупреждения
+    assert not early[0].allowed and not early[0].warn
+    assert early[0].retry_after == pytest.approx(1.0)
+    assert [d.allowed for d in refilled] == [True, False]
+    assert refilled[1].warn
+
+
+def test_memory_bucket(clock):
+    check_bucket(MemoryBucketStore(), clock)
+
+
+def test_sqlite_bucket(clock, tmp_path):
+    store = SQLiteBucketStore(str(tmp_path / "throttle.sqlite3"))
+    try:
+        check_bucket(store, clock)
+    finally:
+        run(store.close())
+
+
+def test_limits_are_separate_per_user_and_class(clock):
+    async def scenario():
+        store = MemoryBucketStore()
+        await take(store, 2)
+        return (
+            (await store.acquire(1, "default", LIMIT)).allowed,
+            (await store.acquire(2, "default", LIMIT)).allowed,
+            (await store.acquire(1, "inference", LIMIT)).allowed,
+        )
+
+    assert run(scenario()) == (False, True, True)
+
+
+def test_memory_store_forgets_idle_and_excess_buckets(clock):
+    async def scenario():
+        store = MemoryBucketStore(max_keys=2)
+        for user_id in range(3):
+            await store.acquire(user_id, "default", LIMIT)
+        capped = len(store)
+        clock.now += LIMIT.refill_time
+        await store.acquire(10, "default", LIMIT)
+        return capped, len(store)
+
+    assert run(scenario()) == (2, 1)
+
+
+def test_sqlite_buckets_are_shared_between_stores(clock, tmp_path):
+    path = str(tmp_path / "throttle.sqlite3")
+
+    async def scenario():
+        first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+        try:
+            await take(first, 2)
+            return (await second.acquire(1, "default", LIMIT)).allowed
+        finally:
+            await first.close()
+            await second.close()
+
+    assert run(scenario()) is False
+
+
+def test_sqlite_close_releases_connection_and_thread(tmp_path):
+    async def scenario():
+        store = SQLiteBucketStore(str(tmp_path / "throttle.sqlite3"))
+        await store.acquire(1, "default", LIMIT)
+        await store.close()
+        # Повторный close (хук shutdown и выход из процесса) безопасен
+        await store.close()
+        return store
+
+    store = run(scenario())
+    assert store._conn is None
+    with pytest.raises(RuntimeError):
+        store._executor.submit(lambda: None)
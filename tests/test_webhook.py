@@ -0,0 +1,50 @@
+# tests/test_webhook.py
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import WebhookServer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.updates = []
+
+    async def feed_raw_update(self, bot, update):
+        self.updates.append(update)
+
+
+async def post_all(server, bodies, headers=None):
+    server._slots = asyncio.Semaphore(server.max_concurrent)
+    app = web.Application()
+    app.router.add_post(server.path, server._handle)
+    async with TestClient(TestServer(app)) as client:
+        statuses = []
+        for body in bodies:
+            response = await client.post(server.path, data=body, headers=headers or {})
+            statuses.append(response.status)
+        await asyncio.gather(*server._tasks)
+        return statuses
+
+
+def test_malformed_body_is_rejected_with_400():
+    dp = FakeDispatcher()
+    server = WebhookServer(dp, bot=None)
+    bodies = [b"{not json", b"\xff\xfe", b"[1, 2]", b'"text"', b'{"update_id": 1}']
+
+    statuses = run(post_all(server, bodies))
+
+    assert statuses == [400, 400, 400, 400, 200]
+    assert dp.updates == [{"update_id": 1}]
+    assert (server.received, server.rejected) == (1, 4)
+
+
+def test_secret_token_is_checked_before_body():
+    server = WebhookServer(FakeDispatcher(), bot=None, secret_token="secret")
+    statuses = run(post_all(server, [b"{not json"]))
+    assert statuses == [401]